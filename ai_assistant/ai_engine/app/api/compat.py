@@ -1,10 +1,11 @@
 from __future__ import annotations
-import asyncio
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
-import ai_engine.settings as s
-from ai_engine.app.core.memory import ChatMemory
-from ai_engine.main import _invoke_graph
+from ai_engine.app.core.scheduler import get_turn_scheduler
+from ai_engine.app.domain.models import TurnResult
+
+# ai_engine.main (grafo, LLMs, catálogo) é importado sob demanda: o router de
+# turns e os health checks sobem sem pagar o import do engine.
 
 
 def _normalize_solution_designs(raw_designs: Any) -> List[Dict[str, Any]]:
@@ -80,16 +81,30 @@ def _to_legacy_final_state(lean: Dict[str, Any], final_msg: str) -> Dict[str, An
     return legacy
 
 
-def invoke_and_fetch_legacy_state(user_query: str, session_id: str) -> Dict[str, Any]:
-    final_msg: str = _invoke_graph(user_query, session_id=session_id)
-    mem = ChatMemory(redis_url=s.REDIS_URL, session_id=session_id)
-    lean = mem.get_state() or {}
+def legacy_final_state(result: TurnResult) -> Dict[str, Any]:
+    return _to_legacy_final_state(result.state, result.final_message)
+
+
+def invoke_and_fetch_legacy_state(
+    user_query: str, session_id: str, design_engine: Optional[str] = None
+) -> Dict[str, Any]:
+    from ai_engine.main import run_turn
+
+    return legacy_final_state(
+        run_turn(user_query, session_id=session_id, design_engine=design_engine)
+    )
 
-    return _to_legacy_final_state(lean, final_msg)
 
+async def ai_invoke(
+    user_query: str, session_id: str, design_engine: Optional[str] = None
+) -> TurnResult:
+    """
+    Turno async, admitido pelo scheduler (limite global, fila com 429, FIFO por
+    sessão). O lean state volta no próprio resultado (o save segue em background).
+    """
+    from ai_engine.main import arun_turn
 
-async def ai_invoke(user_query: str, session_id: str) -> Dict[str, Any]:
-    loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(
-        None, invoke_and_fetch_legacy_state, user_query, session_id
+    return await get_turn_scheduler().run(
+        session_id,
+        lambda: arun_turn(user_query, session_id=session_id, design_engine=design_engine),
     )
@@ -9,9 +9,9 @@ if TYPE_CHECKING:
 
 def get_graph_client() -> "GraphPort":
     from ai_engine.app.adapters.graph_client import LangGraphClient
-    from ai_engine.app.core.graph import app as graph_app
+    from ai_engine.app.core.graph import get_app
 
-    return LangGraphClient(graph_app)
+    return LangGraphClient(get_app())
 
 
 async def get_session_id(
@@ -1,4 +1,7 @@
-from fastapi import APIRouter
+import os
+import sys
+
+from fastapi import APIRouter, Response
 from ai_engine.app.core.config import settings
 
 
@@ -11,6 +14,12 @@ async def healthz() -> dict:
 
 
 @router.get("/readyz", summary="Readiness probe")
-async def readyz() -> dict:
+async def readyz(response: Response) -> dict:
+    # Pronto só depois do warm-up (grafo, LLMs, catálogo e índices carregados).
+    # ai_engine.main só é consultado se já foi importado: o probe não dispara o import.
     # If you need to check adapters (DB, external graph, etc.), do it here
-    return {"status": "ready"}
+    engine = sys.modules.get("ai_engine.main")
+    if settings.warm_up_on_startup and not (engine and engine.is_warmed_up()):
+        response.status_code = 503
+        return {"status": "warming_up", "pid": os.getpid()}
+    return {"status": "ready", "pid": os.getpid()}
@@ -0,0 +1,13 @@
+from fastapi import APIRouter, Response
+from ai_engine.app.core import telemetry
+
+
+router = APIRouter(prefix="", tags=["metrics"])
+
+
+@router.get("/metrics", summary="Prometheus metrics", include_in_schema=False)
+async def metrics() -> Response:
+    payload = telemetry.prometheus_payload()
+    if payload is None:
+        return Response("prometheus_client is not installed\n", status_code=503, media_type="text/plain")
+    return Response(payload, media_type=telemetry.CONTENT_TYPE_LATEST)
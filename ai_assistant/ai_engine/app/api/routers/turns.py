@@ -1,11 +1,13 @@
 from __future__ import annotations
-from fastapi import APIRouter, Depends, Header
+from fastapi import APIRouter, Depends, Header, Response
 from typing import Any, Dict, List, Optional
 from ai_engine.app.domain.models import TurnIn, TurnOut
 from ai_engine.app.domain.services import QuoteService
 from ai_engine.app.adapters.graph_client import GraphPort
 from ai_engine.app.api.deps import get_session_id
-from ai_engine.app.api.compat import ai_invoke
+from ai_engine.app.api.compat import ai_invoke, legacy_final_state
+from ai_engine.app.core.scheduler import get_turn_scheduler
+from ai_engine.app.core.singleflight import get_turn_flights
 
 import re
 
@@ -21,11 +23,42 @@ _service = QuoteService()
 )
 async def create_turn(
     body: TurnIn,
+    response: Response,
     session_id: str = Depends(get_session_id),
+    idempotency_key: Optional[str] = Header(default=None),
 ) -> TurnOut:
-    # Call the graph
-    final_state: Dict[str, Any] = await ai_invoke(body.message, session_id=session_id)
-
+    async def _run() -> Dict[str, Any]:
+        # Call the graph: o resultado já traz o lean state e o evento "timings";
+        # a persistência roda em background enquanto a resposta é montada.
+        result = await ai_invoke(
+            body.message, session_id=session_id, design_engine=body.design_engine
+        )
+        out = _turn_out_from_state(legacy_final_state(result))
+        if result.timings:
+            out.events.append(result.timings)
+        return out.model_dump()
+
+    # Reenvios do mesmo turno (mesma Idempotency-Key: ids das mensagens do
+    # cliente) compartilham uma execução do grafo e, por alguns segundos, a
+    # resposta pronta. Sem a chave o turno sempre roda: o mesmo texto enviado
+    # duas vezes é uma mensagem nova, não um retry.
+    if idempotency_key:
+        data, source = await get_turn_flights().run(f"{session_id}:{idempotency_key}", _run)
+    else:
+        data, source = await _run(), "executed"
+    response.headers["X-Turn-Source"] = source
+    if source == "replayed":
+        response.headers["Idempotent-Replayed"] = "true"
+    return TurnOut(**data)
+
+
+@router.post("/cancel", summary="Abort the in-flight turn of a session")
+async def cancel_turn(session_id: str = Depends(get_session_id)) -> Dict[str, Any]:
+    # a API chama isso quando o usuário mandou uma mensagem nova no meio do turno
+    return {"cancelled": await get_turn_scheduler().cancel_everywhere(session_id)}
+
+
+def _turn_out_from_state(final_state: Dict[str, Any]) -> TurnOut:
     # Missing info path
     if _service.looks_like_missing(final_state):
         assistant_text = _service.build_missing_message(final_state)
@@ -33,6 +33,24 @@ class Settings(BaseSettings):
     embedding_model: str = Field("text-embedding-3-small", env="EMBEDDING_MODEL")
     llm_model: str = Field("gpt-4o-mini", env="LLM_MODEL")
 
+    # "llm" (default) or "deterministic" (ranking helpers, LLM only as fallback)
+    design_engine: str = Field("llm", env="DESIGN_ENGINE")
+    designer_llm_timeout_s: Optional[float] = Field(None, gt=0, env="DESIGNER_LLM_TIMEOUT_S")
+
+    # Constrói grafo/LLMs/catálogo/índices no startup do servidor (senão, no primeiro turno)
+    warm_up_on_startup: bool = Field(True, env="WARM_UP_ON_STARTUP")
+
+    # Scheduler de turnos: concorrência, fila (429 acima dela) e threads dos nós síncronos do grafo
+    turn_max_concurrency: int = Field(8, ge=1, env="TURN_MAX_CONCURRENCY")
+    turn_queue_size: int = Field(64, ge=0, env="TURN_QUEUE_SIZE")
+    turn_cancel_superseded: bool = Field(True, env="TURN_CANCEL_SUPERSEDED")
+    turn_graph_threads: int = Field(16, ge=1, env="TURN_GRAPH_THREADS")
+    # "local" (um processo) ou "redis" (lease/ticket/cancel por sessão entre workers do prefork)
+    turn_coordination: str = Field("local", env="TURN_COORDINATION")
+    turn_lease_ttl_s: float = Field(120.0, gt=0, env="TURN_LEASE_TTL_S")
+    # Turnos idênticos: resultado reaproveitado por N segundos via Idempotency-Key (0 = só em voo)
+    turn_idempotency_ttl_s: float = Field(30.0, ge=0, env="TURN_IDEMPOTENCY_TTL_S")
+
     raw_data_path: Path = Field(default_factory=lambda: _data_dir() / "_raw", env="RAW_DATA_PATH")
     vector_store_path: Path = Field(
         default_factory=lambda: _data_dir() / "processed" / "vector_store",
@@ -1,6 +1,7 @@
 from fastapi import Request
 from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
+from typing import Dict, Optional
 import logging
 
 
@@ -9,11 +10,13 @@ logger = logging.getLogger(__name__)
 
 class AppError(Exception):
     """Base application error."""
-    def __init__(self, message: str, *, code: str = "app_error", status_code: int = 400) -> None:
+    def __init__(self, message: str, *, code: str = "app_error", status_code: int = 400,
+                 headers: Optional[Dict[str, str]] = None) -> None:
         super().__init__(message)
         self.message = message
         self.code = code
         self.status_code = status_code
+        self.headers = headers
 
 
 class ExceptionMiddleware(BaseHTTPMiddleware):
@@ -25,6 +28,7 @@ class ExceptionMiddleware(BaseHTTPMiddleware):
             return JSONResponse(
                 status_code=ae.status_code,
                 content={"error": ae.code, "message": ae.message},
+                headers=ae.headers,
             )
         except Exception as ex: # pragma: no cover
             logger.exception("Unhandled error")
@@ -3,12 +3,17 @@ import re
 import string
 import json
 import math
-from typing import List, Dict, Optional, Tuple, Any
+import copy
+import time
+import asyncio
+import logging
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple, Any
 
-from langchain.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
+from langchain_core.prompts import ChatPromptTemplate
 from langgraph.graph import END, StateGraph
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda
 #from langgraph.utils.runnable import Send
 
 import hashlib
@@ -17,9 +22,11 @@ import hashlib
 from ai_engine.app.schemas.models import (
     AgentState,
     AgentRoutingDecision,
+    SolutionComponent,
     SolutionDesign,
     ThreeScenarios,
     NBAOutput,
+    RevisionRequest,
 )
 
 # Tools / helpers
@@ -45,9 +52,11 @@ from ai_engine.app.core.tools import (
 #)
 
 from ai_engine.app.ea_recommender import run as ea_recommender_node
+from ai_engine.app.core.config import settings
+from ai_engine.app.core import telemetry
 
 
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, asdict
 
 
 # Ground-truth dicts
@@ -58,15 +67,22 @@ from dataclasses import dataclass, field
 
 # Ground-truth dicts agora vêm do tools (price list preparado)
 from ai_engine.app.core.tools import (
-    PRODUCT_DICT as product_dict,
+    PRODUCT_DICT as product_dict,   # Mapping lazy: o catálogo só carrega no primeiro acesso
+    load_catalog,
 #    CLIENTS_DICT as clients_dict,
 )
+from ai_engine.app.utils.retriever import load_indices
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
 
 # -------------------- LLMs --------------------
 #llm          = ChatOpenAI(model="gpt-4o-mini", temperature=0)
 #llm_creative = ChatOpenAI(model="gpt-4o-mini", temperature=0.4)
 #llm_nba      = ChatOpenAI(model="gpt-4o-mini", temperature=0.5)
 
+logger = logging.getLogger(__name__)
+
 # -------------------- CONFIG --------------------
 CATALOG_VERSION = "v2025-08-11"
 PRICING_RULES_VERSION = "v1"
@@ -74,10 +90,30 @@ PRICING_RULES_VERSION = "v1"
 # -------------------- LLMs --------------------
 LLM_KW = dict(temperature=0.2, top_p=1, model_kwargs={"seed": 42})
 
-llm          = ChatOpenAI(model="gpt-4o-mini", **LLM_KW)
-llm_creative = ChatOpenAI(model="gpt-4o-mini", **LLM_KW)   # <- sem response_format
-llm_nba      = ChatOpenAI(model="gpt-4o-mini", **LLM_KW)   # <- sem response_format
-your_llm_instance = ChatOpenAI(model="gpt-4o-mini", **LLM_KW)
+LLM_KW = dict(LLM_KW, callbacks=telemetry.LLM_CALLBACKS)  # spans/tokens por nó
+
+# Clientes construídos no primeiro uso (ou no warm_up), não no import do módulo.
+# Os nomes antigos (llm, llm_creative, llm_nba, your_llm_instance) continuam
+# acessíveis como atributos do módulo via __getattr__ (fim do arquivo).
+LLM_NAMES = ("llm", "llm_creative", "llm_nba", "your_llm_instance")
+
+@lru_cache(maxsize=None)
+def get_llm(name: str = "llm") -> "ChatOpenAI":
+    if name not in LLM_NAMES:
+        raise KeyError(f"Unknown LLM '{name}'. Expected one of {LLM_NAMES}")
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(model="gpt-4o-mini", **LLM_KW)   # <- sem response_format
+
+@lru_cache(maxsize=None)
+def get_structured_llm(name: str, schema: type, method: Optional[str] = "function_calling", logprobs: bool = False):
+    """`with_structured_output` cacheado por (cliente, schema): evita reconstruir o tool schema a cada turno."""
+    base = get_llm(name)
+    if logprobs:
+        base = base.bind(logprobs=True, top_logprobs=5)
+    if method is None:
+        return base.with_structured_output(schema)
+    return base.with_structured_output(schema, method=method)
 
 # -------------------- Client resolver helpers --------------------
 _CLIENT_ID_RE = re.compile(r"(?i)\b(client(?:e)?(?:\s*id)?|customer(?:\s*id)?)\s*[:=]\s*([A-Za-z0-9\-_]+)")
@@ -141,9 +177,6 @@ Analyse the user query and decide which specialised agents are needed:
 ALWAYS output a JSON object that matches the schema.
 User query: {query}"""
 )
-orchestrator_agent = orchestrator_prompt | llm.with_structured_output(
-    AgentRoutingDecision, method="function_calling"
-)
 
 SCHEMA_BLOCK = """{
   "scenarios": [
@@ -205,9 +238,6 @@ Output JSON strictly matching this schema:
 ).partial(schema_block=SCHEMA_BLOCK)
 
 
-three_designs_agent = three_scenarios_prompt | llm_creative.with_structured_output(
-    ThreeScenarios, method="function_calling"
-)
 
 design_prompt = ChatPromptTemplate.from_template(
     """You are a Cisco Solution Architect. Design a complete solution that satisfies the user requirements
@@ -247,11 +277,7 @@ JUSTIFICATION REQUIREMENT:
 Return JSON matching the schema exactly."""
 )
 
-design_agent = design_prompt | llm_creative.with_structured_output(
-    SolutionDesign, method="function_calling"
-)
 
-from langchain.prompts import ChatPromptTemplate
 
 
 
@@ -465,6 +491,40 @@ def _pricing_key_for_designs(client: Dict, designs: List[SolutionDesign]) -> str
     }, sort_keys=True)
     return hashlib.sha256(payload.encode()).hexdigest()
 
+def _price_book_version(client: Optional[Dict]) -> str:
+    """
+    Versão do price-book do cliente: usa 'price_book_version' se o contexto trouxer,
+    senão um hash dos acordos/preferências que _compute_client_adjusted_price consome.
+    """
+    client = client or {}
+    if client.get("price_book_version"):
+        return str(client["price_book_version"])
+    payload = json.dumps({
+        "price_agreements": client.get("price_agreements") or [],
+        "preferences": client.get("preferences") or {},
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+def _scenario_fingerprint(comps: List[dict], users_count: Any, price_book: str) -> str:
+    """
+    Fingerprint de um cenário para re-precificação incremental:
+    (sku, qty, fixed) ordenados + users_count (dimensiona qty) + price-book + versões.
+    Calculado sobre as quantidades já gravadas de volta pelo pricing, então um cenário
+    intacto na rodada seguinte gera o mesmo fingerprint.
+    """
+    items = sorted(
+        (str(c["part_number"]).upper(), int(c["quantity"]), bool(c.get("fixed_quantity")))
+        for c in comps
+    )
+    payload = json.dumps({
+        "items": items,
+        "users_count": str(users_count or ""),
+        "price_book": price_book,
+        "catalog_version": CATALOG_VERSION,
+        "pricing_rules_version": PRICING_RULES_VERSION,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
 def _pricing_key_for_direct_lookup(client: Dict, qty_map: Dict[str, int]) -> str:
     """
     Chave estável para orçamento direto (sem designs).
@@ -568,15 +628,25 @@ def _users_from_req(canon_req: str, default_users: int = 50) -> int:
     except Exception:
         return default_users
 
+def _sku_of(p: dict) -> str:
+    # schema antigo: cisco_product_id; catálogo atual (product_context): sku
+    return p.get("cisco_product_id") or p.get("sku") or ""
+
+def _catalog_kind(p: dict) -> str:
+    # catálogo atual: family ("Switches"/"Wireless") + product_type ("Meraki -Switch", "Access Point", ...)
+    return f"{p.get('family') or ''} {p.get('product_type') or ''}".lower()
+
 def _is_ap(p: dict) -> bool:
     name = (p.get("commercial_name") or "").lower()
     cat  = ((p.get("technical_profile") or {}).get("category") or "").lower()
-    return ("access point" in name) or ("access point" in cat) or ("wireless" in cat) or ("mr" in (p.get("cisco_product_id") or "").lower())
+    kind = _catalog_kind(p)
+    return ("access point" in name) or ("access point" in cat) or ("wireless" in cat) \
+           or ("access point" in kind) or ("wireless" in kind) or ("mr" in _sku_of(p).lower())
 
 def _is_switch(p: dict) -> bool:
     name = (p.get("commercial_name") or "").lower()
     cat  = ((p.get("technical_profile") or {}).get("category") or "").lower()
-    return ("switch" in name) or ("switch" in cat) or ("ms" in (p.get("cisco_product_id") or "").lower())
+    return ("switch" in name) or ("switch" in cat) or ("switch" in _catalog_kind(p)) or ("ms" in _sku_of(p).lower())
 
 def _is_firewall(p: dict) -> bool:
     name = (p.get("commercial_name") or "").lower()
@@ -587,8 +657,11 @@ def _is_firewall(p: dict) -> bool:
 def _is_wifi6(p: dict) -> bool:
     name = (p.get("commercial_name") or "").lower()
     attrs = ((p.get("technical_profile") or {}).get("hardware_attributes") or {}) or {}
-    return ("wi-fi 6" in name) or ("wifi 6" in name) or ("802.11ax" in name) \
-           or ("802.11ax" in json.dumps(attrs).lower()) or ("ax" in name)
+    radio = (p.get("radio_specification") or "").lower()
+    return ("wi-fi 6" in name) or ("wifi 6" in name) or ("802.11ax" in name) or ("w6e" in name) \
+           or ("802.11ax" in json.dumps(attrs).lower()) or ("ax" in name) or ("6 ghz" in radio)
+
+_WATTS_RE = re.compile(r"(\d{2,4})\s?w\b", re.I)
 
 def _poe_budget_hint(p: dict) -> float:
     # pega um indício simples de orçamento PoE se existir
@@ -604,8 +677,17 @@ def _poe_budget_hint(p: dict) -> float:
             return vv
         except Exception:
             pass
+    # catálogo atual: o orçamento vem no nome do modelo ("... 370W PoE Switch");
+    # poe_type é por série (vale também para os modelos data-only), então só entra se o modelo for PoE
+    name = p.get("commercial_name") or ""
+    m = _WATTS_RE.search(name)
+    if m:
+        return float(m.group(1))
+    m = _WATTS_RE.search(p.get("poe_type") or "")
+    if m and _is_poe_switch(p):
+        return float(m.group(1))
     # heurística: se nome tem "FP"/"LP"/"PoE", dá um plus
-    name = (p.get("commercial_name") or "").upper()
+    name = name.upper()
     return 1.0 if ("POE" in name or " FP" in name or " LP" in name) else 0.0
 
 def _brand_family(name_or_sku: str) -> str:
@@ -618,7 +700,7 @@ def _brand_family(name_or_sku: str) -> str:
 
 def _brand_fit_score(p: dict, client: dict) -> float:
     prefs = ((client.get("quoting_rules") or {}).get("brand_preference_order") or []) or []
-    fam = _brand_family((p.get("commercial_name") or "") + " " + (p.get("cisco_product_id") or ""))
+    fam = _brand_family((p.get("commercial_name") or "") + " " + _sku_of(p))
     if not prefs or not fam:
         return 0.0
     # preferência: primeira posição vale mais
@@ -656,34 +738,42 @@ def _is_poe_switch(p: dict) -> bool:
     if any(k in attrs for k in ["poe", "poe_power_budget", "poe_budget_w", "poe_budget"]):
         return True
     n = (p.get("commercial_name") or "").upper()
-    return "POE" in n or " FP" in n or " LP" in n
+    if "DATA ONLY" in n:
+        return False
+    return "POE" in n or " FP" in n or " LP" in n or bool(_WATTS_RE.search(n))
 
 def _installed_base_fit_score(p: dict, client: dict) -> float:
     fams = set()
     for it in (client.get("installed_base") or []):
         sku = (it.get("cisco_product_id") or "")
         fams.add(_brand_family(sku))
-    fam = _brand_family((p.get("commercial_name") or "") + " " + (p.get("cisco_product_id") or ""))
+    fam = _brand_family((p.get("commercial_name") or "") + " " + _sku_of(p))
     return 1.0 if fam and fam in fams else 0.0
 
 def _eol_penalty(p: dict) -> float:
-    lc = (p.get("lifecycle") or {}) or (product_dict.get(p.get("cisco_product_id") or "", {}).get("lifecycle") or {})
+    lc = (p.get("lifecycle") or {}) or (product_dict.get(_sku_of(p), {}).get("lifecycle") or {})
     status = (lc.get("status") or "").lower()
     if not status:
         return 0.0
     return 2.0 if any(t in status for t in ["eol","end of life","eos","end of support"]) else 0.0
 
 def _price_of(p: dict) -> float:
-    return float(((p.get("pricing_model") or {}).get("base_price") or 0.0) or 0.0)
+    price = (p.get("pricing_model") or {}).get("base_price") or p.get("list_price_usd")
+    if price is None:
+        price = ((product_dict.get(_sku_of(p)) or {}).get("pricing_model") or {}).get("base_price")
+    try:
+        return float(price or 0.0)
+    except (TypeError, ValueError):
+        return 0.0
 
 def _clean_context_for_roles(context: list[dict], need_wifi: bool, need_poe: bool, need_fw: bool) -> list[dict]:
     cleaned = []
     for p in context:
         if not isinstance(p, dict): 
             continue
-        sku = p.get("cisco_product_id") or ""
+        sku = _sku_of(p)
         name= p.get("commercial_name") or sku
-        if _is_accessory_or_license(name, sku):
+        if _is_accessory_or_license(name, sku) or "license" in _catalog_kind(p):
             continue
         # mantém só o que tem chance de ser usado
         if _is_ap(p) or _is_switch(p) or _is_firewall(p):
@@ -743,7 +833,7 @@ def _rank_candidates(buckets: dict[str, list[dict]], canon_req: str, client: dic
         scored = []
         for p in items:
             s = _score_candidate(p, role, canon_req, client)
-            sku = (p.get("cisco_product_id") or "").upper()
+            sku = _sku_of(p).upper()
             price = _price_of(p)
             scored.append((s, price, sku, p))
         by_score = [t[3] for t in sorted(scored, key=lambda t: (-t[0], t[1], t[2]))]
@@ -766,19 +856,32 @@ def _pick_by_policy(ranked_role: dict[str, list[dict]], policy: str) -> dict|Non
         return bs[len(bs)//2]
     if policy == "perf":
         return bs[0] if bs else (bp[-1] if bp else None)
+    if policy == "premium":
+        # melhor score entre os candidatos acima da mediana de preço (o "balanced"), garantindo progressão de tier
+        upper = {id(p) for p in (bp[len(bp)//2 + 1:] or bp[-1:])}
+        return next((p for p in bs if id(p) in upper), bp[-1] if bp else None)
     return bs[0] if bs else (bp[0] if bp else None)
 def _ap_quantity(users: int, per_ap: int = 10) -> int:
     return max(1, math.ceil(users / max(1, per_ap)))
 
+def _switch_quantity(p: dict, users: int) -> int:
+    # mesma regra do pricing: um switch a cada `ports` usuários
+    try:
+        ports = int(float(p.get("ports") or 0))
+    except (TypeError, ValueError):
+        ports = 0
+    return max(1, math.ceil(users / ports)) if ports > 0 else 1
+
 def _compose_designs_from_rank(ranked: dict[str, list[tuple[float,dict]]], canon_req: str, users: int) -> list[SolutionDesign]:
     """Gera 3 designs determinísticos (barato/mediano/perf) usando o ranking por papel."""
+    # mesmos rótulos do LLM designer: pricing (_pick_baseline_bucket), revisões e API dependem deles
     scenarios = [
-        ("Option Cost-Effective", {"access_point": "balanced", "access_switch": "balanced", "security_gw": "balanced"}, "Minimize CAPEX with essential components."),
-        ("Option Balanced",       {"access_point": "balanced", "access_switch": "balanced", "security_gw": "balanced"}, "Balance cost and performance with moderate headroom."),
-        ("Option High-Performance",{"access_point": "perf",     "access_switch": "perf",     "security_gw": "perf"},     "Maximize performance and reliability with headroom."),
+        ("Essential (Good)",  {"access_point": "balanced", "access_switch": "balanced", "security_gw": "balanced"}, "Minimize CAPEX with essential components."),
+        ("Standard (Better)", {"access_point": "balanced", "access_switch": "balanced", "security_gw": "balanced"}, "Balance cost and performance with moderate headroom."),
+        ("Complete (Best)",   {"access_point": "premium",  "access_switch": "premium",  "security_gw": "premium"},  "Maximize performance and reliability with headroom."),
     ]
     # Política do barato: se quiser realmente “mais barato”, poderia usar policy="cheap" para switch e APs
-    scenarios[0] = ("Option Cost-Effective", {"access_point": "cheap", "access_switch": "cheap", "security_gw": "cheap"}, "Minimize CAPEX with essential components.")
+    scenarios[0] = ("Essential (Good)", {"access_point": "cheap", "access_switch": "cheap", "security_gw": "cheap"}, "Minimize CAPEX with essential components.")
 
     designs: list[SolutionDesign] = []
     for title, role_policy, tag in scenarios:
@@ -786,16 +889,15 @@ def _compose_designs_from_rank(ranked: dict[str, list[tuple[float,dict]]], canon
         if "access_point" in ranked and ranked["access_point"]:
             p_ap = _pick_by_policy(ranked["access_point"], role_policy["access_point"])
             if p_ap:
-                comps.append({"part_number": p_ap.get("cisco_product_id"), "quantity": _ap_quantity(users), "role": "Access Point"})
+                comps.append({"part_number": _sku_of(p_ap), "quantity": _ap_quantity(users), "role": "Access Point"})
         if "access_switch" in ranked and ranked["access_switch"]:
             p_sw = _pick_by_policy(ranked["access_switch"], role_policy["access_switch"])
             if p_sw:
-                # qty 1 por padrão para branch pequeno
-                comps.append({"part_number": p_sw.get("cisco_product_id"), "quantity": 1, "role": "PoE Switch"})
+                comps.append({"part_number": _sku_of(p_sw), "quantity": _switch_quantity(p_sw, users), "role": "PoE Switch"})
         if "security_gw" in ranked and ranked["security_gw"]:
             p_fw = _pick_by_policy(ranked["security_gw"], role_policy["security_gw"])
             if p_fw and "firewall" in canon_req:
-                comps.append({"part_number": p_fw.get("cisco_product_id"), "quantity": 1, "role": "Firewall"})
+                comps.append({"part_number": _sku_of(p_fw), "quantity": 1, "role": "Firewall"})
 
         # ordena componentes por SKU para estabilidade
         comps = sorted(comps, key=lambda c: (str(c["part_number"]).upper(), int(c["quantity"] or 1)))
@@ -807,6 +909,56 @@ def _compose_designs_from_rank(ranked: dict[str, list[tuple[float,dict]]], canon
         ))
     return designs
 
+
+# -------------------- Deterministic designer --------------------
+DESIGN_ENGINES = ("llm", "deterministic")
+
+def _design_engine_for(state: AgentState) -> str:
+    """Engine do designer: por request (state.design_engine) ou config (DESIGN_ENGINE)."""
+    mode = (state.get("design_engine") or settings.design_engine or "llm").strip().lower()
+    return mode if mode in DESIGN_ENGINES else "llm"
+
+def deterministic_designs(state: AgentState) -> Optional[List[SolutionDesign]]:
+    """
+    Good/Better/Best sem LLM, ranqueando o product_context por papel.
+    Retorna None quando algum papel pedido não tem candidato (o chamador usa o LLM).
+    """
+    context = state.get("product_context") or []
+    req = " ".join(x for x in (state.get("user_query"), state.get("product_domain")) if x)
+    canon_req = _canonicalize_requirement(req)
+
+    roles = _infer_roles_from_req(canon_req)
+    if not roles:
+        logger.info("[Deterministic] No roles inferred from the request")
+        return None
+
+    cleaned = _clean_context_for_roles(
+        context,
+        need_wifi="wifi6" in canon_req,
+        need_poe="poe" in canon_req,
+        need_fw="firewall" in canon_req,
+    )
+    buckets = _candidate_buckets(cleaned)
+    # outdoor/industrial só entram se pedidos (ou se forem os únicos candidatos)
+    for role, is_special, token in (("access_point", _is_outdoor_ap, "outdoor"), ("access_switch", _is_industrial_switch, "industrial")):
+        if token not in canon_req:
+            regular = [p for p in buckets.get(role, []) if not is_special(p)]
+            buckets[role] = regular or buckets.get(role, [])
+    missing = [r for r in roles if not buckets.get(r)]
+    if missing:
+        logger.info(f"[Deterministic] Insufficient role coverage: {missing}")
+        return None
+
+    ranked = _rank_candidates({r: buckets[r] for r in roles}, canon_req, state.get("client_context") or {})
+    try:
+        users = int(state.get("users_count") or 0) or _users_from_req(canon_req)
+    except (TypeError, ValueError):
+        users = _users_from_req(canon_req)
+
+    designs = _compose_designs_from_rank(ranked, canon_req, users)
+    logger.debug(f"[Deterministic] Roles {roles} | users={users} | {len(designs)} scenarios")
+    return designs
+
 _QTY_PREFIX_RE = re.compile(r"^\s*(?P<n>\d+)\s*[xX]\s*(?P<rest>.+)$")
 
 def _extract_qty_prefix_min(text: str) -> tuple[int, str]:
@@ -1336,14 +1488,6 @@ def extract_sku_quantities(text: str) -> Tuple[Dict[str,int], bool]:
     return {}, False
 
 
-@dataclass
-class RevisionRequest:
-    target_scenario: str | None  # e.g. "Complete", "Best", "Standard"
-    action: str                  # "replace" | "add" | "remove" | "set_qty"
-    sku_from: str | None = None
-    sku_to: str | None = None
-    qty: int | None = None
-
 #def parse_revision_intent(q: str) -> RevisionRequest | None:
 #    ql = q.lower()
 #    target = "Complete" if "best" in ql or "complete" in ql else (
@@ -1358,6 +1502,17 @@ class RevisionRequest:
 
 import re
 
+_SET_QTY_RE = re.compile(
+    r"\b(?:set|change|update|make)\s+(?:the\s+)?(?:(?:qty|quantity|number)\s+(?:of\s+)?(?:the\s+)?)?"
+    r"(?P<what>[A-Za-z0-9\-]+)(?:\s+(?:qty|quantity|units|count))?\s+to\s+(?P<n>\d{1,5})\b",
+    re.I,
+)
+_REMOVE_RE = re.compile(r"\b(?:remove|delete|drop)\s+(?:the\s+|all\s+|any\s+)?(?P<what>[A-Za-z0-9\-]+)", re.I)
+_ADD_RE = re.compile(
+    r"\badd\s+(?:(?P<n>\d{1,5})\s*(?:x\s*|units?\s+of\s+|of\s+)?)?(?:the\s+|an?\s+)?(?P<what>[A-Za-z0-9\-]+)",
+    re.I,
+)
+
 def parse_revision_intent(q: str) -> RevisionRequest | None:
     ql = q.lower()
 
@@ -1373,11 +1528,24 @@ def parse_revision_intent(q: str) -> RevisionRequest | None:
     # Normalize text (remove punctuation that can break regex)
     clean_q = re.sub(r"[.,?!]", "", q)
 
+    # set_qty / remove / add vêm antes do replace ("change X to 12" não é troca de SKU)
+    m = _SET_QTY_RE.search(clean_q)
+    if m:
+        return RevisionRequest(target_scenario=target, action="set_qty",
+                               sku_from=m.group("what").upper(), qty=int(m.group("n")))
+    m = _REMOVE_RE.search(clean_q)
+    if m:
+        return RevisionRequest(target_scenario=target, action="remove", sku_from=m.group("what").upper())
+    m = _ADD_RE.search(clean_q)
+    if m:
+        return RevisionRequest(target_scenario=target, action="add", sku_to=m.group("what").upper(),
+                               qty=int(m.group("n")) if m.group("n") else None)
+
     # Try multiple patterns
     patterns = [
         # Pattern 1: "replace MR44 with MR57" OR "swap MR44 for MR57"
-        r"(?:replace|swap)\s+([A-Z0-9\-]+)\s+(?:with|for)\s+([A-Z0-9\-]+)",
-        r"(?:replace|swap|change)\s+([A-Z0-9\-]+)\s+(?:with|for|to)\s+([A-Z0-9\-]+)",
+        r"(?:replace|swap)\s+(?:the\s+)?([A-Z0-9\-]+)\s+(?:with|for)\s+(?:the\s+|an?\s+)?([A-Z0-9\-]+)",
+        r"(?:replace|swap|change)\s+(?:the\s+)?([A-Z0-9\-]+)\s+(?:with|for|to)\s+(?:the\s+|an?\s+)?([A-Z0-9\-]+)",
         # Pattern 2: "replace with MR57" OR "change to MR57"
         r"(?:replace|change|swap)\s+(?:with|to)?\s*([A-Z0-9\-]+)",
         r"(?:replace|swap)\s*(?:with\s*)?([A-Z0-9\-]+)(?:\s*(?:instead|for))?",
@@ -1415,15 +1583,150 @@ def parse_revision_intent(q: str) -> RevisionRequest | None:
     return None
 
 
-# The final, best-practice version of your orchestrator_node
+# -------------------- Local revision patch engine --------------------
+# Edições simples ("replace MR44 with MR57 in Best", "set switches to 12", "remove the license")
+# são aplicadas direto em solution_designs, sem LLM. Qualquer dúvida => None e o fluxo normal segue.
+_LOCAL_EDIT_RE = re.compile(r"^\s*(?:please\s+|pls\s+|now\s+|ok\s+)?(?:replace|swap|change|set|update|make|add|remove|delete|drop)\b", re.I)
 
-def orchestrator_node(state: AgentState) -> dict:
+_CATEGORY_SELECTORS = {
+    "SWITCH": "switch", "SWITCHES": "switch",
+    "AP": "ap", "APS": "ap", "WIFI": "ap", "WI-FI": "ap", "ACCESS": "ap", "ACCESS-POINT": "ap", "ACCESS-POINTS": "ap",
+    "LICENSE": "license", "LICENSES": "license", "LICENCE": "license", "LICENCES": "license",
+}
+
+def _catalog_record(sku: str) -> dict:
+    return product_dict.get(sku) or product_dict.get(resolve_sku(sku) or "") or {}
+
+def _component_matches(comp, selector: str) -> bool:
+    """selector = SKU (exato ou prefixo, ex. MR44 -> MR44-HW) ou categoria (switches/aps/license)."""
+    pn = (comp.part_number or "").upper()
+    sel = selector.upper()
+    category = _CATEGORY_SELECTORS.get(sel)
+    if not category:
+        return pn == sel or pn.startswith(sel + "-") or pn == (resolve_sku(sel) or "")
+    rec = _catalog_record(pn)
+    kind = _catalog_kind(rec)
+    is_license = "license" in kind or "license" in (rec.get("product_dimension") or "").lower() or pn.startswith("LIC-")
+    if category == "license":
+        return is_license
+    if is_license:
+        return False
+    return ("switch" in kind) if category == "switch" else ("wireless" in kind or "access point" in kind)
+
+def _target_designs(designs: list, target: Optional[str]) -> list:
+    if not target:
+        return list(designs)
+    t = target.lower()
+    return [d for d in designs if (d.summary or "").lower().startswith(t) or t in (d.summary or "").lower()]
+
+def apply_revision(designs: List[SolutionDesign], rev: RevisionRequest) -> Optional[Tuple[List[SolutionDesign], List[str], str]]:
     """
-    Orchestrator that classifies intent and extracts key entities,
-    then safely updates the state.
+    Aplica um RevisionRequest sobre cópias dos designs.
+    Retorna (designs, cenários alterados, descrição) ou None quando a edição não é segura localmente.
     """
-    import json
+    if not designs or any(not isinstance(d, SolutionDesign) for d in designs):
+        return None
+    new_designs = copy.deepcopy(designs)
+    targets = _target_designs(new_designs, rev.target_scenario)
+    if not targets:
+        return None
+
+    sku_to = None
+    if rev.sku_to:
+        # resolve_sku casa por prefixo: exige cara de SKU ("MR57"), não palavras soltas ("more", "ms")
+        if not re.search(r"\d", rev.sku_to):
+            return None
+        sku_to = resolve_sku(rev.sku_to)
+        if not sku_to or sku_to not in product_dict:
+            logger.info(f"[Revision] SKU not in catalog: {rev.sku_to}")
+            return None
+
+    changed: List[str] = []
+    for d in targets:
+        comps = list(d.components or [])
+        hit = [c for c in comps if rev.sku_from and _component_matches(c, rev.sku_from)]
+
+        if rev.action == "replace":
+            if not rev.sku_from:
+                # "replace with MR57": troca o hardware da mesma família do SKU novo
+                fam = _catalog_record(sku_to).get("family")
+                hit = [c for c in comps if fam and _catalog_record(c.part_number).get("family") == fam
+                       and not _component_matches(c, "LICENSE")]
+                if len(hit) != 1:
+                    continue
+            if not hit or any(c.part_number == sku_to for c in comps if c not in hit):
+                continue
+            for c in hit:
+                c.part_number = sku_to
+        elif rev.action == "remove":
+            if not hit:
+                continue
+            comps = [c for c in comps if c not in hit]
+        elif rev.action == "set_qty":
+            if not hit or not rev.qty or rev.qty < 1:
+                continue
+            for c in hit:
+                c.quantity, c.fixed_quantity = int(rev.qty), True
+        elif rev.action == "add":
+            existing = next((c for c in comps if c.part_number == sku_to), None)
+            if existing is not None:
+                if not rev.qty:
+                    continue
+                existing.quantity, existing.fixed_quantity = existing.quantity + int(rev.qty), True
+            else:
+                comps.append(SolutionComponent(part_number=sku_to, quantity=int(rev.qty or 1),
+                                               role="", fixed_quantity=bool(rev.qty)))
+        else:
+            return None
+
+        d.components = comps
+        changed.append(d.summary.split(":")[0])
+
+    if not changed:
+        return None
+
+    sel = rev.sku_from
+    if sel and sel.upper() in _CATEGORY_SELECTORS:
+        sel = f"the {sel.lower()}"
+    what = {
+        "replace": f"Replaced {sel or 'the matching item'} with {sku_to}",
+        "remove": f"Removed {sel}",
+        "set_qty": f"Set {sel} quantity to {rev.qty}",
+        "add": f"Added {f'{rev.qty} x ' if rev.qty else ''}{sku_to}",
+    }[rev.action]
+    return new_designs, changed, f"{what} in {', '.join(changed)}."
+
+def _try_local_revision(state: AgentState) -> Optional[dict]:
+    """Orchestrator fast path: edição simples sobre a quote atual, sem LLM nem retrieval."""
+    q = (state.get("user_query") or "").strip()
+    designs = state.get("solution_designs") or []
+    if not designs or q.endswith("?") or not _LOCAL_EDIT_RE.search(q):
+        return None
+    rev = parse_revision_intent(q)
+    if rev is None:
+        return None
+    patched = apply_revision(designs, rev)
+    if patched is None:
+        logger.info("[Revision] Could not apply the edit locally; using the LLM flow")
+        return None
+
+    new_designs, changed, summary = patched
+    logger.info(f"[Revision] Applied locally: {summary}")
+    return {
+        "next_flow": "revision",
+        "orchestrator_decision": {"needs_design": True, "needs_pricing": True, "needs_technical": False},
+        "revision_request": asdict(rev),
+        "previous_solution_designs": designs,
+        "solution_designs": new_designs,
+        "local_revision": {"action": rev.action, "scenarios": changed, "summary": summary},
+        "next_best_action": f"{summary} Anything else you would like to adjust?",
+    }
+
 
+# The final, best-practice version of your orchestrator_node
+
+def _orchestrator_prompt(state: AgentState) -> str:
+    """Monta o prompt do orchestrator (compartilhado pelas versões sync/async)."""
     q = state.get("user_query", "") or ""
     print(f"\n🎻 [Orchestrator] Analyzing query for intent and entities: «{q}»")
 
@@ -1492,56 +1795,72 @@ USER QUERY: "do the new meraki APs support wifi 6e?"
 USER QUERY:
 {q}
 """
+    return llm_prompt
 
-    # --- Step 1: Do the work of the node (LLM call and parsing) ---
-    try:
-        llm_response = llm.invoke(llm_prompt)
-        if hasattr(llm_response, "content"):
-            llm_text = llm_response.content
-        else:
-            llm_text = str(llm_response)
-        
-        llm_data = json.loads(llm_text)
-        
-        intent = llm_data.get("intent", "question")
-        client_name = llm_data.get("client_name")
-        users_count = llm_data.get("users_count")
-        product_domain = llm_data.get("product_domain")
-        sku_map = llm_data.get("sku_map")
-        search_query = llm_data.get("search_query")
-        query_refined = llm_data.get("query_refined")
-        
-        print(f"🎯 Detected Intent: {intent}")
-        print(f"   - Extracted Client: {client_name}")
-        print(f"   - Extracted Users: {users_count}")
-        print(f"   - Extracted Domain: {product_domain}")
-        print(f"   - Extracted SKUs: {sku_map}")
-        print(f"   - Generated Search Query: «{search_query}»")
-        print(f"   - Generated query_refined: «{query_refined}»")
-
-        decision = {
-            "needs_design": intent in ["quote", "revision"],
-            "needs_pricing": intent in ["quote", "revision"],
-            "needs_technical": intent == "question"
-        }
 
-        #designs = json.dumps(state.get("solution_designs") or [], default=_primitive, indent=2)
-        #print("1010101010010101010100101010101010010101010101001 - orchestrator_node", designs)
+def _orchestrator_update(state: AgentState, llm_response) -> dict:
+    """Parses the orchestrator LLM response into the state update (raises on bad JSON)."""
+    if hasattr(llm_response, "content"):
+        llm_text = llm_response.content
+    else:
+        llm_text = str(llm_response)
+    
+    llm_data = json.loads(llm_text)
+    
+    intent = llm_data.get("intent", "question")
+    client_name = llm_data.get("client_name")
+    users_count = llm_data.get("users_count")
+    product_domain = llm_data.get("product_domain")
+    sku_map = llm_data.get("sku_map")
+    search_query = llm_data.get("search_query")
+    query_refined = llm_data.get("query_refined")
+    
+    print(f"🎯 Detected Intent: {intent}")
+    print(f"   - Extracted Client: {client_name}")
+    print(f"   - Extracted Users: {users_count}")
+    print(f"   - Extracted Domain: {product_domain}")
+    print(f"   - Extracted SKUs: {sku_map}")
+    print(f"   - Generated Search Query: «{search_query}»")
+    print(f"   - Generated query_refined: «{query_refined}»")
+
+    decision = {
+        "needs_design": intent in ["quote", "revision"],
+        "needs_pricing": intent in ["quote", "revision"],
+        "needs_technical": intent == "question"
+    }
 
-        # Create the dictionary with ONLY the new information
-        update_data = {
-            "next_flow": intent,
-            "user_query": query_refined,
-            "orchestrator_decision": decision,
-            "client_name": client_name,
-            "users_count": users_count,
-            "product_domain": product_domain,
-            "sku_map": sku_map,
-            "search_query": search_query,
-            "requirements_ok": True,
-            "revision_request": state.get("revision_request") if intent == "revision" else None,
-        }
+    # Create the dictionary with ONLY the new information
+    update_data = {
+        "next_flow": intent,
+        "user_query": query_refined,
+        "orchestrator_decision": decision,
+        "client_name": client_name,
+        "users_count": users_count,
+        "product_domain": product_domain,
+        "sku_map": sku_map,
+        "search_query": search_query,
+        "requirements_ok": True,
+        "revision_request": state.get("revision_request") if intent == "revision" else None,
+    }
+    return update_data
+
+
+def orchestrator_node(state: AgentState) -> dict:
+    """
+    Orchestrator that classifies intent and extracts key entities,
+    then safely updates the state.
+    """
+    local = _try_local_revision(state)
+    if local:
+        state.update(local)
+        return state
 
+    llm_prompt = _orchestrator_prompt(state)
+
+    # --- Step 1: Do the work of the node (LLM call and parsing) ---
+    try:
+        llm_response = get_llm("llm").invoke(llm_prompt)
+        update_data = _orchestrator_update(state, llm_response)
     except Exception as e:
         print(f"  - LLM failed during extraction: {e}")
         # Fallback to a safe state in case of an error
@@ -1554,6 +1873,26 @@ USER QUERY:
     return state
 
 
+async def orchestrator_node_async(state: AgentState) -> dict:
+    """Versão async do orchestrator: mesma lógica, com `ainvoke`."""
+    local = _try_local_revision(state)
+    if local:
+        state.update(local)
+        return state
+
+    llm_prompt = _orchestrator_prompt(state)
+
+    try:
+        llm_response = await get_llm("llm").ainvoke(llm_prompt)
+        update_data = _orchestrator_update(state, llm_response)
+    except Exception as e:
+        print(f"  - LLM failed during extraction: {e}")
+        update_data = {"next_flow": "question"}
+
+    state.update(prune_nones(update_data))
+    return state
+
+
 
 def integrity_validator_node(state: AgentState) -> Dict:
     print("\n🔍 [Integrity] Validating SKUs…")
@@ -1583,8 +1922,11 @@ def pricing_agent_node(state: AgentState) -> Dict:
     - Otherwise, price 'technical_results' using 'sku_quantities'.
     Produces:
       - pricing_results: Dict[str, List[dict]]
-      - ea: {"totals_by_portfolio": {...}, "candidates": [], "chosen": None, "applicable_scenarios": [...]}
+      - ea: {"totals_by_portfolio": {...}, "by_scenario": {...}, "candidates": [], "chosen": None, "applicable_scenarios": [...]}
       - cart_lines: List[dict] (baseline bucket flattened)
+      - pricing_fingerprints: Dict[str, str] (scenario -> fingerprint)
+    Scenarios whose fingerprint matches the persisted one reuse their pricing_results
+    and EA contribution instead of being re-priced.
     """
 
     dec = state.get("orchestrator_decision")
@@ -1594,7 +1936,8 @@ def pricing_agent_node(state: AgentState) -> Dict:
 
     print("\n💰 [Pricing] Calculating costs…")
     client_context = state.get("client_context") or {}
-    designs = state.get("solution_designs") or []
+    # Trabalha sobre uma cópia: os designs com as quantidades finais voltam no update
+    designs = copy.deepcopy(state.get("solution_designs") or [])
     product_catalog = state.get("product_context") or []
     users_count = state.get("users_count") or {}
 
@@ -1622,10 +1965,11 @@ def pricing_agent_node(state: AgentState) -> Dict:
                 qty = int(getattr(c, "quantity", 1) or 1)
             if not sku:
                 continue
-            norm.append({"part_number": sku, "quantity": max(1, qty)})
+            fixed = bool(c.get("fixed_quantity")) if isinstance(c, dict) else bool(getattr(c, "fixed_quantity", False))
+            norm.append({"part_number": sku, "quantity": max(1, qty), "fixed_quantity": fixed})
         return norm
 
-    def _resolve_price(sku: str, qty: int, user: int) -> dict:
+    def _resolve_price(sku: str, qty: int, user: int, fixed_qty: bool = False) -> dict:
         """Try client-aware price; fallback to catalog base price."""
         try:
             pr = _compute_client_adjusted_price(sku, qty, client_context) or {}
@@ -1637,14 +1981,12 @@ def pricing_agent_node(state: AgentState) -> Dict:
 
 
             unit = float(pr.get("unit_price") or 0.0) 
-            #print("6666666666666666666666666666666666666666666666666666666")
-            #print(family)
-            #print(user)
-            #print("6666666666666666666666666666666666666666666666666666666")
             if not user:
                 user = 1
 
-            if family == 'Switches':
+            if fixed_qty:
+                pass  # quantidade definida explicitamente pelo usuário (revisão set_qty/add)
+            elif family == 'Switches':
                 qty = math.ceil(user / int(numbers_ports))
             else:
                 qty = math.ceil(user / 10)
@@ -1685,17 +2027,30 @@ def pricing_agent_node(state: AgentState) -> Dict:
                 return v
         return []
 
-    def _ea_rollup(prices_map: Dict[str, List[dict]]) -> Dict:
+    def _ea_contribution(lines: List[dict]) -> Dict[str, float]:
+        contrib = defaultdict(float)
+        for it in lines or []:
+            portfolio = it.get("portfolio") or "unknown"
+            contrib[portfolio] += float(it.get("line_total_usd") or it.get("subtotal") or 0.0)
+        return dict(contrib)
+
+    def _ea_rollup(prices_map: Dict[str, List[dict]], reuse: Optional[Dict[str, Dict[str, float]]] = None) -> Dict:
+        # reuse: contribuições por cenário já calculadas (cenários não re-precificados)
+        reuse = reuse or {}
         totals = defaultdict(float)
+        by_scenario: Dict[str, Dict[str, float]] = {}
         apps = []
         for scen, lines in (prices_map or {}).items():
             apps.append(scen)
-            for it in lines or []:
-                portfolio = it.get("portfolio") or "unknown"
-                line_total = float(it.get("line_total_usd") or it.get("subtotal") or 0.0)
-                totals[portfolio] += line_total
+            contrib = reuse.get(scen)
+            if not isinstance(contrib, dict):
+                contrib = _ea_contribution(lines)
+            by_scenario[scen] = contrib
+            for portfolio, line_total in contrib.items():
+                totals[portfolio] += float(line_total or 0.0)
         return {
             "totals_by_portfolio": dict(totals),
+            "by_scenario": by_scenario,
             "candidates": [],
             "chosen": None,
             "applicable_scenarios": apps,
@@ -1704,18 +2059,35 @@ def pricing_agent_node(state: AgentState) -> Dict:
     # ======================= path 1: designs =======================
     if designs and any(_iter_components(d) for d in designs):
         pricing_results: Dict[str, List[dict]] = {}
+        fingerprints: Dict[str, str] = {}
+        reused_ea: Dict[str, Dict[str, float]] = {}
+        # re-precificação incremental: cenário com o mesmo fingerprint reaproveita o resultado persistido
+        prior_results = state.get("pricing_results") or {}
+        prior_fps = state.get("pricing_fingerprints") or {}
+        prior_ea = (state.get("ea") or {}).get("by_scenario") or {}
+        price_book = _price_book_version(client_context)
 
         for d in designs:
             d_name = _scenario_name(d)
+            comps = _iter_components(d)
+            fp = _scenario_fingerprint(comps, users_count, price_book)
+            hit = prior_fps.get(d_name) == fp and isinstance(prior_results.get(d_name), list)
+            telemetry.record_cache("pricing_scenario", hit)
+            if hit:
+                pricing_results[d_name] = prior_results[d_name]
+                fingerprints[d_name] = fp
+                if isinstance(prior_ea.get(d_name), dict):
+                    reused_ea[d_name] = prior_ea[d_name]
+                continue
             bucket: List[dict] = []
 
-            comps = sorted(_iter_components(d), key=lambda c: (c["part_number"].upper(), int(c["quantity"])))
+            comps = sorted(comps, key=lambda c: (c["part_number"].upper(), int(c["quantity"])))
             for c in comps:
                 raw_sku = c["part_number"]
                 qty = max(1, int(c["quantity"]))
                 sku = resolve_sku(raw_sku) or raw_sku  # normalize/alias if needed
 
-                price = _resolve_price(sku, qty, users_count)
+                price = _resolve_price(sku, qty, users_count, c["fixed_quantity"])
                 desc, portfolio = _desc_portfolio(sku)
                 line = {
                     "part_number": sku,
@@ -1734,6 +2106,8 @@ def pricing_agent_node(state: AgentState) -> Dict:
                         component.quantity = price["qty"]
 
             pricing_results[d_name] = sorted(bucket, key=lambda x: x["part_number"].upper())
+            # fingerprint sobre as quantidades finais (já gravadas no design)
+            fingerprints[d_name] = _scenario_fingerprint(_iter_components(d), users_count, price_book)
             #designs['quantity'] = price["qty"]
         #designs[0]['quantity'] = 100000000000
         update_data = {
@@ -1750,21 +2124,24 @@ def pricing_agent_node(state: AgentState) -> Dict:
             "discount_pct": float(it.get("discount_pct") or 0.0),
         } for it in baseline_bucket]
 
-        ea_rollup = _ea_rollup(pricing_results)
+        ea_rollup = _ea_rollup(pricing_results, reused_ea)
+        if prior_fps:
+            reused = [n for n in pricing_results if prior_fps.get(n) == fingerprints.get(n)]
+            logger.debug(f"[Pricing] Re-priced {len(pricing_results) - len(reused)} scenario(s); reused {reused}")
 
         # keep in state for downstream
         state["pricing_results"] = pricing_results
+        state["pricing_fingerprints"] = fingerprints
         state["cart_lines"] = cart_lines
         state["ea"] = ea_rollup
 
-        #print("7859273482749872987598432795843759734597439857 estoooooooooooooooooou aqui")
-        #print(pricing_results)
 
-        #print("7859273482749872987598432795843759734597439857 estoooooooooooooooooou aqui")
 
 
         return prune_nones({
+            "solution_designs": designs,
             "pricing_results": pricing_results,
+            "pricing_fingerprints": fingerprints,
             "ea": ea_rollup,
             "cart_lines": cart_lines,
             "client_name": state.get("client_name"),
@@ -1847,8 +2224,8 @@ def pricing_agent_node(state: AgentState) -> Dict:
     # Update the state, preserving everything else
     state.update(prune_nones(update_data))
     
-    # Return the complete, updated state
-    return state
+    # Only the keys this node owns: the rest of the state stays as it came in.
+    return prune_nones(update_data)
 
     #return prune_nones({
     #    "pricing_results": pricing_results,
@@ -2060,11 +2437,10 @@ from ai_engine.app.utils.retriever import hybrid_search_products
 # no topo do arquivo, se ainda não tiver
 from typing import Optional
 
-import pandas as pd
-import numpy as np
-
 def clean_for_json(obj):
     """Recursivamente troca pd.NA/nan por None para permitir json.dumps"""
+    import pandas as pd
+
     if isinstance(obj, dict):
         return {k: clean_for_json(v) for k, v in obj.items()}
     elif isinstance(obj, list):
@@ -2142,13 +2518,17 @@ def context_collector_node(state: AgentState) -> dict:
         "product_context": product_context
     }
 
-    #print(skus)
     
     state.update(update_data)
     
     return state
 
 
+async def context_collector_node_async(state: AgentState) -> dict:
+    """Versão async: a busca híbrida é bloqueante (FAISS/BM25/TF-IDF), então roda numa thread."""
+    return await asyncio.to_thread(context_collector_node, state)
+
+
 
     # 🔹 Aqui indicamos explicitamente o branch que deve receber a saída
    # return {
@@ -2240,28 +2620,23 @@ def _primitive(o):
 
 from pydantic import ValidationError
 
-def llm_designer_node(state: AgentState) -> dict:
+def _prepare_designer_call(state: AgentState):
     """
-    LLM Designer node: builds 3 scenarios using a structured output schema.
-    - Accepts optional base_sku.
-    - Uses only the provided product_context (no SKU invention).
-    - Keeps state.orchestrator_decision.needs_pricing = True for downstream pricing.
+    Builds the designer chain and its inputs.
+    Returns (chain, inputs), or (None, update) when there is nothing to ask the LLM.
     """
-    print("\n🤖 [LLM Designer] Asking LLM to create scenarios…")
-
     # ---- Inputs & guards ----
     product_context = state.get("product_context") or []
     if not product_context:
         print("  - No context at all. Cannot design scenarios.")
         error_design = [SolutionDesign(summary="Error", justification="No product context available.", components=[])]
-        return {"solution_designs": error_design}
+        return None, {"solution_designs": error_design}
 
     base_sku: Optional[str] = state.get("base_product_sku")
     product_domain: str = state.get("product_domain") or ""
     user_query: str = state.get("user_query", "")
     qty_map = state.get("sku_map") or state.get("sku_quantities") or {}
     users_count = state.get("users_count") or {}
-    #print("99999999999999090909099999999999", users_count)
 
     # Conversational memory (optional; may be empty strings)
     conversation_window = state.get("conversation_window", "")
@@ -2321,7 +2696,6 @@ def llm_designer_node(state: AgentState) -> dict:
 
     context_json = json.dumps(context_buckets, indent=2)
 
-    #print("8930843749837658746528746584276548765487658427", context_json)
 
 
 
@@ -2343,21 +2717,15 @@ def llm_designer_node(state: AgentState) -> dict:
 
     _current_designs = json.dumps(state.get("solution_designs") or [], default=_primitive, indent=2)
     current_designs = state.get("solution_designs") or []
-    #print("llm_designer_node - 1010101010010101010100101010101010010101010101001 - current_designs_json_1", _current_designs)
-    #print("llm_designer_node - 1010101010010101010100101010101010010101010101001 - current_designs_json_2", current_designs)
 
     previous_solution_designs = json.dumps(state.get("previous_solution_designs") or [], default=_primitive, indent=2)
-    #print("llm_designer_node - 1010101010010101010100101010101010010101010101001 - previous_solution_designs", previous_solution_designs)
 
 
     #revision = state.get("revision_request")
     #revision_dict = revision.__dict__ if revision else {}
     #revision_json = json.dumps(revision_dict, indent=2)
-    #print("--------------------------------9999999999999999999999999999999999999999999999999", revision)
-    #print("99999999999999999999999999999999999999999999999999999999999999", context_json)
     print(">>> LLM Designer sees revision_request:", state.get("revision_request"))
     #designs = state.get("solution_designs", [])
-    #print("llm_designer_node - 1010101010010101010100101010101010010101010101001 - designs", designs)
 
     revision = state.get("revision_request")
     if revision is None:
@@ -2367,7 +2735,6 @@ def llm_designer_node(state: AgentState) -> dict:
     else:
         revision_dict = revision.__dict__
     revision_json = json.dumps(revision_dict, indent=2)
-    #print("--------------------------------9999999999999999999999999999999999999999999999999", revision)
 
     # Get conversational memory from the state to be used in both paths.
     conversation_summary = state.get("conversation_summary", "No summary yet.")
@@ -2377,7 +2744,6 @@ def llm_designer_node(state: AgentState) -> dict:
     revision = state.get("next_flow")
     #if not revision:
     if revision != "revision":
-        #print("1111111111111111111111111111111111111111111111111111")
         # ---- Prompt (intentionally blank body; variables still wired) ----
         prompt_template = ChatPromptTemplate.from_template(
         """
@@ -2470,8 +2836,6 @@ def llm_designer_node(state: AgentState) -> dict:
                 """
                 )
     else:
-        #print("22222222222222222222222222222222222222222222222222222222222222")
-        #print(previous_designs_json)
         prompt_template = ChatPromptTemplate.from_template("""
     ROLE: You are a meticulous editor for Cisco sales quotes.
 
@@ -2556,69 +2920,70 @@ def llm_designer_node(state: AgentState) -> dict:
 )
 
     # ---- LLM (structured output) ----
-    llm = your_llm_instance
-    # Bind the parameters for this specific task
-    llm_with_logprobs = llm.bind(
-        logprobs=True,
-        top_logprobs=5
-    )
-    structured_llm = llm.with_structured_output(QuoteScenarios, method="function_calling")
+    structured_llm = get_structured_llm("your_llm_instance", QuoteScenarios)
     #structured_llm = llm_with_logprobs.with_structured_output(QuoteScenarios)
     #chain = prompt_template | llm_with_logprobs | StrOutputParser()
 
     chain = prompt_template | structured_llm
 
-    # ---- Invoke ----
-    try:
+    inputs = {
+        "user_query": state.get("user_query", ""),
+        "context_json": context_json,                  # lista de SKUs
+        "previous_solution_designs": previous_solution_designs,  # última quote
+        "_current_designs": _current_designs,  # última quote
+        "revision_json": revision_json,                # novo request
+        "base_sku": base_sku or "N/A",
+        "conversation_summary": conversation_summary, # CORRECTLY ADDED
+        "conversation_window": conversation_window,   # CORRECTLY ADDED
+        "users_count": users_count,
+    }
+    return chain, inputs
 
-        resp = chain.invoke({
-                    "user_query": state.get("user_query", ""),
-                    "context_json": context_json,                  # lista de SKUs
-                    "previous_solution_designs": previous_solution_designs,  # última quote
-                    "_current_designs": _current_designs,  # última quote
-                    "revision_json": revision_json,                # novo request
-                    "base_sku": base_sku or "N/A",
-                    "conversation_summary": conversation_summary, # CORRECTLY ADDED
-                    "conversation_window": conversation_window,   # CORRECTLY ADDED
-                    "users_count": users_count,
-                })
-        #print("2222222222222222222222222222222",resp)
-
-        # Normalize resp.scenarios whether pydantic object or plain dict
-        scenarios = getattr(resp, "scenarios", None) or resp.get("scenarios", [])
-        designs: List[SolutionDesign] = []
-        for sc in scenarios:
-            # Access fields whether object-like or dict-like
-            sc_name = getattr(sc, "name", None) or (sc.get("name") if isinstance(sc, dict) else "Option")
-            sc_just = getattr(sc, "justification", None) or (sc.get("justification") if isinstance(sc, dict) else "")
-            sc_components = getattr(sc, "components", None) or (sc.get("components") if isinstance(sc, dict) else []) or []
 
-            comps = []
-            for c in sc_components:
-                sku = getattr(c, "sku", None) or (c.get("sku") if isinstance(c, dict) else None)
-                qty = getattr(c, "quantity", None) or (c.get("quantity") if isinstance(c, dict) else 1)
-                if not sku:
-                    continue
-                try:
-                    qty = int(qty)
-                except Exception:
-                    qty = 1
-                comps.append({"part_number": sku, "quantity": max(1, qty), "role": ""})
+def _designs_from_llm(resp) -> List[SolutionDesign]:
+    """Normalize resp.scenarios (pydantic object or plain dict) into a SolutionDesign list."""
+    scenarios = getattr(resp, "scenarios", None) or resp.get("scenarios", [])
+    designs: List[SolutionDesign] = []
+    for sc in scenarios:
+        # Access fields whether object-like or dict-like
+        sc_name = getattr(sc, "name", None) or (sc.get("name") if isinstance(sc, dict) else "Option")
+        sc_just = getattr(sc, "justification", None) or (sc.get("justification") if isinstance(sc, dict) else "")
+        sc_components = getattr(sc, "components", None) or (sc.get("components") if isinstance(sc, dict) else []) or []
 
-            designs.append(SolutionDesign(summary=sc_name, justification=sc_just, components=comps))
+        comps = []
+        for c in sc_components:
+            sku = getattr(c, "sku", None) or (c.get("sku") if isinstance(c, dict) else None)
+            qty = getattr(c, "quantity", None) or (c.get("quantity") if isinstance(c, dict) else 1)
+            if not sku:
+                continue
+            try:
+                qty = int(qty)
+            except Exception:
+                qty = 1
+            comps.append({"part_number": sku, "quantity": max(1, qty), "role": ""})
 
-    #    #final_designs = designs or [SolutionDesign(summary="Error", justification="Empty scenarios.", components=[])]
-        new_designs = designs or [SolutionDesign(summary="Error", justification="Empty scenarios.", components=[])]
+        designs.append(SolutionDesign(summary=sc_name, justification=sc_just, components=comps))
 
+    return designs or [SolutionDesign(summary="Error", justification="Empty scenarios.", components=[])]
 
 
-    except Exception as e:
-        print(f"  - ERROR during LLM call or parsing: {e}")
-        new_designs = [SolutionDesign(
-            summary="Error",
-            justification=f"Failed to generate scenarios with LLM: {e}",
-            components=[]
-        )]
+def _designer_error(state: AgentState, e: Exception) -> List[SolutionDesign]:
+    print(f"  - ERROR during LLM call or parsing: {e}")
+    # Caminho degradado: para quote nova, o designer determinístico substitui o LLM lento/indisponível
+    if state.get("next_flow") != "revision":
+        designs = deterministic_designs(state)
+        if designs:
+            logger.info("[Designer] Degraded path: using deterministic designs")
+            return designs
+    return [SolutionDesign(
+        summary="Error",
+        justification=f"Failed to generate scenarios with LLM: {e}",
+        components=[]
+    )]
+
+
+def _finish_designer(state: AgentState, new_designs: List[SolutionDesign]) -> dict:
+    current_designs = state.get("solution_designs") or []
 
     # Ensure downstream pricing runs
     dec = state.get("orchestrator_decision")
@@ -2643,361 +3008,61 @@ def llm_designer_node(state: AgentState) -> dict:
     
     return state
 
-def llm_designer_node_license(state: AgentState) -> dict:
+
+def _try_deterministic_designer(state: AgentState) -> Optional[List[SolutionDesign]]:
+    """Quote nova com engine 'deterministic': compõe sem LLM; None => segue para o LLM."""
+    if state.get("next_flow") == "revision" or _design_engine_for(state) != "deterministic":
+        return None
+    logger.debug("[Designer] Deterministic engine: ranking catalog candidates")
+    designs = deterministic_designs(state)
+    if not designs:
+        logger.info("[Designer] Deterministic engine found no design; falling back to the LLM")
+    return designs
+
+
+def llm_designer_node(state: AgentState) -> dict:
     """
     LLM Designer node: builds 3 scenarios using a structured output schema.
     - Accepts optional base_sku.
     - Uses only the provided product_context (no SKU invention).
     - Keeps state.orchestrator_decision.needs_pricing = True for downstream pricing.
     """
-    print("\n🤖 [LLM Designer] Asking LLM to create scenarios…")
-
-    # ---- Inputs & guards ----
-    product_context = state.get("product_context") or []
-    if not product_context:
-        print("  - No context at all. Cannot design scenarios.")
-        error_design = [SolutionDesign(summary="Error", justification="No product context available.", components=[])]
-        return {"solution_designs": error_design}
-
-    base_sku: Optional[str] = state.get("base_product_sku")
-    product_domain: str = state.get("product_domain") or ""
-    user_query: str = state.get("user_query", "")
-    qty_map = state.get("sku_map") or state.get("sku_quantities") or {}
-    users_count = state.get("users_count") or {}
-    #print("99999999999999090909099999999999", users_count)
-
-    # Conversational memory (optional; may be empty strings)
-    conversation_window = state.get("conversation_window", "")
-    conversation_summary = state.get("conversation_summary", "")
-
-    if not base_sku:
-        base_sku = None
-        print(f"  - Inferred base_sku from context: {base_sku}")
-
-    # JSON context payload
-    product_context_json = json.dumps(product_context, indent=2)
-    context_json = json.dumps(product_context, indent=2)
-
+    designs = _try_deterministic_designer(state)
+    if designs:
+        return _finish_designer(state, designs)
 
-    def _role_from_dim(p: dict) -> str:
-        """Determina se o produto é hardware, licença ou acessório."""
-        dim = (p.get("product_dimension") or p.get("category") or "").strip().casefold()
-        
-        # MUDANÇA: Removemos a referência a 'product_name', que não existe mais no product_context.
-        # 'commercial_name' é o campo correto agora.
-        name = (p.get("commercial_name") or "").strip().casefold()
-
-        if "license" in dim or "licen" in name:
-            return "license"
-        return "hardware"
-
-    def _domain_from_family(p: dict) -> str:
-        """Determina se o produto é switch ou wifi a partir da família."""
-        fam = (p.get("family") or "").strip().casefold()
-        # Esta regra simples continua funcional com os novos dados ("switches" ou "wireless")
-        return "switch" if "switch" in fam else "wifi"
-
-    def build_context_by_family(products: list[dict], limit_per_bucket: int = 40) -> dict:
-        """Organiza uma lista de produtos em 'buckets' por domínio e função."""
-        buckets = {
-            "wifi":   {"hardware": [], "licenses": []},
-            "switch": {"hardware": [], "licenses": []},
-        }
-        for p in products or []:
-            dom = _domain_from_family(p)
-            role = _role_from_dim(p)
-            # A chave 'role' já está no formato correto dos buckets
-            key = role + "s" if role != "hardware" else role # accessories, licenses, hardware
-            if key in buckets[dom]:
-                buckets[dom][key].append(p)
-
-        # Limita a quantidade de itens em cada bucket
-        for dom in buckets:
-            for k in buckets[dom]:
-                buckets[dom][k] = buckets[dom][k][:limit_per_bucket]
-        
-        return buckets
-
-    # === uso ===
-    product_context = state.get("product_context") or []
-    context_buckets = build_context_by_family(product_context)
-
-    context_json = json.dumps(context_buckets, indent=2)
-
-    #print("8930843749837658746528746584276548765487658427", context_json)
-
-
-
-    base_quantity = int(qty_map.get(base_sku, 1)) if base_sku else 1  # not directly used, but available if needed
-
-
-    prev_designs = state.get("solution_designs") or []
-    # Converta SolutionDesign -> dict para serializar:
-    def _sd_to_dict(d):
-        if isinstance(d, SolutionDesign):
-            return {
-                "summary": d.summary,
-                "justification": d.justification,
-                "components": [
-                    {"sku": c.part_number, "quantity": int(c.quantity)} for c in (d.components or [])
-                ],
-            }
-        return d
-
-    _current_designs = json.dumps(state.get("solution_designs") or [], default=_primitive, indent=2)
-    current_designs = state.get("solution_designs") or []
-    #print("llm_designer_node - 1010101010010101010100101010101010010101010101001 - current_designs_json_1", _current_designs)
-    #print("llm_designer_node - 1010101010010101010100101010101010010101010101001 - current_designs_json_2", current_designs)
-
-    previous_solution_designs = json.dumps(state.get("previous_solution_designs") or [], default=_primitive, indent=2)
-    #print("llm_designer_node - 1010101010010101010100101010101010010101010101001 - previous_solution_designs", previous_solution_designs)
-
-
-    #revision = state.get("revision_request")
-    #revision_dict = revision.__dict__ if revision else {}
-    #revision_json = json.dumps(revision_dict, indent=2)
-    #print("--------------------------------9999999999999999999999999999999999999999999999999", revision)
-    #print("99999999999999999999999999999999999999999999999999999999999999", context_json)
-    print(">>> LLM Designer sees revision_request:", state.get("revision_request"))
-    #designs = state.get("solution_designs", [])
-    #print("llm_designer_node - 1010101010010101010100101010101010010101010101001 - designs", designs)
-
-    revision = state.get("revision_request")
-    if revision is None:
-        revision_dict = {}
-    elif isinstance(revision, dict):
-        revision_dict = revision
-    else:
-        revision_dict = revision.__dict__
-    revision_json = json.dumps(revision_dict, indent=2)
-    #print("--------------------------------9999999999999999999999999999999999999999999999999", revision)
-
-    # Get conversational memory from the state to be used in both paths.
-    conversation_summary = state.get("conversation_summary", "No summary yet.")
-    conversation_window = state.get("conversation_window", "No recent messages.")
-
-
-    prompt_template = ChatPromptTemplate.from_template(
-        """
-            You are an expert and commercially-aware Cisco Sales Engineer.
-
-            Here is a summary of the conversation so far:
-            {conversation_summary}
-
-            Here are the most recent messages:
-            {conversation_window}
-
-            Here is the current quote if exist (This is your starting point, IF EXIST):
-
-            {_current_designs}
-
-
-            Based on all of this context, and the user's latest query, perform the following task.
-
-
-            USER QUERY:
-            {user_query}
-
-            AVAILABLE COMPONENTS (authoritative catalogue — ONLY use SKUs listed below; do NOT invent SKUs):
-            ```json
-            {context_json}
-            ```
-
-            TASK
-            Your main goal is to design **exactly 3 distinct options** labeled "Essential (Good)", "Standard (Better)", and "Complete (Best)".
-
-            For EACH of the 3 scenarios, you MUST follow these steps in order:
-
-            1. **Select and Size Hardware:**
-               - First, select the primary hardware (switch or Wi-Fi AP) for the scenario.
-               - You MUST apply the Sizing Calculation Rules below to determine the correct quantity of devices needed to support the `{users_count}`.
-
-
-            2. **Justify Your Choices:**
-               - Briefly explain why you chose those components for that scenario, considering price and performance.
-
-            ---
-            **Sizing Calculation Rules:**
-
-            ### Sizing Calculation for Switches (Simple Method):
-            To determine the correct quantity of switches, you MUST use the following simple calculation.
-
-            1.  **Identify Inputs:** State the `{users_count}` from the request and the `Ports_per_Switch` from the product's `ports` field.
-            2.  **Calculate Quantity:** The number of switches is `ceil({users_count} / Ports_per_Switch)`. You MUST always round the result up to the next whole number.
-
-            **Crucial Example to follow:**
-            *For `{users_count}` = 500 and a 24-port switch:*
-
-            *Internal Thought Process:*
-            "I need to calculate the quantity for a 24-port switch for 500 users.
-            - The formula is `ceil(users_count / Ports_per_Switch)`.
-            - Calculation: `ceil(500 / 24)` = `ceil(20.83)`.
-            - Rounding up, the final quantity is **21 switches**.
-            I will now use the quantity of 21 in my quote."
-
-            ### For Wi-Fi Access Points (APs):
-            The calculation is an estimate based on user density.
-
-            1.  **Estimate Users per AP:** Infer this from the `Usage` field of the product. Use these heuristics:
-                - If `Usage` mentions "high-density", assume **25 users per AP**.
-                - If `Usage` mentions "medium-density" or is a general office use case, assume **45 users per AP**.
-                - If `Usage` mentions "low-density" (like a warehouse), assume **65 users per AP**.
-                - If unclear, default to **40 users per AP**.
-            2.  **Calculate Number of APs:** `Number_of_APs = ceil({users_count} / Estimated_Users_per_AP)`. **Always round up.**
-
-            *Example for `{users_count}` = 500 and a "medium-density" AP:*
-            - Estimated_Users_per_AP = 45
-            - Number_of_APs = ceil(500 / 45) = ceil(11.11) = 12 APs
-            ---
-
-            **Core Selection Principles:**
-
-            1.  **Prioritize User's Explicit Keywords:** Your primary goal is to satisfy the user's specific request.
-                -   Carefully identify any explicit product families, lines, or attributes mentioned in the `USER REQUEST` (e.g., "Catalyst", "Meraki", "switch", "outdoor").
-                -   These keywords are the **most important factor** in your selection. You MUST give strong preference to candidate products from the list that directly match these keywords. The "Essential (Good)" option, at a minimum, should match these criteria.
-
-            2.  **Justify All Deviations:**
-                -   If you propose a product that does **not** match a user's explicit keyword (for example, suggesting a "Meraki" product when "Catalyst" was requested), you MUST provide a clear and compelling reason in the `Justification` section.
-                -   A valid reason could be a significant cost saving for similar performance, or if no suitable product matching the user's criteria was found in the candidate list.
-
-            3.  **Ensure Logical Progression:**
-                -   After applying the user's preferences, select the hardware and licenses for the "Essential", "Standard", and "Complete" tiers.
-                -   Ensure these tiers demonstrate a clear and logical progression in both **performance/features and price**. The "Standard" option should be a justifiable upgrade from "Essential", and "Complete" should be the premium choice.
-
-            4.  **Handle Insufficient Options:**
-                -   If, after prioritizing the user's keywords, you cannot find enough suitable products to create three distinct tiers, **do not invent irrelevant options**.
-                -   Present the options you have logically. If only one product is a perfect match, present it as the "Recommended Option" and explain why it's the best fit for the user's request.
-
-            BUSINESS RULES
-            1)  **Sizing Calculation:** You MUST carefully read the `{user_query}` to identify the required number of users. The total number of ports from all combined switches MUST be equal to or greater than that number of users.
-
-            3)  **Logical Progression:** Create a meaningful difference between the 3 scenarios even about the prices, but also related to the perfomance.
-                
-            4)  **No Duplicates & Context is King:** You MUST NOT list the same SKU more than once in a single scenario. Use the "quantity" field. All SKUs MUST come from the AVAILABLE COMPONENTS JSON.
-
-            OUTPUT FORMAT (STRICT)
-            - Respond with JSON only (no prose, no markdown fences).
-            - Must match this exact schema:
-             Output JSON only, matching the schema:
-            {{
-              "scenarios": [
-                {{
-                  "name": "Essential (Good)|Standard (Better)|Complete (Best)",
-                  "justification": "reason",
-                  "components": [{{ "sku": "<SKU>", "quantity": <int> }}]
-                }}
-              ]
-            }}
-            VALIDATION
-            - Every component must include both fields: "sku" (string) and "quantity" (integer ≥ 1).
-            - Do not output any fields other than the schema above.
-            - Do not include markdown code fences or commentary.
-
-            FINAL CHECKLIST:
-            Before providing your final JSON output, you MUST verify the following:
-            1.  Are there EXACTLY THREE scenarios ("Essential (Good)", "Standard (Better)", "Complete (Best)")? Your entire output is invalid if this is not met.
-            3.  Does EACH scenario respect the Sizing Calculation rule?
-            4.  Does EACH scenario avoid duplicate SKUs?
-            5.  Does EACH scenario has only sku found in AVAILABLE COMPONENTS?
-            Your final output MUST satisfy all points on this checklist.
-
-                """
-                )
-
-
-    # ---- LLM (structured output) ----
-    llm = your_llm_instance
-    # Bind the parameters for this specific task
-    llm_with_logprobs = llm.bind(
-        logprobs=True,
-        top_logprobs=5
-    )
-    structured_llm = llm.with_structured_output(QuoteScenarios, method="function_calling")
-    #structured_llm = llm_with_logprobs.with_structured_output(QuoteScenarios)
-    #chain = prompt_template | llm_with_logprobs | StrOutputParser()
-
-    chain = prompt_template | structured_llm
+    print("\n🤖 [LLM Designer] Asking LLM to create scenarios…")
+    chain, payload = _prepare_designer_call(state)
+    if chain is None:
+        return payload
 
     # ---- Invoke ----
     try:
-
-        resp = chain.invoke({
-                    "user_query": state.get("user_query", ""),
-                    "context_json": context_json,                  # lista de SKUs
-                    "previous_solution_designs": previous_solution_designs,  # última quote
-                    "_current_designs": _current_designs,  # última quote
-                    "revision_json": revision_json,                # novo request
-                    "base_sku": base_sku or "N/A",
-                    "conversation_summary": conversation_summary, # CORRECTLY ADDED
-                    "conversation_window": conversation_window,   # CORRECTLY ADDED
-                    "users_count": users_count,
-                })
-        #print("2222222222222222222222222222222",resp)
-
-        # Normalize resp.scenarios whether pydantic object or plain dict
-        scenarios = getattr(resp, "scenarios", None) or resp.get("scenarios", [])
-        designs: List[SolutionDesign] = []
-        for sc in scenarios:
-            # Access fields whether object-like or dict-like
-            sc_name = getattr(sc, "name", None) or (sc.get("name") if isinstance(sc, dict) else "Option")
-            sc_just = getattr(sc, "justification", None) or (sc.get("justification") if isinstance(sc, dict) else "")
-            sc_components = getattr(sc, "components", None) or (sc.get("components") if isinstance(sc, dict) else []) or []
-
-            comps = []
-            for c in sc_components:
-                sku = getattr(c, "sku", None) or (c.get("sku") if isinstance(c, dict) else None)
-                qty = getattr(c, "quantity", None) or (c.get("quantity") if isinstance(c, dict) else 1)
-                if not sku:
-                    continue
-                try:
-                    qty = int(qty)
-                except Exception:
-                    qty = 1
-                comps.append({"part_number": sku, "quantity": max(1, qty), "role": ""})
-
-            designs.append(SolutionDesign(summary=sc_name, justification=sc_just, components=comps))
-
-    #    #final_designs = designs or [SolutionDesign(summary="Error", justification="Empty scenarios.", components=[])]
-        new_designs = designs or [SolutionDesign(summary="Error", justification="Empty scenarios.", components=[])]
-
-
-
+        new_designs = _designs_from_llm(chain.invoke(payload))
     except Exception as e:
-        print(f"  - ERROR during LLM call or parsing: {e}")
-        new_designs = [SolutionDesign(
-            summary="Error",
-            justification=f"Failed to generate scenarios with LLM: {e}",
-            components=[]
-        )]
+        new_designs = _designer_error(state, e)
 
-    # Ensure downstream pricing runs
-    dec = state.get("orchestrator_decision")
-    if dec:
-        try:
-            dec.needs_pricing = True
-        except Exception:
-            pass
+    return _finish_designer(state, new_designs)
 
-       # --- Prepare the state update ---
-    update_data = {
-        # The 'current_designs' we saved at the beginning now become the 'previous' ones.
-        "previous_solution_designs": current_designs,
-        
-        # The brand new designs become the 'current' ones, using the original key.
-        "solution_designs": new_designs, 
-
-        "orchestrator_decision": dec
-    }
-    
-    state.update(update_data)
-    
-    return state
 
+async def llm_designer_node_async(state: AgentState) -> dict:
+    """Versão async do LLM Designer (`chain.ainvoke`, limitado por DESIGNER_LLM_TIMEOUT_S)."""
+    designs = _try_deterministic_designer(state)
+    if designs:
+        return _finish_designer(state, designs)
 
-    #return {"solution_designs": final_designs, "orchestrator_decision": dec}
-
+    print("\n🤖 [LLM Designer] Asking LLM to create scenarios…")
+    chain, payload = _prepare_designer_call(state)
+    if chain is None:
+        return payload
 
+    try:
+        resp = await asyncio.wait_for(chain.ainvoke(payload), timeout=settings.designer_llm_timeout_s)
+        new_designs = _designs_from_llm(resp)
+    except Exception as e:
+        new_designs = _designer_error(state, e)
 
+    return _finish_designer(state, new_designs)
 
 
 nba_prompt_r = ChatPromptTemplate.from_template(
@@ -3095,52 +3160,32 @@ class NBAOutput(BaseModel):
     question_for_refinement: str
     refinements: Optional[List[Dict[str, Any]]] = []
 
-def nba_agent_node(state: AgentState) -> dict:
-    """
-    Agent that generates intelligent questions to refine a quote
-    or provides a direct answer and next best action for a user question.
-    """
-    print("\n🤖 [NBA Agent] Deciding next best action…")
-
+def _prepare_nba_call(state: AgentState):
+    """Returns (intent, full_chain, ai_input) for the NBA agent (shared by sync/async)."""
     intent = state.get("next_flow")
 
     # Get conversational memory from the state to be used in both paths.
     conversation_summary = state.get("conversation_summary", "No summary yet.")
-    #print("nba_agent_node - 1010101010010101010100101010101010010101010101001 - conversation_summary", conversation_summary)
     conversation_window = state.get("conversation_window", "No recent messages.")
-    #print("nba_agent_node - 1010101010010101010100101010101010010101010101001 - conversation_window", conversation_window)
 
     users_count = state.get("users_count") or {}
-    print("99999999999999090909099999999999", users_count)
 
     # Define the LLM chain with logprobs and structured output
-    llm_with_logprobs = llm_nba.bind(
-        logprobs=True,
-        top_logprobs=5
-    )
-    chain = llm_with_logprobs.with_structured_output(NBAOutput)
+    chain = get_structured_llm("llm_nba", NBAOutput, method=None, logprobs=True)
     product_metadata = [
             {**p, **(p.get("technical_specs") or {})}
             for p in state.get("product_context", [])
         ]
 
     previous_solution_designs = json.dumps(state.get("previous_solution_designs") or [], default=_primitive, indent=2)
-    #print("1010101010010101010100101010101010010101010101001 - previous_solution_designs", previous_solution_designs)
 
+    # No fluxo de quote o NBA roda depois do pricing: vê os designs com as quantidades já precificadas.
     designs = json.dumps(state.get("solution_designs") or [], default=_primitive, indent=2)
-    #print("1010101010010101010100101010101010010101010101001 - solution_designs", designs)
 
     if intent != "question":
         # --- Path 1: User wants a quote refinement ---
         print(f"   - Handling intent: '{intent}'. Generating refinement question.")
         
-        # Prepare context specific to refinement
-        
-        pr = state.get("pricing_results", {})
-        # ... (your logic for creating solutions_block)
-        #solutions_block = "..." # Assuming this is built as before
-
-        
         refinements = state.get("refinements", [])
 
         # Input dictionary now correctly includes conversational memory.
@@ -3154,39 +3199,59 @@ def nba_agent_node(state: AgentState) -> dict:
             "previous_solution_designs": previous_solution_designs,
             "users_count":users_count,
         }
+        return intent, nba_prompt_r | chain, ai_input
 
-        full_chain = nba_prompt_r | chain
-        ai_message = full_chain.invoke(ai_input)
-        
-        # ... (rest of the processing logic for refinement)
+    # --- Path 2: User wants a direct answer + next action ---
+    print(f"   - Handling intent: '{intent}'. Generating direct answer and next action.")
+    
+    # Input dictionary now correctly includes conversational memory.
+    ai_input = {
+        "user_query": state.get("user_query", ""),
+        "conversation_summary": conversation_summary, # CORRECTLY ADDED
+        "conversation_window": conversation_window,   # CORRECTLY ADDED
+        "solutions_context": designs,
+        "product_metadata": product_metadata,
+        "previous_solution_designs": previous_solution_designs,
+        "users_count":users_count,
+    }
+    return intent, nba_prompt_qa | chain, ai_input
+
+
+def _finish_nba(intent: Optional[str], ai_message) -> dict:
+    if intent != "question":
         next_question = ai_message.question_for_refinement.strip()
         print(f"✅ Generated refinement question: {next_question}")
         return { "next_best_action": next_question} # and other state updates
 
-    else:
-        # --- Path 2: User wants a direct answer + next action ---
-        print(f"   - Handling intent: '{intent}'. Generating direct answer and next action.")
-        
-        # Input dictionary now correctly includes conversational memory.
-        ai_input = {
-            "user_query": state.get("user_query", ""),
-            "conversation_summary": conversation_summary, # CORRECTLY ADDED
-            "conversation_window": conversation_window,   # CORRECTLY ADDED
-            "solutions_context": designs,
-            "product_metadata": product_metadata,
-            "previous_solution_designs": previous_solution_designs,
-            "users_count":users_count,
-        }
+    final_answer = ai_message.question_for_refinement.strip()
+    print(f"✅ Generated final answer: {final_answer}")
+    return {"final_response": final_answer}
 
-        full_chain = nba_prompt_qa | chain
-        ai_message = full_chain.invoke(ai_input)
 
-        final_answer = ai_message.question_for_refinement.strip()
-        print(f"✅ Generated final answer: {final_answer}")
-        return {"final_response": final_answer}
+def nba_agent_node(state: AgentState) -> dict:
+    """
+    Agent that generates intelligent questions to refine a quote
+    or provides a direct answer and next best action for a user question.
+    """
+    print("\n🤖 [NBA Agent] Deciding next best action…")
+    intent, full_chain, ai_input = _prepare_nba_call(state)
+    return _finish_nba(intent, full_chain.invoke(ai_input))
+
+
+async def nba_agent_node_async(state: AgentState) -> dict:
+    """Versão async do NBA Agent (`ainvoke`)."""
+    print("\n🤖 [NBA Agent] Deciding next best action…")
+    intent, full_chain, ai_input = _prepare_nba_call(state)
+    return _finish_nba(intent, await full_chain.ainvoke(ai_input))
 
 # -------------------- ROUTER --------------------
-# A função route_after_orch não é mais necessária, pois a conexão é direta.
+def route_after_orch(state: AgentState) -> str:
+    """Revisão aplicada localmente vai direto para o pricing (sem retrieval, designer ou NBA)."""
+    return "price" if state.get("local_revision") else "context_collector"
+
+def route_after_price(state: AgentState) -> str:
+    """Depois do pricing o NBA sugere o próximo passo; a revisão local vai direto para o synth."""
+    return "synth" if state.get("local_revision") else "nba_agent"
 
 def route_after_collector(state: AgentState) -> str:
     """
@@ -3207,52 +3272,124 @@ def route_after_collector(state: AgentState) -> str:
         return "llm_designer"
 
 # -------------------- GRAPH ---------------------
-workflow = StateGraph(AgentState)
-
-# 1. Definição dos nós
-print("Definindo nós do workflow...")
-workflow.add_node("orch", orchestrator_node)
-workflow.add_node("context_collector", context_collector_node)
-workflow.add_node("llm_designer", llm_designer_node)
-workflow.add_node("price", pricing_agent_node)
-workflow.add_node("nba_agent", nba_agent_node)
-workflow.add_node("synth", synthesize_node)
-
-# 2. Ponto de entrada
-workflow.set_entry_point("orch")
-
-# 3. Roteamento INCONDICIONAL do Orchestrator para o Context Collector
-# Esta é a correção principal: Usamos add_edge para uma conexão direta e obrigatória.
-workflow.add_edge("orch", "context_collector")
-
-# 4. Roteamento CONDICIONAL após o Context Collector
-# Aqui sim, o uso de add_conditional_edges está correto, pois o caminho bifurca.
-workflow.add_conditional_edges(
-    "context_collector",
-    route_after_collector,
-    {
-        "llm_designer": "llm_designer", # Se a função retornar "llm_designer", vai para este nó
-        "nba_agent": "nba_agent"       # Se a função retornar "nba_agent", vai para este nó
-    }
-)
+def _node(name, func, afunc=None):
+    """
+    Nó com as duas variantes: `app.invoke` usa `func`, `app.ainvoke` usa `afunc`.
+    Nós só-sync (price, synth) o LangGraph roda num executor quando em `ainvoke`.
+    Ambas as variantes passam pelo span de telemetria do nó.
+    """
+    func = telemetry.instrument_node(name, func)
+    if not afunc:
+        return func
+    return RunnableLambda(func, afunc=telemetry.instrument_node(name, afunc))
+
+
+def build_workflow() -> StateGraph:
+    """Monta o StateGraph (nós + arestas); `get_app()` compila uma única vez."""
+    workflow = StateGraph(AgentState)
+
+    # 1. Definição dos nós
+    print("Definindo nós do workflow...")
+    workflow.add_node("orch", _node("orch", orchestrator_node, orchestrator_node_async))
+    workflow.add_node("context_collector", _node("context_collector", context_collector_node, context_collector_node_async))
+    workflow.add_node("llm_designer", _node("llm_designer", llm_designer_node, llm_designer_node_async))
+    workflow.add_node("price", _node("price", pricing_agent_node))
+    workflow.add_node("nba_agent", _node("nba_agent", nba_agent_node, nba_agent_node_async))
+    workflow.add_node("synth", _node("synth", synthesize_node))
+
+    # 2. Ponto de entrada
+    workflow.set_entry_point("orch")
+
+    # 3. Roteamento do Orchestrator: Context Collector, ou direto para o pricing
+    # quando a revisão foi aplicada localmente (orch -> price -> synth, sem NBA).
+    workflow.add_conditional_edges(
+        "orch",
+        route_after_orch,
+        {
+            "context_collector": "context_collector",
+            "price": "price",
+        }
+    )
+
+    # 4. Roteamento CONDICIONAL após o Context Collector
+    # Aqui sim, o uso de add_conditional_edges está correto, pois o caminho bifurca.
+    workflow.add_conditional_edges(
+        "context_collector",
+        route_after_collector,
+        {
+            "llm_designer": "llm_designer", # Se a função retornar "llm_designer", vai para este nó
+            "nba_agent": "nba_agent"       # Se a função retornar "nba_agent", vai para este nó
+        }
+    )
+
+    # 5. Definição do fluxo principal (Quote / Revision)
+    # O NBA vem depois do pricing: a pergunta de refinamento usa as quantidades
+    # que o pricing gravou nos designs.
+    workflow.add_edge("llm_designer", "price")
+    workflow.add_conditional_edges(
+        "price",
+        route_after_price,
+        {
+            "nba_agent": "nba_agent",
+            "synth": "synth",
+        }
+    )
 
-# 5. Definição do fluxo principal (Quote / Revision)
-# Este é o caminho longo, que começa no designer.
-workflow.add_edge("llm_designer", "price")
-workflow.add_edge("price", "nba_agent")
+    # 6. Conexão para o nó final de síntese
+    # Ambos os caminhos (o curto de 'question' e o longo de 'quote') convergem aqui.
+    workflow.add_edge("nba_agent", "synth")
 
-# 6. Conexão para o nó final de síntese
-# Ambos os caminhos (o curto de 'question' e o longo de 'quote') convergem aqui.
-# O nba_agent sempre levará para a síntese.
-workflow.add_edge("nba_agent", "synth")
+    # 7. Nó final do grafo
+    # A síntese é o último passo antes de terminar o fluxo.
+    workflow.add_edge("synth", END)
 
-# 7. Nó final do grafo
-# A síntese é o último passo antes de terminar o fluxo.
-workflow.add_edge("synth", END)
+    return workflow
+
+
+@lru_cache(maxsize=1)
+def get_app():
+    """Grafo compilado, construído no primeiro uso (ou no warm_up)."""
+    # 8. Compilação do grafo
+    compiled = build_workflow().compile()
+    print("\n✅ LangGraph workflow compilado com sucesso!")
+    print("   - Rota 'question': orch -> context_collector -> nba_agent -> synth -> END")
+    print("   - Rota 'quote'/'revision': orch -> context_collector -> llm_designer -> price -> nba_agent -> synth -> END")
+    print("   - Revisão local: orch -> price -> synth -> END")
+    return compiled
+
+
+def warm_up() -> float:
+    """
+    Constrói tudo o que o primeiro turno pagaria: clientes LLM, chains estruturadas,
+    grafo compilado, catálogo e índices do retriever. Retorna a duração em segundos.
+    """
+    t0 = time.perf_counter()
+    for name in LLM_NAMES:
+        get_llm(name)
+    get_structured_llm("your_llm_instance", QuoteScenarios)
+    get_structured_llm("llm_nba", NBAOutput, method=None, logprobs=True)
+    get_app()
+    load_catalog()
+    load_indices()
+    elapsed = time.perf_counter() - t0
+    logger.info(f"[Warm-up] Engine ready in {elapsed:.2f}s")
+    return elapsed
+
+
+# Atributos "legados" do módulo, resolvidos sob demanda:
+# `from ai_engine.app.core.graph import app` continua funcionando (compila no acesso).
+_LAZY_CHAINS = {
+    "orchestrator_agent": lambda: orchestrator_prompt | get_structured_llm("llm", AgentRoutingDecision),
+    "three_designs_agent": lambda: three_scenarios_prompt | get_structured_llm("llm_creative", ThreeScenarios),
+    "design_agent": lambda: design_prompt | get_structured_llm("llm_creative", SolutionDesign),
+}
 
-# 8. Compilação do grafo
-app = workflow.compile()
-print("\n✅ LangGraph workflow compilado com sucesso!")
-print("   - Rota 'question': orch -> context_collector -> nba_agent -> synth -> END")
-print("   - Rota 'quote'/'revision': orch -> context_collector -> llm_designer -> price -> nba_agent -> synth -> END")
 
+def __getattr__(name: str):
+    if name == "app":
+        return get_app()
+    if name in LLM_NAMES:
+        return get_llm(name)
+    if name in _LAZY_CHAINS:
+        return _LAZY_CHAINS[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,57 +1,283 @@
 # services/ai_engine/app/core/memory.py
-from typing import List, Optional, Any
-import json
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Any, Tuple
+import asyncio
+import os
+import threading
+import weakref
 import redis
 
+from ai_engine.app.core import telemetry
+
+from ai_engine.app.core.serialization import dumps, loads
+from ai_engine.app.core.state_codec import decode_state, encode_state
+
 DEFAULT_WINDOW_TURNS = 8
 SUMMARY_KEY = "summary"
+COUNT_KEY = "msg_count"  # total de mensagens da sessão (a lista é podada, o contador não)
+SUMMARIZED_KEY = "summarized_upto"  # msg_count já dobrado no summary (marca d'água do summarizer)
+
+STATE_VER_KEY = "state_ver"  # versão do state (sequência global, monotônica mesmo após reset/TTL)
+
+# Teto da lista de mensagens: o que passa disso já foi (ou seria) dobrado no summary.
+HISTORY_MAX_MESSAGES = int(os.getenv("CHAT_HISTORY_MAX_MESSAGES", "200"))
+
+
+# ---- pool de conexões por processo ----
+# Um ConnectionPool por URL, compartilhado por todas as instâncias de ChatMemory
+# (antes cada instância abria o próprio pool/conexão com redis.from_url).
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "64"))
+
+_POOLS: Dict[str, redis.ConnectionPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_redis(redis_url: str) -> redis.Redis:
+    """Cliente Redis sobre o pool compartilhado do processo para `redis_url`."""
+    pool = _POOLS.get(redis_url)
+    if pool is None:
+        with _POOLS_LOCK:
+            pool = _POOLS.get(redis_url)
+            if pool is None:
+                pool = redis.ConnectionPool.from_url(redis_url, max_connections=REDIS_MAX_CONNECTIONS)
+                _POOLS[redis_url] = pool
+    return redis.Redis(connection_pool=pool)
 
 
-try:
-    from pydantic import BaseModel  # pydantic v1/v2
-except Exception:
-    BaseModel = tuple()  # fallback
+# ---- cache em processo do state (LRU com version stamp) ----
+# Guarda o blob codificado (state_codec) + versão por sessão. Na leitura o Redis
+# só devolve o blob se a versão mudou (script abaixo, dentro do mesmo pipeline);
+# no hit o blob local é decodificado, então cada chamador recebe objetos novos.
+# Escrita é write-through: quem acabou de gravar não relê o state.
+STATE_CACHE_SIZE = int(os.getenv("STATE_CACHE_SIZE", "512"))  # 0 desliga
+STATE_SEQ_KEY = "cqa:chat:state_seq"
 
-def _to_jsonable(obj):
-    """Converts objects to something JSON serializable."""
-    from pydantic import BaseModel
+_LOAD_STATE_LUA = """
+local v = redis.call('HGET', KEYS[1], ARGV[1])
+if v and v == ARGV[2] then return {v} end
+return {v or false, redis.call('HGET', KEYS[1], 'state') or false}
+"""
 
-    # BaseModel → dict
-    if isinstance(obj, BaseModel):
-        return obj.dict()
+_SAVE_STATE_LUA = """
+local v = redis.call('INCR', KEYS[2])
+redis.call('HSET', KEYS[1], 'state', ARGV[2], ARGV[1], v)
+return v
+"""
 
-    # dict → recursivo
-    elif isinstance(obj, dict):
-        return {k: _to_jsonable(v) for k, v in obj.items()}
+# Summarizer: leitura e escrita atômicas (cada uma um script). A lista é podada,
+# então a mensagem de índice absoluto i (0..msg_count-1) está na posição
+# i - (msg_count - LLEN) da lista; as que faltam resumir são [summarized_upto, msg_count).
+_UNSUMMARIZED_LUA = """
+local meta = redis.call('HMGET', KEYS[1], 'summary', 'summarized_upto', 'msg_count')
+local upto = tonumber(meta[2]) or 0
+local count = tonumber(meta[3]) or 0
+local msgs = {}
+if count > upto then
+  local first = count - redis.call('LLEN', KEYS[2])
+  msgs = redis.call('LRANGE', KEYS[2], math.max(upto - first, 0), -1)
+end
+return {meta[1] or '', upto, count, msgs}
+"""
 
-    # list/tuple → recursivo
-    elif isinstance(obj, list):
-        return [_to_jsonable(v) for v in obj]
-    elif isinstance(obj, tuple):
-        return tuple(_to_jsonable(v) for v in obj)
+_APPLY_SUMMARY_LUA = """
+local upto = tonumber(ARGV[2])
+if (tonumber(redis.call('HGET', KEYS[1], 'summarized_upto')) or 0) > upto then
+  return 0
+end
+redis.call('HSET', KEYS[1], 'summary', ARGV[1], 'summarized_upto', upto)
+local count = tonumber(redis.call('HGET', KEYS[1], 'msg_count')) or 0
+local keep = tonumber(ARGV[3]) + math.max(count - upto, 0)
+if keep > 0 then
+  redis.call('LTRIM', KEYS[2], -keep, -1)
+else
+  redis.call('DEL', KEYS[2])
+end
+local ttl = tonumber(ARGV[4])
+if ttl > 0 then
+  redis.call('EXPIRE', KEYS[1], ttl)
+  redis.call('EXPIRE', KEYS[2], ttl)
+end
+return 1
+"""
 
-    # None, str, int, float, bool → mantêm
-    elif obj is None or isinstance(obj, (str, int, float, bool)):
-        return obj
 
-    # Caso específico para RevisionRequest
-    elif obj.__class__.__name__ == "RevisionRequest":
-        return obj.__dict__  # ou obj.dict() se for BaseModel
+class StateCache:
+    """LRU thread-safe: chave do meta hash -> (versão, blob)."""
 
-    # Fallback: converter para str (não recomendado, mas impede crash)
-    else:
-        return str(obj)
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, Tuple[bytes, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
 
+    def get(self, key: str) -> Optional[Tuple[bytes, bytes]]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
 
+    def put(self, key: str, version, blob: bytes) -> None:
+        if self.maxsize <= 0 or version is None:
+            return
+        version = version if isinstance(version, bytes) else str(version).encode()
+        with self._lock:
+            self._data[key] = (version, blob)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
 
+    def discard(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
 
-class ChatMemory:
-    def __init__(self, redis_url: str, session_id: str, prefix: str = "cqa:chat", ttl_seconds: Optional[int] = 300):
-        self.r = redis.from_url(redis_url)
+
+STATE_CACHE = StateCache(STATE_CACHE_SIZE)
+
+
+class LoadedTurn(NamedTuple):
+    state: dict
+    messages: List[dict]
+    summary: str
+    msg_count: int
+    summarized_upto: int
+
+
+class _MemoryKeys:
+    """Chaves, TTL e os comandos de pipeline comuns a ChatMemory e AsyncChatMemory."""
+
+    def __init__(self, session_id: str, prefix: str, ttl_seconds: Optional[int]):
+        self.session_id = session_id
         self.key_msgs = f"{prefix}:{session_id}:msgs"
         self.key_meta = f"{prefix}:{session_id}:meta"
         self.ttl = ttl_seconds
 
+    def _expire(self, pipe) -> None:
+        if self.ttl:
+            pipe.expire(self.key_msgs, self.ttl)
+            pipe.expire(self.key_meta, self.ttl)
+
+    def _append(self, pipe, message: dict) -> None:
+        """RPUSH + LTRIM (teto) + HINCRBY do contador, dentro do pipeline do chamador."""
+        pipe.rpush(self.key_msgs, dumps(message))
+        pipe.ltrim(self.key_msgs, -HISTORY_MAX_MESSAGES, -1)
+        pipe.hincrby(self.key_meta, COUNT_KEY, 1)
+
+    # ---- state versionado + cache ----
+    def _queue_get_state(self, pipe) -> Optional[Tuple[bytes, bytes]]:
+        """Enfileira a leitura condicional do state; retorna a entrada do cache usada."""
+        cached = STATE_CACHE.get(self.key_meta)
+        pipe.eval(_LOAD_STATE_LUA, 1, self.key_meta, STATE_VER_KEY, cached[0] if cached else "")
+        return cached
+
+    def _parse_state(self, reply, cached: Optional[Tuple[bytes, bytes]]) -> dict:
+        if len(reply) == 1 and cached is not None:  # versão igual: vale o blob local
+            telemetry.record_cache("session_state", True)
+            return decode_state(cached[1])
+        telemetry.record_cache("session_state", False)
+        version, blob = (list(reply) + [None, None])[:2]
+        if blob and version:
+            STATE_CACHE.put(self.key_meta, version, blob)
+        else:  # sessão nova/expirada ou state legado sem versão
+            STATE_CACHE.discard(self.key_meta)
+        return decode_state(blob)
+
+    def _queue_put_state(self, pipe, state: dict) -> bytes:
+        """Enfileira HSET state + nova versão (sequência global); retorna o blob."""
+        blob = encode_state(state)
+        pipe.eval(_SAVE_STATE_LUA, 2, self.key_meta, STATE_SEQ_KEY, STATE_VER_KEY, blob)
+        return blob
+
+    # ---- turno ----
+    def _queue_load_turn(self, pipe, user_text: str, window: int):
+        self._append(pipe, {"role": "user", "content": user_text})
+        self._expire(pipe)
+        pipe.lrange(self.key_msgs, -max(1, window), -1)
+        pipe.hmget(self.key_meta, SUMMARY_KEY, SUMMARIZED_KEY)
+        return self._queue_get_state(pipe)
+
+    def _parse_load_turn(self, res: list, cached) -> "LoadedTurn":
+        raw_msgs, (raw_summary, raw_upto), state_reply = res[-3], res[-2], res[-1]
+        return LoadedTurn(
+            state=self._parse_state(state_reply, cached),
+            messages=_decode_messages(raw_msgs),
+            summary=raw_summary.decode() if raw_summary else "",
+            msg_count=int(res[2]),  # resultado do HINCRBY
+            summarized_upto=int(raw_upto) if raw_upto else 0,
+        )
+
+    def _queue_save_turn(self, pipe, state: dict, ai_text: Optional[str]) -> bytes:
+        blob = self._queue_put_state(pipe, state)
+        if ai_text is not None:
+            self._append(pipe, {"role": "assistant", "content": ai_text})
+        self._expire(pipe)
+        return blob
+
+    def _queue_set_summary(self, pipe, text: str, keep_last: Optional[int]) -> None:
+        pipe.hset(self.key_meta, SUMMARY_KEY, text or "")
+        if keep_last:
+            pipe.ltrim(self.key_msgs, -keep_last, -1)
+        self._expire(pipe)
+
+    def _queue_set_state(self, pipe, state: dict) -> bytes:
+        blob = self._queue_put_state(pipe, state)
+        if self.ttl:
+            pipe.expire(self.key_meta, self.ttl)
+        return blob
+
+
+def _decode_messages(raw) -> List[dict]:
+    return [loads(x) for x in raw or []]
+
+
+def _parse_progress(raw_summary, raw_upto, raw_count) -> Tuple[str, int, int]:
+    return (
+        raw_summary.decode() if raw_summary else "",
+        int(raw_upto) if raw_upto else 0,
+        int(raw_count) if raw_count else 0,
+    )
+
+
+class ChatMemory(_MemoryKeys):
+    """
+    Histórico (lista) + meta (hash com state/summary/msg_count) de uma sessão no Redis.
+    Cada operação é um único round trip (pipeline); `load_turn`/`save_turn`
+    cobrem um turno inteiro em duas idas ao Redis.
+
+    A lista é limitada (LTRIM a HISTORY_MAX_MESSAGES, e à janela quando o summary
+    é atualizado) e o turno lê só a cauda (LRANGE -k -1): o custo por turno não
+    cresce com o tamanho da sessão. `msg_count` guarda o total real de mensagens.
+
+    O state passa pelo STATE_CACHE: turnos seguidos da mesma sessão no mesmo
+    worker não trazem o blob do Redis, só conferem a versão.
+    """
+
+    def __init__(self, redis_url: str, session_id: str, prefix: str = "cqa:chat", ttl_seconds: Optional[int] = 300,
+                 client: Optional[redis.Redis] = None):
+        super().__init__(session_id, prefix, ttl_seconds)
+        self.r = client if client is not None else get_redis(redis_url)
+
+    # ---- turno completo: 1 round trip para carregar, 1 para salvar ----
+    def load_turn(self, user_text: str, window: int = DEFAULT_WINDOW_TURNS) -> LoadedTurn:
+        """
+        Registra a mensagem do usuário e carrega state, as últimas `window` mensagens
+        (já com a nova), summary, o total de mensagens e a marca d'água do summary.
+        RPUSH + LTRIM + HINCRBY + EXPIRE + LRANGE -k -1 + HMGET num só pipeline.
+        """
+        pipe = self.r.pipeline(transaction=True)
+        cached = self._queue_load_turn(pipe, user_text, window)
+        return self._parse_load_turn(pipe.execute(), cached)
+
+    def save_turn(self, state: dict, ai_text: Optional[str] = None) -> dict:
+        """
+        Grava o state (state_codec) e a resposta do assistente (HSET + RPUSH + EXPIRE).
+        Retorna o próprio `state`: quem precisa dele não relê o Redis.
+        """
+        pipe = self.r.pipeline(transaction=True)
+        blob = self._queue_save_turn(pipe, state, ai_text)
+        STATE_CACHE.put(self.key_meta, pipe.execute()[0], blob)  # write-through
+        return state
+
+    # ---- operações avulsas (cada uma também é um único round trip) ----
     def add_user(self, text: str):
         self._push({"role": "user", "content": text})
 
@@ -59,39 +285,159 @@ class ChatMemory:
         self._push({"role": "assistant", "content": text})
 
     def _push(self, message: dict):
-        self.r.rpush(self.key_msgs, json.dumps(message))
-        if self.ttl:
-            self.r.expire(self.key_msgs, self.ttl)
-            self.r.expire(self.key_meta, self.ttl)
+        pipe = self.r.pipeline(transaction=True)
+        self._append(pipe, message)
+        self._expire(pipe)
+        pipe.execute()
 
     def get_messages(self) -> List[dict]:
-        raw = self.r.lrange(self.key_msgs, 0, -1) or []
-        return [json.loads(x) for x in raw]
+        return _decode_messages(self.r.lrange(self.key_msgs, 0, -1))
 
     def get_window(self, k: int = DEFAULT_WINDOW_TURNS) -> List[dict]:
-        msgs = self.get_messages()
         # ‘turno’ = par (user, assistant). k aqui = número de mensagens, é suficiente.
-        return msgs[-k:]
+        return _decode_messages(self.r.lrange(self.key_msgs, -max(1, k), -1))
+
+    def message_count(self) -> int:
+        """Total de mensagens já registradas na sessão (inclui as podadas da lista)."""
+        raw = self.r.hget(self.key_meta, COUNT_KEY)
+        return int(raw) if raw else 0
 
     def get_summary(self) -> str:
-        return self.r.hget(self.key_meta, SUMMARY_KEY).decode() if self.r.hexists(self.key_meta, SUMMARY_KEY) else ""
+        raw = self.r.hget(self.key_meta, SUMMARY_KEY)
+        return raw.decode() if raw else ""
 
-    def set_summary(self, text: str):
-        self.r.hset(self.key_meta, SUMMARY_KEY, text or "")
-        if self.ttl:
-            self.r.expire(self.key_meta, self.ttl)
+    def set_summary(self, text: str, keep_last: Optional[int] = None):
+        """
+        Grava o summary. Com `keep_last`, poda a lista para as últimas `keep_last`
+        mensagens: as anteriores já estão dobradas no summary.
+        """
+        pipe = self.r.pipeline(transaction=True)
+        self._queue_set_summary(pipe, text, keep_last)
+        pipe.execute()
+
+    # ---- summarizer em background (app/core/summarizer.py) ----
+    def summary_progress(self) -> Tuple[str, int, int]:
+        """(summary, summarized_upto, msg_count) num único HMGET."""
+        return _parse_progress(*self.r.hmget(self.key_meta, SUMMARY_KEY, SUMMARIZED_KEY, COUNT_KEY))
+
+    def unsummarized(self) -> Tuple[str, int, List[dict]]:
+        """
+        (summary, msg_count, mensagens ainda fora do summary) numa leitura atômica:
+        as mensagens vão do índice absoluto `summarized_upto` até `msg_count`, nem
+        uma a mais (as que chegarem depois ficam para o próximo job) nem uma a menos.
+        """
+        summary, _, count, raw = self.r.eval(_UNSUMMARIZED_LUA, 2, self.key_meta, self.key_msgs)
+        return (summary.decode() if summary else ""), int(count), _decode_messages(raw)
+
+    def apply_summary(self, text: str, upto: int, keep_last: int) -> bool:
+        """
+        Grava o summary incremental, avança `summarized_upto` para `upto` e poda a
+        lista mantendo `keep_last` mensagens resumidas + tudo o que chegou depois
+        de `upto`, num único script. Não faz nada (False) se outro job já passou de `upto`.
+        """
+        return bool(self.r.eval(_APPLY_SUMMARY_LUA, 2, self.key_meta, self.key_msgs,
+                                text or "", upto, max(0, keep_last), self.ttl or 0))
 
     def set_state(self, state: dict):
-        safe = _to_jsonable(state)
-        self.r.hset(self.key_meta, "state", json.dumps(safe))
-        if self.ttl:
-            self.r.expire(self.key_meta, self.ttl)
+        pipe = self.r.pipeline(transaction=False)
+        blob = self._queue_set_state(pipe, state)
+        STATE_CACHE.put(self.key_meta, pipe.execute()[0], blob)
 
     def get_state(self) -> dict:
-        raw = self.r.hget(self.key_meta, "state")
-        return json.loads(raw) if raw else {}
+        pipe = self.r.pipeline(transaction=False)
+        cached = self._queue_get_state(pipe)
+        return self._parse_state(pipe.execute()[0], cached)
 
     def reset_state(self):
         """Remove todas as mensagens e meta info para começar do zero"""
-        self.r.delete(self.key_msgs)
-        self.r.delete(self.key_meta)
+        STATE_CACHE.discard(self.key_meta)
+        self.r.delete(self.key_msgs, self.key_meta)
+
+
+# ---- versão asyncio (redis.asyncio) para o caminho async do turno ----
+# Pools asyncio ficam presos ao event loop que os criou: um por (loop, URL).
+_ASYNC_POOLS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+
+
+def get_async_redis(redis_url: str):
+    """Cliente redis.asyncio sobre o pool do event loop corrente para `redis_url`."""
+    import redis.asyncio as aioredis
+
+    pools = _ASYNC_POOLS.setdefault(asyncio.get_running_loop(), {})
+    pool = pools.get(redis_url)
+    if pool is None:
+        pool = aioredis.ConnectionPool.from_url(redis_url, max_connections=REDIS_MAX_CONNECTIONS)
+        pools[redis_url] = pool
+    return aioredis.Redis(connection_pool=pool)
+
+
+class AsyncChatMemory(_MemoryKeys):
+    """
+    Mesma interface e mesmos comandos da ChatMemory, sobre redis.asyncio: o turno
+    async carrega e persiste a memória no event loop, sem ocupar threads do executor.
+    Deve ser criada dentro do event loop que vai usá-la.
+    """
+
+    def __init__(self, redis_url: str, session_id: str, prefix: str = "cqa:chat", ttl_seconds: Optional[int] = 300,
+                 client=None):
+        super().__init__(session_id, prefix, ttl_seconds)
+        self.r = client if client is not None else get_async_redis(redis_url)
+
+    async def load_turn(self, user_text: str, window: int = DEFAULT_WINDOW_TURNS) -> LoadedTurn:
+        pipe = self.r.pipeline(transaction=True)
+        cached = self._queue_load_turn(pipe, user_text, window)
+        return self._parse_load_turn(await pipe.execute(), cached)
+
+    async def save_turn(self, state: dict, ai_text: Optional[str] = None) -> dict:
+        pipe = self.r.pipeline(transaction=True)
+        blob = self._queue_save_turn(pipe, state, ai_text)
+        STATE_CACHE.put(self.key_meta, (await pipe.execute())[0], blob)
+        return state
+
+    async def add_user(self, text: str):
+        await self._push({"role": "user", "content": text})
+
+    async def add_ai(self, text: str):
+        await self._push({"role": "assistant", "content": text})
+
+    async def _push(self, message: dict):
+        pipe = self.r.pipeline(transaction=True)
+        self._append(pipe, message)
+        self._expire(pipe)
+        await pipe.execute()
+
+    async def get_messages(self) -> List[dict]:
+        return _decode_messages(await self.r.lrange(self.key_msgs, 0, -1))
+
+    async def get_window(self, k: int = DEFAULT_WINDOW_TURNS) -> List[dict]:
+        return _decode_messages(await self.r.lrange(self.key_msgs, -max(1, k), -1))
+
+    async def message_count(self) -> int:
+        raw = await self.r.hget(self.key_meta, COUNT_KEY)
+        return int(raw) if raw else 0
+
+    async def get_summary(self) -> str:
+        raw = await self.r.hget(self.key_meta, SUMMARY_KEY)
+        return raw.decode() if raw else ""
+
+    async def set_summary(self, text: str, keep_last: Optional[int] = None):
+        pipe = self.r.pipeline(transaction=True)
+        self._queue_set_summary(pipe, text, keep_last)
+        await pipe.execute()
+
+    async def summary_progress(self) -> Tuple[str, int, int]:
+        return _parse_progress(*await self.r.hmget(self.key_meta, SUMMARY_KEY, SUMMARIZED_KEY, COUNT_KEY))
+
+    async def set_state(self, state: dict):
+        pipe = self.r.pipeline(transaction=False)
+        blob = self._queue_set_state(pipe, state)
+        STATE_CACHE.put(self.key_meta, (await pipe.execute())[0], blob)
+
+    async def get_state(self) -> dict:
+        pipe = self.r.pipeline(transaction=False)
+        cached = self._queue_get_state(pipe)
+        return self._parse_state((await pipe.execute())[0], cached)
+
+    async def reset_state(self):
+        STATE_CACHE.discard(self.key_meta)
+        await self.r.delete(self.key_msgs, self.key_meta)
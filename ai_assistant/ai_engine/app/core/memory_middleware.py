@@ -1,5 +1,5 @@
 # services/ai_engine/app/gateway/memory_middleware.py
-from ai_engine.app.core.memory import ChatMemory
+from ai_engine.app.core.memory import ChatMemory, DEFAULT_WINDOW_TURNS
 
 import ai_engine.settings as s
 
@@ -8,22 +8,19 @@ def with_memory(handler):
         session_id = request_json.get("session_id") or "default-session"
         memory = ChatMemory(redis_url=s.REDIS_URL, session_id=session_id)
 
-        # load persisted state + window
-        state = memory.get_state() or {}
-        state["user_query"] = request_json.get("message","")
+        # add user msg to history + load persisted state + window (1 round trip)
+        user_query = request_json.get("message","")
+        turn = memory.load_turn(user_query, window=DEFAULT_WINDOW_TURNS + 1)
+        state, messages = turn.state, turn.messages
+        state["user_query"] = user_query
         state["session_id"] = session_id
-        state["chat_window"] = memory.get_window()  # optional, if you want to feed LLM
-
-        # add user msg to history now
-        memory.add_user(state["user_query"])
+        state["chat_window"] = messages[:-1]  # optional, if you want to feed LLM (sem a msg atual)
 
         # run the graph/handler
         response = handler(state)
 
-        # persist state + assistant msg (if any)
-        memory.set_state(response.get("state", state))
-        if "final_message" in response:
-            memory.add_ai(response["final_message"])
+        # persist state + assistant msg (if any) (1 round trip)
+        memory.save_turn(response.get("state", state), response.get("final_message"))
 
         return response
     return wrapped
@@ -0,0 +1,238 @@
+# services/ai_engine/app/core/scheduler.py
+"""
+Admissão e ordenação dos turnos do grafo.
+
+- `turn_max_concurrency` turnos rodam ao mesmo tempo; até `turn_queue_size`
+  esperam. Passou disso o turno é recusado na hora com 429 (backpressure em vez
+  de fila invisível e latência de cauda imprevisível).
+- Turnos da mesma sessão rodam em FIFO (nunca dois ao mesmo tempo sobre o mesmo
+  state). Com `turn_cancel_superseded`, um turno que ainda está esperando é
+  descartado (409) quando chega uma mensagem mais nova da mesma sessão.
+- `cancel(session_id)` aborta o turno que está rodando (e descarta os que
+  esperam) quando o cliente avisa que uma mensagem mais nova ganhou: o grafo
+  para no próximo await e o turno responde 409 `turn_cancelled`.
+- Métricas: profundidade da fila, turnos rodando, tempo de espera e recusas.
+
+Com vários workers (ai_engine.app.serve, TURN_COORDINATION=redis) a ordem por
+sessão, o "superseded" e o `cancel` valem entre processos: ver
+app/core/turn_coordination.py.
+
+Os nós síncronos do grafo rodam no executor default do loop, que o servidor
+dimensiona com `turn_graph_threads` (ver `install_graph_executor`).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, TypeVar
+
+from ai_engine.app.core import telemetry
+from ai_engine.app.core.config import settings
+from ai_engine.app.core.exceptions import AppError
+from ai_engine.app.core.turn_coordination import RedisTurnCoordinator, coordinator_from_settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass
+class _Lane:
+    """Fila de uma sessão: asyncio.Lock é FIFO; `latest` é o último ticket emitido."""
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    latest: int = 0
+    users: int = 0
+    running: Optional["asyncio.Task"] = None
+    cancelled: bool = False
+    # ticket compartilhado (Redis) do turno em execução; 0 sem coordenação
+    running_ticket: int = 0
+
+
+class TurnScheduler:
+    def __init__(self, max_running: int, max_queued: int, cancel_superseded: bool = True,
+                 coordinator: Optional[RedisTurnCoordinator] = None) -> None:
+        self.max_running = max(1, max_running)
+        self.max_queued = max(0, max_queued)
+        self.cancel_superseded = cancel_superseded
+        self.coordinator = coordinator
+        self._slots = asyncio.Semaphore(self.max_running)
+        self._lanes: Dict[str, _Lane] = {}
+        self._listener: Optional["asyncio.Task"] = None
+        self.waiting = 0
+        self.running = 0
+
+    async def start(self) -> None:
+        """Com coordenação, passa a ouvir os cancelamentos dos outros workers."""
+        if self.coordinator is not None and self._listener is None:
+            self._listener = asyncio.ensure_future(self.coordinator.listen(self._cancel_shared))
+
+    async def aclose(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    def _gauges(self) -> None:
+        telemetry.set_turn_queue(self.waiting, self.running)
+
+    async def run(self, session_id: str, turn: Callable[[], Awaitable[T]]) -> T:
+        """Executa `turn()` respeitando limite global, fila e ordem da sessão."""
+        if self.waiting >= self.max_queued and self.running >= self.max_running:
+            telemetry.record_turn_rejected("queue_full")
+            raise AppError(
+                "The assistant is busy, please retry in a moment.",
+                code="overloaded", status_code=429, headers={"Retry-After": "1"},
+            )
+
+        lane = self._lanes.setdefault(session_id, _Lane())
+        lane.latest += 1
+        lane.users += 1
+        ticket = lane.latest
+        enqueued = time.perf_counter()
+        self.waiting += 1
+        self._gauges()
+        admitted = False
+        try:
+            shared = await self._shared_ticket(session_id)
+            async with lane.lock, self._session_lease(session_id):
+                if self.cancel_superseded and (
+                    ticket != lane.latest or not await self._is_latest(session_id, shared)
+                ):
+                    telemetry.record_turn_rejected("superseded")
+                    raise AppError(
+                        "Superseded by a newer message in this session.",
+                        code="turn_superseded", status_code=409,
+                    )
+                async with self._slots:
+                    admitted = True
+                    self.waiting -= 1
+                    self.running += 1
+                    self._gauges()
+                    telemetry.observe_turn_wait(time.perf_counter() - enqueued)
+                    # task própria: `cancel()` aborta só o turno, não o request
+                    task = asyncio.ensure_future(turn())
+                    lane.running, lane.cancelled, lane.running_ticket = task, False, shared or 0
+                    try:
+                        return await task
+                    except asyncio.CancelledError:
+                        if not lane.cancelled or not task.cancelled():
+                            raise
+                        telemetry.record_turn_rejected("cancelled")
+                        raise AppError(
+                            "Cancelled by a newer message in this session.",
+                            code="turn_cancelled", status_code=409,
+                        )
+                    finally:
+                        lane.running, lane.running_ticket = None, 0
+                        self.running -= 1
+                        self._gauges()
+        finally:
+            if not admitted:
+                self.waiting -= 1
+                self._gauges()
+            lane.users -= 1
+            if lane.users == 0:
+                self._lanes.pop(session_id, None)
+
+    def cancel(self, session_id: str) -> bool:
+        """Aborta o turno em execução da sessão e descarta os que estão na fila."""
+        lane = self._lanes.get(session_id)
+        if lane is None:
+            return False
+        lane.latest += 1  # quem ainda espera vira "superseded" ao pegar o lock
+        return self._abort_running(lane)
+
+    async def cancel_everywhere(self, session_id: str) -> bool:
+        """`cancel` neste worker e, com coordenação, em qualquer worker que rode a sessão."""
+        cancelled = self.cancel(session_id)
+        if self.coordinator is None:
+            return cancelled
+        try:
+            return await self.coordinator.cancel(session_id) or cancelled
+        except Exception as e:
+            logger.warning(f"⚠️  [Turns] shared cancel failed for {session_id}: {e!r}")
+            return cancelled
+
+    def _cancel_shared(self, session_id: str, upto: int) -> None:
+        # só turnos anteriores ao cancelamento: a mensagem nova pode já estar rodando aqui
+        lane = self._lanes.get(session_id)
+        if lane is not None and 0 < lane.running_ticket <= upto:
+            self._abort_running(lane)
+
+    @staticmethod
+    def _abort_running(lane: _Lane) -> bool:
+        if lane.running is None or lane.running.done():
+            return False
+        lane.cancelled = True
+        lane.running.cancel()
+        return True
+
+    # ---- coordenação entre workers (no-op sem coordinator; Redis fora = só local) ----
+    async def _shared_ticket(self, session_id: str) -> Optional[int]:
+        if self.coordinator is None:
+            return None
+        try:
+            return await self.coordinator.ticket(session_id)
+        except Exception as e:
+            logger.warning(f"⚠️  [Turns] shared ticket failed for {session_id}: {e!r}")
+            return None
+
+    async def _is_latest(self, session_id: str, shared: Optional[int]) -> bool:
+        if self.coordinator is None or shared is None:
+            return True
+        try:
+            return await self.coordinator.is_latest(session_id, shared)
+        except Exception as e:
+            logger.warning(f"⚠️  [Turns] shared ticket check failed for {session_id}: {e!r}")
+            return True
+
+    @asynccontextmanager
+    async def _session_lease(self, session_id: str) -> AsyncIterator[None]:
+        if self.coordinator is None:
+            yield
+            return
+        lease = self.coordinator.lease(session_id)
+        try:
+            await lease.__aenter__()
+        except Exception as e:
+            logger.warning(f"⚠️  [Turns] session lease failed for {session_id}, running unleased: {e!r}")
+            yield
+            return
+        try:
+            yield
+        finally:
+            await lease.__aexit__(None, None, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "running": self.running,
+            "waiting": self.waiting,
+            "max_running": self.max_running,
+            "max_queued": self.max_queued,
+            "sessions": len(self._lanes),
+        }
+
+
+@lru_cache(maxsize=1)
+def get_turn_scheduler() -> TurnScheduler:
+    return TurnScheduler(
+        max_running=settings.turn_max_concurrency,
+        max_queued=settings.turn_queue_size,
+        cancel_superseded=settings.turn_cancel_superseded,
+        coordinator=coordinator_from_settings(settings.turn_coordination, settings.turn_lease_ttl_s),
+    )
+
+
+def install_graph_executor(loop: asyncio.AbstractEventLoop) -> ThreadPoolExecutor:
+    """Executor default dedicado (nós síncronos do grafo, to_thread do warm-up)."""
+    executor = ThreadPoolExecutor(max_workers=settings.turn_graph_threads, thread_name_prefix="graph")
+    loop.set_default_executor(executor)
+    return executor
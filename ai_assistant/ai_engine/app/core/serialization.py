@@ -0,0 +1,53 @@
+# services/ai_engine/app/core/serialization.py
+"""
+Camada única de JSON do engine (respostas HTTP e mensagens na ChatMemory).
+
+Com `orjson` instalado, `dumps`/`loads` usam ele (serializa direto para bytes,
+em C, sem o passe de `ensure_ascii`); sem ele, caem no `json` da stdlib com a
+mesma saída compacta em UTF-8. `FastJSONResponse` é a response class default do
+app: o FastAPI já entrega o `response_model` validado como dict/list e aqui só
+troca o `json.dumps` final.
+
+Os `json.dumps(..., indent=2)` do grafo ficam como estão: montam texto de prompt
+e trocar o encoder mudaria o que o LLM recebe.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # opcional: json da stdlib
+    orjson = None
+
+_ORJSON_OPTS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY) if orjson is not None else 0
+
+
+def _default(obj: Any) -> Any:
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if hasattr(obj, "dict"):
+        return obj.dict()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    return str(obj)
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTS)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def loads(raw: bytes | bytearray | str) -> Any:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,198 @@
+# services/ai_engine/app/core/singleflight.py
+"""
+Deduplicação de turnos idênticos (singleflight + replay por idempotency key).
+
+- Requests com a mesma chave que chegam enquanto o primeiro ainda roda esperam
+  a mesma execução e recebem o mesmo resultado (um grafo só, não N).
+- Resultados bem-sucedidos ficam `ttl_s` segundos na memória do processo e no
+  Redis (`cqa:idem:<chave>`): um retry que cai em outro worker do prefork, ou
+  chega depois que o primeiro terminou, recebe a resposta gravada.
+- Entre workers a execução também é uma só: quem vai rodar reivindica a chave
+  (`cqa:idem:<chave>:running`, SET NX com token); um retry que cai noutro
+  worker enquanto isso espera o resultado aparecer no Redis em vez de rodar o
+  grafo de novo (se a reivindicação sumir sem resultado, roda ele mesmo).
+- Erros não são guardados (o retry roda de novo). Se todos que esperam forem
+  cancelados, a execução compartilhada também é.
+
+A chave é `<sessão>:<Idempotency-Key>`, e a API manda como chave os ids das
+mensagens do cliente: o conteúdo nunca entra na chave (o mesmo texto numa
+mensagem nova roda de novo). É a única camada de deduplicação de turnos.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import secrets
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from ai_engine.app.core.config import settings
+from ai_engine.app.core.serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+IDEM_PREFIX = "cqa:idem"
+
+_RELEASE_CLAIM_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """Valores precisam ser serializáveis em JSON (são replicados no Redis)."""
+
+    def __init__(self, ttl_s: float, max_entries: int = 1024, redis_factory: Optional[Callable[[], Any]] = None,
+                 claim_ttl_s: float = 120.0, poll_s: float = 0.1) -> None:
+        self.ttl_s = ttl_s
+        self.max_entries = max(1, max_entries)
+        self.redis_factory = redis_factory
+        self.claim_ttl_s = claim_ttl_s
+        self.poll_s = poll_s
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._waiters: Dict[str, int] = {}
+        self._done: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.stats: Dict[str, int] = {"executed": 0, "joined": 0, "replayed": 0}
+
+    async def run(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, str]:
+        """Devolve (resultado, origem) com origem em executed | joined | replayed."""
+        fut = self._inflight.get(key)
+        if fut is None:
+            cached = self._local_get(key)
+            if cached is None:
+                cached = await self._redis_get(key)
+            if cached is not None:
+                self.stats["replayed"] += 1
+                return cached, "replayed"
+            fut = self._inflight.get(key)  # alguém pode ter começado durante o GET
+
+        source = "joined"
+        if fut is None:
+            fut = asyncio.ensure_future(self._execute(key, fn))
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda f: self._inflight.pop(key, None) if self._inflight.get(key) is f else None)
+            source = "executed"
+        self.stats[source] += 1
+
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            result, remote = await asyncio.shield(fut)
+            if remote and source == "executed":
+                # quem rodou foi outro worker: aqui foi só espera
+                self.stats["executed"] -= 1
+                self.stats["joined"] += 1
+                source = "joined"
+            return result, source
+        except asyncio.CancelledError:
+            if not fut.done() and self._waiters.get(key) == 1:
+                fut.cancel()
+            raise
+        finally:
+            left = self._waiters.get(key, 1) - 1
+            if left <= 0:
+                self._waiters.pop(key, None)
+            else:
+                self._waiters[key] = left
+
+    async def _execute(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """(resultado, True se veio de outro worker)."""
+        while True:
+            token = await self._redis_claim(key)
+            if token is not None:
+                break
+            result = await self._redis_wait(key)
+            if result is not None:
+                return result, True
+            # o outro worker falhou ou morreu: tenta reivindicar de novo
+        try:
+            return await self._run_and_store(key, fn), False
+        finally:
+            await self._redis_release(key, token)
+
+    async def _run_and_store(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        result = await fn()
+        if self.ttl_s > 0:
+            self._done[key] = (time.monotonic() + self.ttl_s, result)
+            self._done.move_to_end(key)
+            while len(self._done) > self.max_entries:
+                self._done.popitem(last=False)
+            await self._redis_set(key, result)
+        return result
+
+    def _local_get(self, key: str) -> Any:
+        hit = self._done.get(key)
+        if hit is None:
+            return None
+        if hit[0] <= time.monotonic():
+            self._done.pop(key, None)
+            return None
+        return hit[1]
+
+    async def _redis_claim(self, key: str) -> Optional[str]:
+        """Token da reivindicação, None se outro worker já roda a chave. Sem Redis, sempre roda."""
+        token = secrets.token_hex(16)
+        if self.redis_factory is None or self.ttl_s <= 0:
+            return token  # sem resultado replicado não há o que esperar
+        try:
+            ok = await self.redis_factory().set(
+                f"{IDEM_PREFIX}:{key}:running", token, nx=True, ex=max(1, int(self.claim_ttl_s)))
+        except Exception as e:
+            logger.warning(f"⚠️  [SingleFlight] Redis claim failed: {e!r}")
+            return token
+        return token if ok else None
+
+    async def _redis_release(self, key: str, token: str) -> None:
+        if self.redis_factory is None or self.ttl_s <= 0:
+            return
+        try:
+            await self.redis_factory().eval(_RELEASE_CLAIM_LUA, 1, f"{IDEM_PREFIX}:{key}:running", token)
+        except Exception as e:
+            logger.warning(f"⚠️  [SingleFlight] Redis claim release failed: {e!r}")
+
+    async def _redis_wait(self, key: str) -> Any:
+        """Espera o resultado de outro worker; None se a reivindicação acabou sem resultado."""
+        assert self.redis_factory is not None
+        while True:
+            try:
+                pipe = self.redis_factory().pipeline(transaction=False)
+                pipe.get(f"{IDEM_PREFIX}:{key}")
+                pipe.exists(f"{IDEM_PREFIX}:{key}:running")
+                raw, running = await pipe.execute()
+            except Exception as e:
+                logger.warning(f"⚠️  [SingleFlight] Redis wait failed: {e!r}")
+                return None
+            if raw:
+                return loads(raw)
+            if not running:
+                return None
+            await asyncio.sleep(self.poll_s)
+
+    async def _redis_get(self, key: str) -> Any:
+        if self.redis_factory is None or self.ttl_s <= 0:
+            return None
+        try:
+            raw = await self.redis_factory().get(f"{IDEM_PREFIX}:{key}")
+        except Exception as e:
+            logger.warning(f"⚠️  [SingleFlight] Redis GET failed: {e!r}")
+            return None
+        return loads(raw) if raw else None
+
+    async def _redis_set(self, key: str, result: Any) -> None:
+        if self.redis_factory is None:
+            return
+        try:
+            await self.redis_factory().set(f"{IDEM_PREFIX}:{key}", dumps(result), ex=max(1, int(self.ttl_s)))
+        except Exception as e:
+            logger.warning(f"⚠️  [SingleFlight] Redis SET failed: {e!r}")
+
+
+@lru_cache(maxsize=1)
+def get_turn_flights() -> SingleFlight:
+    import ai_engine.settings as s
+    from ai_engine.app.core.memory import get_async_redis
+
+    return SingleFlight(settings.turn_idempotency_ttl_s, redis_factory=lambda: get_async_redis(s.REDIS_URL))
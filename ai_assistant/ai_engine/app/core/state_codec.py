@@ -0,0 +1,146 @@
+# services/ai_engine/app/core/state_codec.py
+"""
+Codec do state persistido pela ChatMemory (campo "state" do hash meta).
+
+Formato binário versionado:  b"\\x00" + versão (1 byte) + flags (1 byte) + payload
+  - payload = msgpack; flag ZSTD → payload comprimido com zstd (só acima de
+    STATE_ZSTD_MIN_BYTES, abaixo disso a compressão não compensa).
+  - SolutionDesign / AgentRoutingDecision / RevisionRequest viajam como ExtType
+    tipados e voltam como objetos (sem o passe de `_to_jsonable` + reconstrução).
+
+Compatibilidade: JSON (o formato antigo) nunca começa com \\x00, então
+`decode_state` continua lendo states gravados antes do codec. Sem `msgpack`
+instalado, `encode_state` grava JSON; sem `zstandard`, grava sem compressão.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from dataclasses import asdict, is_dataclass
+from typing import Any, Callable, Dict, Tuple, Type
+
+from ai_engine.app.core.serialization import dumps, loads
+from ai_engine.app.schemas.models import AgentRoutingDecision, RevisionRequest, SolutionDesign
+
+try:
+    import msgpack
+except ImportError:  # opcional: sem o pacote, o state continua em JSON
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # opcional: msgpack sem compressão
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CODEC_VERSION = 1
+_MARKER = b"\x00"
+FLAG_ZSTD = 0x01
+STATE_ZSTD_MIN_BYTES = int(os.getenv("STATE_ZSTD_MIN_BYTES", "2048"))
+STATE_ZSTD_LEVEL = int(os.getenv("STATE_ZSTD_LEVEL", "3"))
+
+BINARY_ENABLED = msgpack is not None
+
+
+def _model_dump(obj: Any) -> dict:
+    return obj.model_dump() if hasattr(obj, "model_dump") else obj.dict()
+
+
+# código ExtType -> (classe, dump, build)
+_TYPES: Dict[int, Tuple[Type, Callable[[Any], dict], Callable[[dict], Any]]] = {
+    1: (SolutionDesign, _model_dump, lambda d: SolutionDesign(**d)),
+    2: (AgentRoutingDecision, _model_dump, lambda d: AgentRoutingDecision(**d)),
+    3: (RevisionRequest, asdict, lambda d: RevisionRequest(**d)),
+}
+_CODE_BY_TYPE = {cls: code for code, (cls, _, _) in _TYPES.items()}
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# JSON (formato legado / fallback)
+# ──────────────────────────────────────────────────────────────────────────────
+def _to_jsonable(obj):
+    """Converts objects to something JSON serializable."""
+    if isinstance(obj, dict):
+        return {k: _to_jsonable(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_to_jsonable(v) for v in obj]
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    if hasattr(obj, "model_dump") or hasattr(obj, "dict"):
+        return _to_jsonable(_model_dump(obj))
+    if is_dataclass(obj):
+        return _to_jsonable(asdict(obj))
+    # Fallback: converter para str (não recomendado, mas impede crash)
+    return str(obj)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# msgpack + zstd
+# ──────────────────────────────────────────────────────────────────────────────
+def _default(obj: Any):
+    code = _CODE_BY_TYPE.get(type(obj))
+    if code is not None:
+        return msgpack.ExtType(code, msgpack.packb(_TYPES[code][1](obj), default=_default, use_bin_type=True))
+    if isinstance(obj, tuple):
+        return list(obj)
+    if hasattr(obj, "model_dump") or hasattr(obj, "dict"):
+        return _model_dump(obj)
+    if is_dataclass(obj):
+        return asdict(obj)
+    return str(obj)  # mesmo fallback do JSON
+
+
+def _ext_hook(code: int, data: bytes):
+    entry = _TYPES.get(code)
+    if entry is None:
+        return msgpack.ExtType(code, data)
+    payload = msgpack.unpackb(data, ext_hook=_ext_hook, raw=False, strict_map_key=False)
+    try:
+        return entry[2](payload)
+    except Exception:
+        return payload  # schema mudou: devolve o dict (o _rehydrate_state lida com dicts)
+
+
+# ZstdCompressor/Decompressor não são thread-safe: uma instância por thread
+_zstd_local = threading.local()
+
+
+def _zstd() -> Tuple[Any, Any]:
+    pair = getattr(_zstd_local, "pair", None)
+    if pair is None:
+        pair = (zstandard.ZstdCompressor(level=STATE_ZSTD_LEVEL), zstandard.ZstdDecompressor())
+        _zstd_local.pair = pair
+    return pair
+
+
+def encode_state(state: dict) -> bytes:
+    """Serializa o state para gravação no Redis (binário versionado, ou JSON sem msgpack)."""
+    if not BINARY_ENABLED:
+        return dumps(_to_jsonable(state))
+
+    payload = msgpack.packb(state, default=_default, use_bin_type=True)
+    flags = 0
+    if zstandard is not None and len(payload) >= STATE_ZSTD_MIN_BYTES:
+        payload = _zstd()[0].compress(payload)
+        flags |= FLAG_ZSTD
+    return _MARKER + bytes((CODEC_VERSION, flags)) + payload
+
+
+def decode_state(raw: bytes | str | None) -> dict:
+    """Lê o state gravado por `encode_state` ou o JSON legado."""
+    if not raw:
+        return {}
+    if isinstance(raw, str):
+        raw = raw.encode()
+    if not raw.startswith(_MARKER):
+        return loads(raw)
+
+    version, flags, payload = raw[1], raw[2], raw[3:]
+    if version > CODEC_VERSION or msgpack is None or (flags & FLAG_ZSTD and zstandard is None):
+        logger.warning(f"⚠️  Cannot decode persisted state (codec v{version}, flags={flags}); starting fresh")
+        return {}
+    if flags & FLAG_ZSTD:
+        payload = _zstd()[1].decompress(payload)
+    return msgpack.unpackb(payload, ext_hook=_ext_hook, raw=False, strict_map_key=False)
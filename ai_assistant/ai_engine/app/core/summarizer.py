@@ -0,0 +1,193 @@
+# services/ai_engine/app/core/summarizer.py
+"""
+Sumarização da conversa fora do caminho do turno.
+
+O turno só *agenda* um job quando há mensagens suficientes ainda não resumidas
+(`msg_count - summarized_upto >= SUMMARY_EVERY_MESSAGES`) e segue com o summary
+que estiver gravado. O job é incremental: summary anterior + apenas as mensagens
+novas desde `summarized_upto`; ao terminar grava summary/summarized_upto e poda
+a lista (ChatMemory.apply_summary).
+
+Backends (SUMMARIZER_BACKEND):
+  - "thread" (padrão): fila em processo + thread daemon (stand-in local).
+  - "redis": XADD num Redis stream; consumido por `python -m ai_engine.app.core.summarizer`
+    (ou por `SummaryWorker.consume_stream` em qualquer processo do engine).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import queue
+import secrets
+import socket
+import threading
+from typing import Callable, List, Optional, Set
+
+import redis
+
+from ai_engine.app.core import telemetry
+from ai_engine.app.core.memory import ChatMemory
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_EVERY_MESSAGES = int(os.getenv("SUMMARY_EVERY_MESSAGES", "8"))
+SUMMARIZER_BACKEND = os.getenv("SUMMARIZER_BACKEND", "thread").strip().lower()
+SUMMARY_STREAM = os.getenv("SUMMARY_STREAM", "cqa:summarize")
+SUMMARY_GROUP = "summarizers"
+LOCK_TTL_SECONDS = 120
+
+# Solta o lock só se ainda for nosso: se o job passou do TTL, outro consumidor
+# pode ter pego a sessão e o lock agora é dele.
+_RELEASE_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# (summary anterior, mensagens novas) -> summary novo
+SummarizeFn = Callable[[str, List[dict]], str]
+
+
+def summarize_session(memory: ChatMemory, summarize_fn: SummarizeFn, keep_last: int) -> bool:
+    """Executa um job incremental para a sessão de `memory`. Retorna True se gravou um summary novo."""
+    # summary, marca d'água e mensagens lidos juntos: o que chegar durante o job
+    # fica depois de `count` e entra no próximo
+    summary, count, messages = memory.unsummarized()
+    if not messages:
+        return False
+
+    with telemetry.stage("summarize"):
+        new_summary = summarize_fn(summary, messages)
+    if not memory.apply_summary(new_summary, upto=count, keep_last=keep_last):
+        return False
+    logger.info(f"🧾 [Summarizer] {memory.session_id}: folded {len(messages)} message(s) into the summary")
+    return True
+
+
+class SummaryWorker:
+    """Agenda e executa jobs de sumarização (um por sessão por vez)."""
+
+    def __init__(
+        self,
+        summarize_fn: SummarizeFn,
+        memory_factory: Callable[[str], ChatMemory],
+        keep_last: int,
+        every: int = SUMMARY_EVERY_MESSAGES,
+        backend: str = SUMMARIZER_BACKEND,
+    ) -> None:
+        self.summarize_fn = summarize_fn
+        self.memory_factory = memory_factory
+        self.keep_last = keep_last
+        self.every = max(1, every)
+        self.backend = backend if backend in ("thread", "redis") else "thread"
+
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._pending: Set[str] = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- produtor (chamado pelo turno) ----
+    def maybe_schedule(self, session_id: str, msg_count: int, summarized_upto: int) -> bool:
+        if msg_count - summarized_upto < self.every:
+            return False
+        self.submit(session_id)
+        return True
+
+    async def amaybe_schedule(self, session_id: str, msg_count: int, summarized_upto: int, client=None) -> bool:
+        """Versão do turno async: `client` é o redis.asyncio da AsyncChatMemory do turno."""
+        if msg_count - summarized_upto < self.every:
+            return False
+        await self.asubmit(session_id, client)
+        return True
+
+    def submit(self, session_id: str) -> None:
+        if self.backend == "redis":
+            memory = self.memory_factory(session_id)
+            memory.r.xadd(SUMMARY_STREAM, {"session_id": session_id}, maxlen=10_000, approximate=True)
+            return
+        self._enqueue(session_id)
+
+    async def asubmit(self, session_id: str, client=None) -> None:
+        """Como `submit`, sem bloquear o event loop com o XADD síncrono."""
+        if self.backend != "redis":
+            self._enqueue(session_id)  # só memória: não faz I/O
+        elif client is not None:
+            await client.xadd(SUMMARY_STREAM, {"session_id": session_id}, maxlen=10_000, approximate=True)
+        else:
+            await asyncio.to_thread(self.submit, session_id)
+
+    def _enqueue(self, session_id: str) -> None:
+
+        with self._lock:
+            if session_id in self._pending:
+                return  # já há um job na fila para essa sessão
+            self._pending.add(session_id)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run_queue, name="summary-worker", daemon=True)
+                self._thread.start()
+        self._queue.put(session_id)
+
+    # ---- execução ----
+    def run_job(self, session_id: str) -> bool:
+        memory = self.memory_factory(session_id)
+        lock_key = f"{memory.key_meta}:summarizing"
+        # lock por sessão: vários processos/consumidores podem receber a mesma sessão
+        token = secrets.token_hex(16)
+        if not memory.r.set(lock_key, token, nx=True, ex=LOCK_TTL_SECONDS):
+            return False
+        try:
+            return summarize_session(memory, self.summarize_fn, self.keep_last)
+        except Exception as e:
+            logger.warning(f"⚠️  Summarization failed for {session_id}: {e}")
+            return False
+        finally:
+            memory.r.eval(_RELEASE_LOCK_LUA, 1, lock_key, token)
+
+    def _run_queue(self) -> None:
+        while True:
+            session_id = self._queue.get()
+            try:
+                self.run_job(session_id)
+            finally:
+                with self._lock:
+                    self._pending.discard(session_id)
+                self._queue.task_done()
+
+    def drain(self, timeout: Optional[float] = None) -> None:
+        """Espera a fila em processo esvaziar (testes/benchmarks/shutdown)."""
+        if timeout is None:
+            self._queue.join()
+            return
+        done = threading.Event()
+        threading.Thread(target=lambda: (self._queue.join(), done.set()), daemon=True).start()
+        done.wait(timeout)
+
+    # ---- consumidor do Redis stream ----
+    def consume_stream(self, client: redis.Redis, consumer: Optional[str] = None,
+                       block_ms: int = 5000, stop: Optional[threading.Event] = None) -> None:
+        consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        try:
+            client.xgroup_create(SUMMARY_STREAM, SUMMARY_GROUP, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        logger.info(f"🧾 [Summarizer] consuming '{SUMMARY_STREAM}' as {consumer}")
+        while not (stop and stop.is_set()):
+            batches = client.xreadgroup(SUMMARY_GROUP, consumer, {SUMMARY_STREAM: ">"}, count=10, block=block_ms)
+            for _, entries in batches or []:
+                for entry_id, fields in entries:
+                    session_id = (fields.get(b"session_id") or b"").decode()
+                    if session_id:
+                        self.run_job(session_id)
+                    client.xack(SUMMARY_STREAM, SUMMARY_GROUP, entry_id)
+
+
+if __name__ == "__main__":
+    # Worker dedicado para SUMMARIZER_BACKEND=redis
+    import ai_engine.settings as s
+    from ai_engine.app.core.memory import get_redis
+    from ai_engine.main import get_summary_worker
+
+    get_summary_worker().consume_stream(get_redis(s.REDIS_URL))
@@ -0,0 +1,295 @@
+# services/ai_engine/app/core/telemetry.py
+"""
+Telemetria do workflow: spans por nó do grafo, por chamada de LLM e por perna do
+retriever, com tokens e cache hits.
+
+- Por turno: `collect_turn()` abre um coletor (contextvar) que os nós/LLMs/retriever
+  alimentam; `TurnTimings.as_event()` vira o evento "timings" do TurnOut.
+- Agregado: histogramas/contadores Prometheus, expostos em /metrics quando
+  `prometheus_client` está instalado (sem ele, só o coletor por turno funciona).
+  Com PROMETHEUS_MULTIPROC_DIR (o prefork de ai_engine.app.serve define) cada
+  worker grava seus valores no diretório e /metrics soma todos os workers.
+"""
+from __future__ import annotations
+
+import functools
+import inspect
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+    from prometheus_client import multiprocess
+except ImportError:  # opcional: sem o pacote, /metrics responde 503
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+    CollectorRegistry = Counter = Gauge = Histogram = generate_latest = multiprocess = None
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Métricas Prometheus (no-op se o pacote não estiver instalado)
+# ──────────────────────────────────────────────────────────────────────────────
+PROMETHEUS_ENABLED = Histogram is not None
+
+if PROMETHEUS_ENABLED:
+    SPAN_SECONDS = Histogram(
+        "ai_engine_span_seconds",
+        "Duration of graph nodes, LLM calls and retriever legs.",
+        ["kind", "name"],
+        buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32),
+    )
+    SPAN_ERRORS = Counter("ai_engine_span_errors_total", "Spans that raised.", ["kind", "name"])
+    LLM_TOKENS = Counter("ai_engine_llm_tokens_total", "LLM tokens by node.", ["node", "model", "type"])
+    CACHE_LOOKUPS = Counter("ai_engine_cache_lookups_total", "Cache lookups.", ["cache", "result"])
+    TURN_SECONDS = Histogram(
+        "ai_engine_turn_seconds",
+        "End-to-end duration of a /turns request.",
+        buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64),
+    )
+    # Scheduler de turnos (app/core/scheduler.py)
+    # multiprocess: soma dos workers vivos (ignorado num processo só)
+    TURN_QUEUE_DEPTH = Gauge("ai_engine_turn_queue_depth", "Turns waiting for admission.",
+                             multiprocess_mode="livesum")
+    TURNS_RUNNING = Gauge("ai_engine_turns_running", "Turns currently executing.", multiprocess_mode="livesum")
+    TURN_QUEUE_WAIT = Histogram(
+        "ai_engine_turn_queue_wait_seconds",
+        "Time a turn waited before it started running.",
+        buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32),
+    )
+    TURNS_REJECTED = Counter("ai_engine_turns_rejected_total", "Turns refused by the scheduler.", ["reason"])
+
+
+def set_turn_queue(waiting: int, running: int) -> None:
+    if PROMETHEUS_ENABLED:
+        TURN_QUEUE_DEPTH.set(waiting)
+        TURNS_RUNNING.set(running)
+
+
+def observe_turn_wait(seconds: float) -> None:
+    if PROMETHEUS_ENABLED:
+        TURN_QUEUE_WAIT.observe(seconds)
+
+
+def record_turn_rejected(reason: str) -> None:
+    if PROMETHEUS_ENABLED:
+        TURNS_REJECTED.labels(reason).inc()
+
+
+def prometheus_payload() -> Optional[bytes]:
+    """Exposição texto das métricas (de todos os workers no modo multiprocess); None sem prometheus_client."""
+    if not PROMETHEUS_ENABLED:
+        return None
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
+
+
+def mark_worker_dead(pid: int) -> None:
+    """Tira os gauges `livesum` de um worker que morreu (chamado pelo master do prefork)."""
+    if PROMETHEUS_ENABLED and os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Coletor por turno
+# ──────────────────────────────────────────────────────────────────────────────
+@dataclass
+class TurnTimings:
+    """Spans de um turno. Nós síncronos rodam no executor e escrevem no mesmo coletor."""
+    started: float = field(default_factory=time.perf_counter)
+    spans: List[Dict[str, Any]] = field(default_factory=list)
+    tokens: Dict[str, Dict[str, int]] = field(default_factory=lambda: defaultdict(lambda: defaultdict(int)))
+    cache: Dict[str, Dict[str, int]] = field(default_factory=lambda: defaultdict(lambda: {"hit": 0, "miss": 0}))
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add_span(self, kind: str, name: str, seconds: float, **extra: Any) -> None:
+        with self._lock:
+            self.spans.append({"kind": kind, "name": name, "ms": round(seconds * 1000, 1), **extra})
+
+    def add_tokens(self, node: str, prompt: int, completion: int) -> None:
+        with self._lock:
+            self.tokens[node]["prompt"] += prompt
+            self.tokens[node]["completion"] += completion
+
+    def add_cache(self, cache: str, hit: bool) -> None:
+        with self._lock:
+            self.cache[cache]["hit" if hit else "miss"] += 1
+
+    def as_event(self) -> Dict[str, Any]:
+        """Resumo compacto para TurnOut.events (ms somados por nome)."""
+        by_kind: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        llm_calls = 0
+        with self._lock:
+            for s in self.spans:
+                by_kind[s["kind"]][s["name"]] += s["ms"]
+                llm_calls += s["kind"] == "llm"
+            tokens = {n: dict(t) for n, t in self.tokens.items()}
+            cache = {c: dict(v) for c, v in self.cache.items()}
+        return {
+            "type": "timings",
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "nodes": {k: round(v, 1) for k, v in by_kind.get("node", {}).items()},
+            "llm": {
+                "calls": llm_calls,
+                "ms": {k: round(v, 1) for k, v in by_kind.get("llm", {}).items()},
+                "tokens": tokens,
+            },
+            "retriever": {k: round(v, 1) for k, v in by_kind.get("retriever", {}).items()},
+            "cache": cache,
+        }
+
+
+_turn: ContextVar[Optional[TurnTimings]] = ContextVar("ai_engine_turn_timings", default=None)
+_node: ContextVar[str] = ContextVar("ai_engine_current_node", default="-")
+
+
+def current_turn() -> Optional[TurnTimings]:
+    return _turn.get()
+
+
+@contextmanager
+def collect_turn() -> Iterator[TurnTimings]:
+    """Abre o coletor do turno; contextvars acompanham asyncio.to_thread e os branches do grafo."""
+    timings = TurnTimings()
+    token = _turn.set(timings)
+    try:
+        yield timings
+    finally:
+        _turn.reset(token)
+        if PROMETHEUS_ENABLED:
+            TURN_SECONDS.observe(time.perf_counter() - timings.started)
+
+
+def _record(kind: str, name: str, seconds: float, failed: bool = False, **extra: Any) -> None:
+    if PROMETHEUS_ENABLED:
+        SPAN_SECONDS.labels(kind, name).observe(seconds)
+        if failed:
+            SPAN_ERRORS.labels(kind, name).inc()
+    turn = _turn.get()
+    if turn is not None:
+        if failed:
+            extra["error"] = True
+        turn.add_span(kind, name, seconds, **extra)
+
+
+@contextmanager
+def span(name: str, kind: str = "node") -> Iterator[None]:
+    t0 = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        _record(kind, name, time.perf_counter() - t0, failed)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    if PROMETHEUS_ENABLED:
+        CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+    turn = _turn.get()
+    if turn is not None:
+        turn.add_cache(cache, hit)
+
+
+def timed(name: str, kind: str) -> Callable:
+    """Decorator de span para funções síncronas (ex.: pernas do retriever)."""
+    def deco(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Span "node" que também marca o nó corrente (atribuição das chamadas de LLM)."""
+    token = _node.set(name)
+    try:
+        with span(name, "node"):
+            yield
+    finally:
+        _node.reset(token)
+
+
+def instrument_node(name: str, func: Callable) -> Callable:
+    """Envolve um nó do grafo (sync ou async) num `stage`."""
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(state, *args, **kwargs):
+            with stage(name):
+                return await func(state, *args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(state, *args, **kwargs):
+        with stage(name):
+            return func(state, *args, **kwargs)
+    return wrapper
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Callback de LLM: duração + tokens por nó
+# ──────────────────────────────────────────────────────────────────────────────
+class LLMTelemetryCallback(BaseCallbackHandler):
+    """Registra cada chamada de chat model como span "llm" (nome = nó corrente) com tokens."""
+
+    run_inline = True  # roda no contexto do chamador: precisa das contextvars do turno
+
+    def __init__(self) -> None:
+        self._starts: Dict[UUID, tuple] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: UUID) -> None:
+        with self._lock:
+            self._starts[run_id] = (time.perf_counter(), _node.get())
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(run_id)
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(run_id)
+
+    def _finish(self, run_id: UUID, response: Optional[LLMResult], failed: bool) -> None:
+        with self._lock:
+            t0, node = self._starts.pop(run_id, (None, _node.get()))
+        if t0 is None:
+            return
+        output = (response.llm_output or {}) if response is not None else {}
+        usage = output.get("token_usage") or {}
+        prompt = int(usage.get("prompt_tokens") or 0)
+        completion = int(usage.get("completion_tokens") or 0)
+        model = output.get("model_name") or "unknown"
+
+        _record("llm", node, time.perf_counter() - t0, failed,
+                model=model, prompt_tokens=prompt, completion_tokens=completion)
+        if PROMETHEUS_ENABLED:
+            LLM_TOKENS.labels(node, model, "prompt").inc(prompt)
+            LLM_TOKENS.labels(node, model, "completion").inc(completion)
+        turn = _turn.get()
+        if turn is not None:
+            turn.add_tokens(node, prompt, completion)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, response, failed=False)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, None, failed=True)
+
+
+# instância compartilhada: passe `callbacks=LLM_CALLBACKS` ao construir os ChatOpenAI
+LLM_CALLBACKS = [LLMTelemetryCallback()]
@@ -5,11 +5,15 @@ import json
 import logging
 import os
 import re
+import threading
 from collections import defaultdict, Counter
-from typing import Dict, List, Optional, Any
+from collections.abc import Mapping
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Any, Tuple
 
-import pandas as pd
-from langchain.tools import tool
+from langchain_core.tools import tool
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 # Busca híbrida (sem alterações aqui)
 from ai_engine.app.utils.retriever import (
@@ -23,12 +27,14 @@ from ai_engine.app.utils.retriever import (
 logger = logging.getLogger(__name__)
 
 # ─────────────────────────────────────────────────────────────────────────────
-# Carregamento do catálogo preparado
+# Carregamento do catálogo preparado (lazy: só no primeiro acesso ou no warm_up)
 # ─────────────────────────────────────────────────────────────────────────────
 PRICE_PREP_DIR = os.getenv("PRICE_PREP_DIR", "data/processed/pricelist_prep")
 PARQUET_PATH = os.path.join(PRICE_PREP_DIR, "catalog_products_clean.parquet")
 
-def _load_catalog_df() -> pd.DataFrame:
+def _load_catalog_df() -> "pd.DataFrame":
+    import pandas as pd
+
     if not os.path.exists(PARQUET_PATH):
         raise FileNotFoundError(f"Catalog not found. Expected at {PARQUET_PATH}")
 
@@ -42,47 +48,6 @@ def _load_catalog_df() -> pd.DataFrame:
     print(f"[CATALOG] loaded from: {PARQUET_PATH} | rows={len(df)}")
     return df
 
-CATALOG_DF: pd.DataFrame = _load_catalog_df()
-
-# ─────────────────────────────────────────────────────────────────────────────
-# Dicionários em memória
-# ─────────────────────────────────────────────────────────────────────────────
-
-# MUDANÇA: A estrutura de ROWS_BY_SKU foi sincronizada com as novas colunas.
-ROWS_BY_SKU: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
-for _, r in CATALOG_DF.iterrows():
-    sku = str(r.get("sku"))
-    if not sku:
-        continue
-    
-    row_data = {
-        "sku": sku,
-        "description": r.get("description"),
-        "list_price_usd": float(r.get("list_price_usd")) if pd.notna(r.get("list_price_usd")) else None,
-        "family": r.get("family") or r.get("product_family"),
-        "product_line": r.get("product_line"),
-        "product_dimension": r.get("product_dimension"),
-        "product_type": r.get("product_type"),
-        "workbook": r.get("workbook"),
-        "sheet": r.get("sheet"),
-
-        # --- Campos técnicos sincronizados ---
-        "usage": r.get("usage"),
-        "network_interface": r.get("network_interface"),
-        "ports": r.get("ports"),
-        "uplinks": r.get("uplinks"),
-        "poe_type": r.get("poe_type"),
-        "power_configuration": r.get("power_configuration"),
-        "stacking": r.get("stacking"),
-        "routing_capabilities": r.get("routing_capabilities"),
-        "radio_specification": r.get("radio_specification"),
-        "spatial_streams": r.get("spatial_streams"),
-        "indoor_outdoor": r.get("indoor_outdoor"),
-        "orderability": r.get("orderability"),
-    }
-    ROWS_BY_SKU[sku].append(row_data)
-
-
 def _aggregate_product_record(sku: str, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
     """
     MUDANÇA: Agrega os dados em uma estrutura "plana", sem a sub-chave 'technical_specs'.
@@ -115,9 +80,101 @@ def _aggregate_product_record(sku: str, rows: List[Dict[str, Any]]) -> Dict[str,
 
     return aggregated_record
 
-PRODUCT_DICT: Dict[str, Dict[str, Any]] = {
-    sku: _aggregate_product_record(sku, rows) for sku, rows in ROWS_BY_SKU.items()
-}
+def _build_catalog() -> Dict[str, Any]:
+    import pandas as pd
+
+    df = _load_catalog_df()
+
+    # ─────────────────────────────────────────────────────────────────────────
+    # Dicionários em memória
+    # ─────────────────────────────────────────────────────────────────────────
+
+    # MUDANÇA: A estrutura de ROWS_BY_SKU foi sincronizada com as novas colunas.
+    rows_by_sku: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for _, r in df.iterrows():
+        sku = str(r.get("sku"))
+        if not sku:
+            continue
+    
+        row_data = {
+            "sku": sku,
+            "description": r.get("description"),
+            "list_price_usd": float(r.get("list_price_usd")) if pd.notna(r.get("list_price_usd")) else None,
+            "family": r.get("family") or r.get("product_family"),
+            "product_line": r.get("product_line"),
+            "product_dimension": r.get("product_dimension"),
+            "product_type": r.get("product_type"),
+            "workbook": r.get("workbook"),
+            "sheet": r.get("sheet"),
+
+            # --- Campos técnicos sincronizados ---
+            "usage": r.get("usage"),
+            "network_interface": r.get("network_interface"),
+            "ports": r.get("ports"),
+            "uplinks": r.get("uplinks"),
+            "poe_type": r.get("poe_type"),
+            "power_configuration": r.get("power_configuration"),
+            "stacking": r.get("stacking"),
+            "routing_capabilities": r.get("routing_capabilities"),
+            "radio_specification": r.get("radio_specification"),
+            "spatial_streams": r.get("spatial_streams"),
+            "indoor_outdoor": r.get("indoor_outdoor"),
+            "orderability": r.get("orderability"),
+        }
+        rows_by_sku[sku].append(row_data)
+
+    product_dict = {sku: _aggregate_product_record(sku, rows) for sku, rows in rows_by_sku.items()}
+    return {"df": df, "rows_by_sku": rows_by_sku, "product_dict": product_dict}
+
+_CATALOG: Optional[Dict[str, Any]] = None
+_CATALOG_LOCK = threading.Lock()
+
+def load_catalog() -> Dict[str, Any]:
+    """Carrega (uma vez, thread-safe) o DataFrame, ROWS_BY_SKU e PRODUCT_DICT."""
+    global _CATALOG
+    if _CATALOG is None:
+        with _CATALOG_LOCK:
+            if _CATALOG is None:
+                _CATALOG = _build_catalog()
+    return _CATALOG
+
+
+class _LazyProductDict(Mapping):
+    """
+    PRODUCT_DICT como Mapping somente-leitura: o catálogo é carregado no primeiro
+    acesso, então importar tools/graph não lê o parquet.
+    """
+
+    def _data(self) -> Dict[str, Dict[str, Any]]:
+        return load_catalog()["product_dict"]
+
+    def __getitem__(self, sku: str) -> Dict[str, Any]:
+        return self._data()[sku]
+
+    def __contains__(self, sku: object) -> bool:
+        return sku in self._data()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._data())
+
+    def __len__(self) -> int:
+        return len(self._data())
+
+    def __repr__(self) -> str:
+        state = f"{len(self)} skus" if _CATALOG is not None else "not loaded"
+        return f"<PRODUCT_DICT {state}>"
+
+
+PRODUCT_DICT: Mapping[str, Dict[str, Any]] = _LazyProductDict()
+
+
+def __getattr__(name: str) -> Any:
+    # CATALOG_DF / ROWS_BY_SKU continuam importáveis, mas só carregam quando usados
+    if name == "CATALOG_DF":
+        return load_catalog()["df"]
+    if name == "ROWS_BY_SKU":
+        return load_catalog()["rows_by_sku"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def _compute_client_adjusted_price(part_number: str, quantity: int, client: Optional[Dict] = None, duration_months: Optional[int] = None) -> Dict:
     """
@@ -0,0 +1,147 @@
+# services/ai_engine/app/core/turn_coordination.py
+"""
+Coordenação dos turnos entre workers do prefork (ai_engine.app.serve).
+
+O TurnScheduler ordena os turnos de uma sessão dentro do processo; com N workers
+atrás do mesmo socket, turnos da mesma sessão caem em processos diferentes. Com
+TURN_COORDINATION=redis o scheduler usa, além do lock local:
+
+- um lease por sessão (`cqa:turn:<sessão>:lease`, SET NX PX com token próprio,
+  renovado enquanto o turno roda): só um worker roda turno da sessão por vez;
+- um ticket por sessão (`cqa:turn:<sessão>:seq`, INCR): quem pega o lease com
+  um ticket que não é o último foi superado por uma mensagem mais nova, em
+  qualquer worker;
+- cancelamento via pub/sub (`cqa:turn:cancel`): /turns/cancel avança o ticket
+  (os que esperam viram "superseded") e avisa todos os workers; quem roda um
+  turno da sessão com ticket até aquele valor o aborta.
+
+Falhas do Redis não derrubam o turno: o scheduler segue só com o lock local.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import secrets
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Optional
+
+from ai_engine.app.core.serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+TURN_PREFIX = "cqa:turn"
+CANCEL_CHANNEL = f"{TURN_PREFIX}:cancel"
+SEQ_TTL_SECONDS = 24 * 3600
+
+# Só mexe no lease se ele ainda for nosso (pode ter expirado e ido para outro worker).
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_RENEW_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class RedisTurnCoordinator:
+    def __init__(self, redis_factory: Callable[[], Any], lease_ttl_s: float = 120.0, poll_s: float = 0.05) -> None:
+        self.redis_factory = redis_factory
+        self.lease_ttl_ms = max(1000, int(lease_ttl_s * 1000))
+        self.poll_s = poll_s
+
+    def _seq_key(self, session_id: str) -> str:
+        return f"{TURN_PREFIX}:{session_id}:seq"
+
+    def _lease_key(self, session_id: str) -> str:
+        return f"{TURN_PREFIX}:{session_id}:lease"
+
+    async def ticket(self, session_id: str) -> int:
+        pipe = self.redis_factory().pipeline(transaction=True)
+        pipe.incr(self._seq_key(session_id))
+        pipe.expire(self._seq_key(session_id), SEQ_TTL_SECONDS)
+        return int((await pipe.execute())[0])
+
+    async def is_latest(self, session_id: str, ticket: int) -> bool:
+        raw = await self.redis_factory().get(self._seq_key(session_id))
+        return raw is None or int(raw) == ticket
+
+    @asynccontextmanager
+    async def lease(self, session_id: str) -> AsyncIterator[None]:
+        """Segura o lease da sessão (espera por ele) enquanto o bloco roda."""
+        r = self.redis_factory()
+        key = self._lease_key(session_id)
+        token = secrets.token_hex(16)
+        delay = self.poll_s
+        while not await r.set(key, token, nx=True, px=self.lease_ttl_ms):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+        renew = asyncio.ensure_future(self._renew(key, token))
+        try:
+            yield
+        finally:
+            renew.cancel()
+            try:
+                await r.eval(_RELEASE_LUA, 1, key, token)
+            except Exception as e:
+                # o lease expira sozinho no TTL
+                logger.warning(f"⚠️  [Turns] could not release the lease of {session_id}: {e!r}")
+
+    async def _renew(self, key: str, token: str) -> None:
+        # turnos longos (LLM lento) não perdem o lease no meio
+        while True:
+            await asyncio.sleep(self.lease_ttl_ms / 3000)
+            try:
+                if not await self.redis_factory().eval(_RENEW_LUA, 1, key, token, self.lease_ttl_ms):
+                    return
+            except Exception as e:
+                logger.warning(f"⚠️  [Turns] lease renewal failed for {key}: {e!r}")
+
+    async def cancel(self, session_id: str) -> bool:
+        """Supera os turnos em espera e avisa os workers. True se havia turno rodando em algum deles."""
+        pipe = self.redis_factory().pipeline(transaction=True)
+        pipe.incr(self._seq_key(session_id))
+        pipe.expire(self._seq_key(session_id), SEQ_TTL_SECONDS)
+        pipe.exists(self._lease_key(session_id))
+        upto, _, running = await pipe.execute()
+        await self.redis_factory().publish(CANCEL_CHANNEL, dumps({"session_id": session_id, "upto": int(upto)}))
+        return bool(running)
+
+    async def listen(self, on_cancel: Callable[[str, int], None]) -> None:
+        """Repassa os cancelamentos publicados por qualquer worker (roda até ser cancelada)."""
+        retry_s = 1.0
+        while True:
+            pubsub = self.redis_factory().pubsub()
+            try:
+                await pubsub.subscribe(CANCEL_CHANNEL)
+                retry_s = 1.0
+                async for msg in pubsub.listen():
+                    if msg.get("type") != "message":
+                        continue
+                    data = loads(msg["data"])
+                    on_cancel(data["session_id"], int(data["upto"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️  [Turns] cancel listener failed, resubscribing in {retry_s:.0f}s: {e!r}")
+                await asyncio.sleep(retry_s)
+                retry_s = min(retry_s * 2, 30.0)
+            finally:
+                try:
+                    await pubsub.reset()
+                except Exception as e:
+                    logger.debug(f"[Turns] pubsub reset failed: {e!r}")
+
+
+def coordinator_from_settings(mode: str, lease_ttl_s: float) -> Optional[RedisTurnCoordinator]:
+    if mode != "redis":
+        return None
+    import ai_engine.settings as s
+    from ai_engine.app.core.memory import get_async_redis
+
+    return RedisTurnCoordinator(lambda: get_async_redis(s.REDIS_URL), lease_ttl_s=lease_ttl_s)
@@ -1,13 +1,26 @@
+import asyncio
+from dataclasses import dataclass
 from pydantic import BaseModel, Field
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Literal, Optional
 
 
 class TurnIn(BaseModel):
     message: str = Field(..., min_length=1)
     quote_state: Dict[str, Any] = Field(default_factory=dict)
+    # Overrides DESIGN_ENGINE for this turn only
+    design_engine: Optional[Literal["llm", "deterministic"]] = None
 
 
 class TurnOut(BaseModel):
     assistant_message: str
     scenarios: List[Dict[str, Any]]
-    events: List[Dict[str, Any]] = []
\ No newline at end of file
+    events: List[Dict[str, Any]] = []
+
+
+@dataclass
+class TurnResult:
+    """What a graph turn hands back to its caller (no Redis re-read needed)."""
+    final_message: str
+    state: Dict[str, Any]                   # lean state, as persisted
+    timings: Optional[Dict[str, Any]] = None  # telemetry "timings" event
+    saved: Optional[asyncio.Task] = None    # async turns: persistence still running
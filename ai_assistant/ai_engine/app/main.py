@@ -2,7 +2,7 @@
 """
 Main entry point for running the Cisco Sales Assistant application.
 """
-from ai_engine.app.core.graph import app
+from ai_engine.app.core.graph import get_app
 from ai_engine.app.schemas.models import AgentState
 
 def run_sales_quote(query: str) -> str:
@@ -17,7 +17,7 @@ def run_sales_quote(query: str) -> str:
         "rule_errors": [],
         "final_response": "",
     }
-    final_state = app.invoke(initial_state)
+    final_state = get_app().invoke(initial_state)
     return final_state["final_response"]
 
 if __name__ == "__main__":
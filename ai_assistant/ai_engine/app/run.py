@@ -1,17 +1,56 @@
+import asyncio
+from typing import Optional
+
 from fastapi import FastAPI
 from ai_engine.app.core.config import settings
 from ai_engine.app.core.logging import setup_logging
 from ai_engine.app.core.exceptions import ExceptionMiddleware
-from ai_engine.app.api.routers import health, turns
+from ai_engine.app.core.scheduler import get_turn_scheduler, install_graph_executor
+from ai_engine.app.core.serialization import FastJSONResponse
+from ai_engine.app.api.routers import health, metrics, turns
 
 
 setup_logging()
 
 
-app = FastAPI(title=settings.app_name, version=settings.app_version)
+app = FastAPI(
+    title=settings.app_name,
+    version=settings.app_version,
+    default_response_class=FastJSONResponse,
+)
 app.add_middleware(ExceptionMiddleware)
 
 
+_warm_up_task: Optional[asyncio.Task] = None
+
+
+@app.on_event("startup")
+async def _warm_up_engine() -> None:
+    global _warm_up_task
+    install_graph_executor(asyncio.get_running_loop())
+    await get_turn_scheduler().start()
+    if not settings.warm_up_on_startup:
+        return
+    from ai_engine.main import warm_up
+
+    # Em background: /healthz responde durante o warm-up e /readyz fica 503 até
+    # ele terminar. No modo prefork (ai_engine.app.serve) o master já aqueceu
+    # tudo antes do fork e isso aqui é instantâneo.
+    _warm_up_task = asyncio.create_task(asyncio.to_thread(warm_up))
+
+
+@app.on_event("shutdown")
+async def _flush_turn_saves() -> None:
+    import sys
+
+    await get_turn_scheduler().aclose()
+
+    # só há saves pendentes se o engine chegou a ser importado
+    if "ai_engine.main" in sys.modules:
+        await sys.modules["ai_engine.main"].drain_pending_saves()
+
+
 # Routers
 app.include_router(health.router)
-app.include_router(turns.router)
\ No newline at end of file
+app.include_router(turns.router)
+app.include_router(metrics.router)
\ No newline at end of file
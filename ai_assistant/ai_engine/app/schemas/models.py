@@ -1,3 +1,4 @@
+from dataclasses import dataclass
 from typing import List, Dict, Optional
 from pydantic import BaseModel, Field
 from typing_extensions import TypedDict
@@ -26,6 +27,7 @@ class SolutionComponent(BaseModel):
     part_number: str = Field(..., description="Exact Cisco SKU.")
     quantity: int = Field(..., description="Units required.")
     role: str = Field(..., description="Function of this component in the solution.")
+    fixed_quantity: bool = Field(False, description="Quantity set explicitly by the user; pricing keeps it instead of sizing by users.")
 
 
 class SolutionDesign(BaseModel):
@@ -51,6 +53,15 @@ class ThreeScenarios(BaseModel):
                 raise ValueError("scenarios must be a non-empty list")
         return v
 
+@dataclass
+class RevisionRequest:
+    target_scenario: Optional[str]  # e.g. "Complete", "Best", "Standard"
+    action: str                     # "replace" | "add" | "remove" | "set_qty"
+    sku_from: Optional[str] = None
+    sku_to: Optional[str] = None
+    qty: Optional[int] = None
+
+
 class NBAOutput(BaseModel):
     question_for_refinement: str
     refinements: Optional[List[Dict[str, Any]]] = []
@@ -63,11 +74,13 @@ class AgentState(TypedDict, total=False):
     # Input
     user_query: str
     orchestrator_decision: "AgentRoutingDecision"
+    design_engine: Optional[str]  # "llm" | "deterministic" (per-request override)
 
     # --- PRODUCT CONTEXT ---
     product_context: List[Dict[str, str]]  # metadata of retrieved products
     base_product_sku: Optional[str]
     revision_request: Optional[Dict[str, Any]] 
+    local_revision: Optional[Dict[str, Any]]  # edit applied by the local patch engine (skips LLM)
 
 
     search_query: Optional[str]
@@ -96,6 +109,7 @@ class AgentState(TypedDict, total=False):
 
     # Pricing per bucket (e.g., scenario) -> list of items
     pricing_results: Dict[str, List[dict]]
+    pricing_fingerprints: Dict[str, str]  # scenario -> fingerprint (incremental re-pricing)
 
     # Comparison
     comparison_results: Dict[str, Dict]
@@ -0,0 +1,159 @@
+# services/ai_engine/app/serve.py
+"""
+Modo de serviço prefork do engine.
+
+O master importa o app, roda o warm-up (catálogo, PRODUCT_DICT, FAISS, BM25,
+TF-IDF, grafo compilado, clientes LLM), faz `gc.freeze()` e só então dá fork em
+N workers uvicorn que aceitam no mesmo socket. Os artefatos read-only ficam nas
+páginas do master e são compartilhados copy-on-write; o freeze tira esses
+objetos do alcance do GC, que senão tocaria (e copiaria) as páginas a cada coleta.
+Cada worker é um processo com GIL próprio: a parte CPU do turno (pandas, regex,
+pricing, JSON) escala com os cores.
+
+Uso:
+    python -m ai_engine.app.serve --port 8002              # 1 worker por CPU (padrão)
+    python -m ai_engine.app.serve --workers 4 --port 8002
+
+O master reinicia workers que morrem e repassa SIGTERM/SIGINT (shutdown gracioso
+do uvicorn em cada worker).
+
+O socket compartilhado manda cada request para um worker qualquer, sem afinidade
+por sessão. Com N > 1 o master liga o que é preciso para isso não importar:
+  - TURN_COORDINATION=redis: lease, ticket e cancelamento por sessão no Redis
+    (app/core/turn_coordination.py), então dois turnos da mesma sessão nunca
+    rodam juntos, a mensagem mais nova supera as que esperam em qualquer
+    worker e /turns/cancel aborta o turno onde ele estiver rodando;
+  - o SingleFlight reivindica a Idempotency-Key no Redis: um retry que cai
+    noutro worker espera o resultado em vez de rodar o grafo de novo;
+  - PROMETHEUS_MULTIPROC_DIR: /metrics soma os contadores de todos os workers;
+  - o summarizer de cada worker pega o lock da sessão no Redis (com token).
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import glob
+import logging
+import os
+import signal
+import socket
+import sys
+import tempfile
+import time
+from typing import Dict
+
+import uvicorn
+
+logger = logging.getLogger("ai_engine.app.serve")
+
+
+def _bind(host: str, port: int, backlog: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app, sock: socket.socket, log_level: str) -> None:
+    # o uvicorn instala os próprios handlers (SIGTERM → shutdown gracioso)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    config = uvicorn.Config(app, lifespan="on", log_level=log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def _spawn(app, sock: socket.socket, log_level: str) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _run_worker(app, sock, log_level)
+        except BaseException:
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def _share_state_between_workers() -> None:
+    """Antes de importar o app: as peças por processo passam a usar Redis / métricas multiprocess."""
+    os.environ.setdefault("TURN_COORDINATION", "redis")
+    metrics_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if not metrics_dir:
+        metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="ai-engine-metrics-")
+    # arquivos de uma execução anterior somariam valores velhos
+    for path in glob.glob(os.path.join(metrics_dir, "*.db")):
+        os.remove(path)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Prefork server for the AI engine.")
+    ap.add_argument("--host", default=os.getenv("ENGINE_HOST", "0.0.0.0"))
+    ap.add_argument("--port", type=int, default=int(os.getenv("ENGINE_PORT", "8002")))
+    ap.add_argument("--workers", type=int, default=int(os.getenv("ENGINE_WORKERS", "0")) or os.cpu_count() or 1)
+    ap.add_argument("--backlog", type=int, default=2048)
+    ap.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info").lower())
+    ap.add_argument("--no-freeze", action="store_true", help="skip gc.freeze() (for RSS comparisons)")
+    args = ap.parse_args()
+
+    args.workers = max(1, args.workers)
+    if args.workers > 1:
+        _share_state_between_workers()
+
+    sock = _bind(args.host, args.port, args.backlog)
+
+    from ai_engine.app.core import telemetry
+    from ai_engine.app.run import app
+    from ai_engine.main import warm_up
+
+    if args.workers > 1:
+        logger.info(f"[Serve] {args.workers} workers: turn coordination={os.environ['TURN_COORDINATION']}, "
+                    f"metrics dir={os.environ['PROMETHEUS_MULTIPROC_DIR']}")
+
+    took = warm_up()
+    gc.collect()
+    if not args.no_freeze:
+        gc.freeze()
+    logger.info(f"🧊 [Serve] master {os.getpid()} warmed up in {took:.2f}s "
+                f"(frozen objects: {gc.get_freeze_count()}); forking {args.workers} worker(s) on {args.host}:{args.port}")
+
+    workers: Dict[int, int] = {}  # pid -> slot
+    for slot in range(args.workers):
+        workers[_spawn(app, sock, args.log_level)] = slot
+
+    stopping = False
+
+    def _stop(signum, _frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        slot = workers.pop(pid, None)
+        telemetry.mark_worker_dead(pid)
+        if slot is None or stopping:
+            continue
+        logger.warning(f"⚠️  [Serve] worker {pid} (slot {slot}) exited with {os.waitstatus_to_exitcode(status)}; "
+                       "restarting")
+        time.sleep(1)  # evita loop de restart se o worker morre no boot
+        workers[_spawn(app, sock, args.log_level)] = slot
+
+    sock.close()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
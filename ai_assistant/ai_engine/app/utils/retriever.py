@@ -4,20 +4,21 @@ from __future__ import annotations
 import logging
 import pickle
 import re
+import threading
 from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Tuple
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Tuple
 
-import numpy as np
-from scipy import sparse
-from sklearn.metrics.pairwise import cosine_similarity
-
-from langchain_community.vectorstores import FAISS
-from langchain_community.retrievers import BM25Retriever
-from langchain_openai import OpenAIEmbeddings
+# numpy/scipy/sklearn/langchain_community são importados sob demanda (load_indices):
+# importar o retriever não carrega índices nem cria o cliente de embeddings.
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import FAISS
+    from langchain_community.retrievers import BM25Retriever
+    from langchain_openai import OpenAIEmbeddings
 
 # Importa settings para que setee OPENAI_API_KEY y rutas antes de usar embeddings
 from ai_engine.app.core.config import settings
+from ai_engine.app.core.telemetry import timed
 
 logger = logging.getLogger(__name__)
 
@@ -60,6 +61,8 @@ def _safe_load_pickle(path: Path):
         return None
 
 def _safe_load_npz(path: Path):
+    from scipy import sparse
+
     try:
         return sparse.load_npz(str(path))
     except Exception as e:
@@ -67,6 +70,8 @@ def _safe_load_npz(path: Path):
         return None
 
 def _safe_load_npz(path: Path):
+    from scipy import sparse
+
     try:
         return sparse.load_npz(str(path))
     except Exception as e:
@@ -80,27 +85,37 @@ def _norm_query(q: str) -> str:
 # ──────────────────────────────────────────────────────────────────────────────
 # Carregamento dos artefatos unificados
 # ──────────────────────────────────────────────────────────────────────────────
-_embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+@lru_cache(maxsize=1)
+def get_embeddings() -> "OpenAIEmbeddings":
+    from langchain_openai import OpenAIEmbeddings
+
+    return OpenAIEmbeddings(model="text-embedding-3-small")
 
 def _load_faiss(dirpath: Path) -> Optional[FAISS]:
     if not dirpath.exists():
         return None
+    from langchain_community.vectorstores import FAISS
+
     try:
         return FAISS.load_local(
             str(dirpath),
-            embeddings=_embeddings,
+            embeddings=get_embeddings(),
             allow_dangerous_deserialization=True,
         )
     except Exception as e:
         logger.warning(f"⚠️  Falha ao carregar FAISS em {dirpath}: {e}")
         return None
 
-faiss_docs: Optional[FAISS] = _load_faiss(FAISS_INDEX_DOCS_DIR)
-bm25_docs:  Optional[BM25Retriever] = _safe_load_pickle(BM25_DOCS_FILE)
+# Preenchidos por load_indices() na primeira busca (ou no warm_up do engine)
+faiss_docs: Optional[FAISS] = None
+bm25_docs:  Optional[BM25Retriever] = None
+
+tfidf_vectorizer = None
+tfidf_matrix     = None
+tfidf_keys: List[str] = []
 
-tfidf_vectorizer = _safe_load_pickle(TFIDF_DOCS_VEC_FILE)
-tfidf_matrix     = _safe_load_npz(TFIDF_DOCS_MAT_FILE)
-tfidf_keys: List[str] = _safe_load_pickle(TFIDF_DOCS_KEYS) or []
+_INDICES_LOADED = False
+_INDICES_LOCK = threading.Lock()
 
 def _tfidf_ok(matrix, keys) -> bool:
     try:
@@ -150,7 +165,21 @@ def _try_build_id_maps_from_faiss():
     except Exception as e:
         logger.warning(f"⚠️  Não foi possível construir id->meta do FAISS: {e}")
 
-_try_build_id_maps_from_faiss()
+def load_indices() -> None:
+    """Carrega FAISS/BM25/TF-IDF uma única vez (thread-safe)."""
+    global faiss_docs, bm25_docs, tfidf_vectorizer, tfidf_matrix, tfidf_keys, _INDICES_LOADED
+    if _INDICES_LOADED:
+        return
+    with _INDICES_LOCK:
+        if _INDICES_LOADED:
+            return
+        faiss_docs = _load_faiss(FAISS_INDEX_DOCS_DIR)
+        bm25_docs = _safe_load_pickle(BM25_DOCS_FILE)
+        tfidf_vectorizer = _safe_load_pickle(TFIDF_DOCS_VEC_FILE)
+        tfidf_matrix = _safe_load_npz(TFIDF_DOCS_MAT_FILE)
+        tfidf_keys = _safe_load_pickle(TFIDF_DOCS_KEYS) or []
+        _try_build_id_maps_from_faiss()
+        _INDICES_LOADED = True
 
 #def _sku_from_key(key: str) -> Optional[str]:
 #    """Para ids do price list (formato SKU__dur__offer) extrai o SKU."""
@@ -173,8 +202,10 @@ def _sku_from_key(key: str) -> Optional[str]:
 # ──────────────────────────────────────────────────────────────────────────────
 # Funções de busca — por DOCUMENTOS (PDF + Price)
 # ──────────────────────────────────────────────────────────────────────────────
+@timed("faiss", "retriever")
 def faiss_search_docs(query: str, k: int = 8, source_group: Optional[str] = None) -> List[Tuple[Any, float]]:
     """Retorna [(Document, score)] — score é distância (menor é melhor)."""
+    load_indices()
     if not faiss_docs:
         return []
     try:
@@ -187,8 +218,10 @@ def faiss_search_docs(query: str, k: int = 8, source_group: Optional[str] = None
         logger.warning(f"FAISS docs search failed: {e}")
         return []
 
+@timed("bm25", "retriever")
 def bm25_search_docs(query: str, k: int = 8, source_group: Optional[str] = None) -> List[Any]:
     """Retorna [Document] ordenados."""
+    load_indices()
     if not bm25_docs:
         return []
     try:
@@ -200,10 +233,15 @@ def bm25_search_docs(query: str, k: int = 8, source_group: Optional[str] = None)
         logger.warning(f"BM25 docs search failed: {e}")
         return []
 
+@timed("tfidf", "retriever")
 def tfidf_scores_by_id(query: str, topk: int = 20) -> Dict[str, float]:
     """Retorna dict {id: score} usando TF-IDF (somente ids, sem Document)."""
+    load_indices()
     if not _tfidf_ok(tfidf_matrix, tfidf_keys) or tfidf_vectorizer is None:
         return {}
+    import numpy as np
+    from sklearn.metrics.pairwise import cosine_similarity
+
     try:
         vec = tfidf_vectorizer.transform([_norm_query(query)])
         sims = cosine_similarity(vec, tfidf_matrix).ravel()
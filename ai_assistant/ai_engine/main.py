@@ -6,21 +6,24 @@ Demonstrates:
 2) Handling specific queries (full quote/design)
 """
 import os
+import asyncio
 from sys import argv
 import json
+from functools import lru_cache
 
-# App
-from ai_engine.app.core.graph import app
+# App (o grafo é compilado no primeiro turno ou no warm_up, não no import)
+from ai_engine.app.core.graph import get_app
 from ai_engine.app.gateway import analyze
 from ai_engine.app.schemas.models import AgentState
-from ai_engine.app.core.memory import ChatMemory
-from ai_engine.app.schemas.models import AgentState
+from ai_engine.app.core.memory import AsyncChatMemory, ChatMemory, LoadedTurn
+from ai_engine.app.core import telemetry
+from ai_engine.app.core.summarizer import SummaryWorker
+from ai_engine.app.domain.models import TurnResult
 from ai_engine.app.schemas.models import SolutionDesign, AgentRoutingDecision
 #from services.ai_engine.app.core.memory import memory
 
 # A simple summarizer chain (you can define this with your other LLM chains)
-from langchain.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
+from langchain_core.prompts import ChatPromptTemplate
 
 import ai_engine.settings as s
 
@@ -38,8 +41,30 @@ New Condensed Summary:"""
 )
 
 # You'll need an LLM instance for this, can be a cheaper/faster one
-summarizer_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0) 
-summarizer_chain = summarizer_prompt | summarizer_llm
+@lru_cache(maxsize=1)
+def get_summarizer_chain():
+    from langchain_openai import ChatOpenAI
+
+    summarizer_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, callbacks=telemetry.LLM_CALLBACKS)
+    return summarizer_prompt | summarizer_llm
+
+
+_WARMED_UP = False
+
+
+def warm_up() -> float:
+    """Aquece o engine inteiro (grafo, LLMs, catálogo, índices e o summarizer)."""
+    global _WARMED_UP
+    from ai_engine.app.core.graph import warm_up as warm_up_graph
+
+    get_summarizer_chain()
+    elapsed = warm_up_graph()
+    _WARMED_UP = True
+    return elapsed
+
+
+def is_warmed_up() -> bool:
+    return _WARMED_UP
 
 
 def _rehydrate_state(st: dict) -> dict:
@@ -64,7 +89,8 @@ def _rehydrate_state(st: dict) -> dict:
                     comps.append({
                         "part_number": c.get("part_number") or c.get("sku"),
                         "quantity": int(c.get("quantity", 1)),
-                        "role": c.get("role", "")
+                        "role": c.get("role", ""),
+                        "fixed_quantity": bool(c.get("fixed_quantity", False)),
                     })
                 try:
                     rebuilt.append(SolutionDesign(
@@ -118,66 +144,101 @@ def _format_chat_window(messages: list[dict]) -> str:
 # FILE: your_main_script.py
 # Make sure these imports are at the top of your file
 import datetime
-from typing import Dict, Any # Assuming you have these for type hints
+from typing import Dict, Any, Tuple # Assuming you have these for type hints
 
 # ... (your other functions like _rehydrate_state, _to_dict, prune_nones)
 
-def _invoke_graph(user_query: str, session_id: str = "local-cli") -> str:
+DEFAULT_WINDOW_TURNS = 15
+
+
+def _summarize(previous_summary: str, messages: list[dict]) -> str:
+    """Summary incremental: summary anterior + só as mensagens novas."""
+    return get_summarizer_chain().invoke({
+        "summary": previous_summary,
+        "new_messages": _format_chat_window(messages),
+    }).content
+
+
+@lru_cache(maxsize=1)
+def get_summary_worker() -> SummaryWorker:
+    return SummaryWorker(
+        summarize_fn=_summarize,
+        memory_factory=lambda sid: ChatMemory(redis_url=s.REDIS_URL, session_id=sid, ttl_seconds=300),
+        keep_last=DEFAULT_WINDOW_TURNS,
+    )
+
+
+def _prepare_turn(memory: ChatMemory, user_query: str) -> dict:
     """
-    Handles the entire process of memory management and graph invocation for a single turn.
+    Logs the user message and loads everything the graph needs for this turn
+    (persisted state, summary and conversation window).
     """
-    memory = ChatMemory(redis_url=s.REDIS_URL, session_id=session_id, ttl_seconds=300)
-    DEFAULT_WINDOW_TURNS = 15
-    
-    # 1. Log the new user message to the conversation history
-    memory.add_user(user_query)
-
-    # 2. Load and prepare the state for this turn
-    persisted = _rehydrate_state(memory.get_state() or {})
+    # 1+2. Log the new user message and load state, recent history and summary
+    # (a single pipelined Redis round trip). Só a cauda da lista (LRANGE -k -1)
+    # e o contador de mensagens: o custo por turno não cresce com a sessão.
+    turn = memory.load_turn(user_query, window=DEFAULT_WINDOW_TURNS)
+    scheduled = get_summary_worker().maybe_schedule(memory.session_id, turn.msg_count, turn.summarized_upto)
+    return _state_from_loaded(user_query, turn, scheduled)
+
+
+async def _aprepare_turn(memory: AsyncChatMemory, user_query: str) -> dict:
+    """Async version of `_prepare_turn` (the same pipeline, awaited on the event loop)."""
+    turn = await memory.load_turn(user_query, window=DEFAULT_WINDOW_TURNS)
+    # o XADD do backend redis vai pelo mesmo cliente asyncio, sem bloquear o loop
+    scheduled = await get_summary_worker().amaybe_schedule(
+        memory.session_id, turn.msg_count, turn.summarized_upto, client=memory.r)
+    return _state_from_loaded(user_query, turn, scheduled)
+
+
+def _state_from_loaded(user_query: str, turn: LoadedTurn, summary_scheduled: bool) -> dict:
+    """Builds the graph input from what `load_turn` returned."""
+    raw_state, window, summary = turn.state, turn.messages, turn.summary
+    old_users_count = raw_state.get("users_count")  # o que está salvo no Redis
+    persisted = _rehydrate_state(raw_state)
     last_updated = persisted.get("last_updated", "N/A (first run)")
     print(f"\n🔄 [Memory] Loaded state from: {last_updated}")
-    
-    all_messages = memory.get_messages()
-    summary = memory.get_summary()
 
-    # 3. Active Summarization Logic
-    if len(all_messages) > 8 and len(all_messages) % 8 == 0:
-        print("\n🔄 [Memory] Summarizing conversation history...")
-        messages_to_summarize = all_messages[-DEFAULT_WINDOW_TURNS:]
-        
-        new_summary_content = summarizer_chain.invoke({
-            "summary": summary,
-            "new_messages": _format_chat_window(messages_to_summarize)
-        }).content
-        
-        memory.set_summary(new_summary_content)
-        summary = new_summary_content
-        print("   - Summary updated.")
+    # 3. Summarization runs in the background: o turno só agenda o job (quem
+    # chama, ver _prepare_turn/_aprepare_turn) e segue com o summary atual
+    # (o próximo turno já lê a versão nova).
+    if summary_scheduled:
+        print(f"\n🔄 [Memory] Summary scheduled ({turn.msg_count - turn.summarized_upto} new messages)")
 
     # 4. Prepare the initial state object for the graph run
-    window = all_messages[-DEFAULT_WINDOW_TURNS:]
     persisted.update({
         "user_query": user_query,
         "conversation_window": _format_chat_window(window),
         "conversation_summary": summary or "",
     })
     new_users_count = persisted.get("users_count")  # o valor que veio da nova interação
-    old_users_count = memory.get_state().get("users_count")  # pega o que está salvo no Redis
     if new_users_count is None or new_users_count == old_users_count:
     	persisted["users_count"] = old_users_count  # mantém o valor antigo
     else:
     	persisted["users_count"] = new_users_count
 
-    # 5. Run the graph with robust error handling
-    try:
-        print("\n🚀 [Graph] Invoking the agent graph...")
-        final_state_obj = app.invoke(AgentState(**persisted))
-        print("   - Graph execution finished successfully.")
-    except Exception as e:
-        print(f"\n❌ [Graph ERROR] The graph execution failed: {e}")
-        final_state_obj = persisted 
-        final_state_obj['final_response'] = "I'm sorry, I encountered an error and couldn't process your request."
+    return persisted
+
+
+def _graph_failed(persisted: dict, e: Exception) -> dict:
+    print(f"\n❌ [Graph ERROR] The graph execution failed: {e}")
+    final_state_obj = persisted 
+    final_state_obj['final_response'] = "I'm sorry, I encountered an error and couldn't process your request."
+    return final_state_obj
+
 
+def _finish_turn(memory: ChatMemory, persisted: dict, final_state_obj) -> Tuple[str, dict]:
+    """
+    Merges the graph output into the persisted state, saves the lean state and
+    the assistant message (one pipelined Redis round trip), and returns the
+    final user-facing message plus the lean state as stored.
+    """
+    final_msg, lean_state, ai_message_for_history = _lean_turn_output(persisted, final_state_obj)
+    stored = memory.save_turn(lean_state, ai_message_for_history)
+    return final_msg, stored
+
+
+def _lean_turn_output(persisted: dict, final_state_obj) -> Tuple[str, dict, str]:
+    """Final message, lean state to persist and the assistant message for the history."""
     # 6. Process the final state to prepare for saving
     out = _to_dict(final_state_obj)
     merged_state = {**persisted, **prune_nones(out)}
@@ -187,17 +248,13 @@ def _invoke_graph(user_query: str, session_id: str = "local-cli") -> str:
     keys_to_persist = [
         "solution_designs", "previous_solution_designs", "pricing_results", "refinements",
         "last_question", "last_answer", "client_name", "users_count",
-        "product_domain",
+        "product_domain", "pricing_fingerprints", "ea",
     ]
     lean_state_to_persist = {key: merged_state.get(key) for key in keys_to_persist}
 
     timestamp = datetime.datetime.now().isoformat()
     lean_state_to_persist["last_updated"] = timestamp
 
-    # 8. Save the state and the AI's message to Redis
-    print(f"\n💾 [Memory] Persisting lean state to Redis at {timestamp}...")
-    memory.set_state(lean_state_to_persist)
-    
     # --- ADJUSTMENT IS HERE ---
     # Get the intent for the current turn to decide what to save in the chat history
     intent = merged_state.get("next_flow")
@@ -209,25 +266,104 @@ def _invoke_graph(user_query: str, session_id: str = "local-cli") -> str:
     else: # For 'question' intent
         ai_message_for_history = final_msg
     
-    # Save the clean, potentially summarized message to the conversation list
-    memory.add_ai(ai_message_for_history)
     # --- END OF ADJUSTMENT ---
 
-    # (Optional) You can use the debug print function we created here if you like
-    # print_redis_state(memory.r, session_id)
+    # 8. The caller saves the state and the AI's message (clean, potentially
+    # summarized) to Redis in a single pipeline
+    print(f"\n💾 [Memory] Persisting lean state to Redis at {timestamp}...")
+    return final_msg, lean_state_to_persist, ai_message_for_history
 
-            # --- DEBUG PRINT 2: WHAT WAS JUST SAVED TO REDIS ---
-    #print("\n" + "="*20 + " DEBUG: LEAN STATE SAVED TO REDIS " + "="*20)
-    #print( _format_chat_window(window), summary, merged_state.get("solution_designs"), 'teste para verificar o que o agente esta recebendo 999999999999999999999')
 
-    
-    #print(json.dumps(lean_state_to_persist, indent=2, ensure_ascii=False))
-    #print("="*70)
+def run_turn(user_query: str, session_id: str = "local-cli", design_engine: str | None = None) -> TurnResult:
+    """
+    Handles the entire process of memory management and graph invocation for a single turn.
+    `design_engine` ("llm" | "deterministic") overrides the DESIGN_ENGINE setting for this turn.
+    Returns the final message together with the lean state just persisted.
+    """
+    with telemetry.collect_turn() as timings:
+        memory = ChatMemory(redis_url=s.REDIS_URL, session_id=session_id, ttl_seconds=300)
+        with telemetry.stage("memory_load"):
+            persisted = _prepare_turn(memory, user_query)
+        if design_engine:
+            persisted["design_engine"] = design_engine
+
+        # 5. Run the graph with robust error handling
+        try:
+            print("\n🚀 [Graph] Invoking the agent graph...")
+            final_state_obj = get_app().invoke(AgentState(**persisted))
+            print("   - Graph execution finished successfully.")
+        except Exception as e:
+            final_state_obj = _graph_failed(persisted, e)
+
+        with telemetry.stage("memory_save"):
+            final_msg, stored = _finish_turn(memory, persisted, final_state_obj)
+    return TurnResult(final_message=final_msg, state=stored, timings=timings.as_event())
 
-    return final_msg
 
+# Saves em andamento por sessão: o próximo turno da sessão espera o save anterior
+# (ordem das mensagens e state consistente), os outros não esperam ninguém.
+_PENDING_SAVES: Dict[str, asyncio.Task] = {}
 
 
+async def _persist_in_order(session_id: str, previous: asyncio.Task | None, save) -> None:
+    if previous is not None:
+        await asyncio.gather(previous, return_exceptions=True)
+    try:
+        with telemetry.stage("memory_save"):
+            await save
+    except Exception as e:
+        print(f"\n❌ [Memory ERROR] Could not persist turn for {session_id}: {e}")
+
+
+async def drain_pending_saves() -> None:
+    """Espera os saves em background (shutdown)."""
+    if _PENDING_SAVES:
+        await asyncio.gather(*_PENDING_SAVES.values(), return_exceptions=True)
+
+
+async def arun_turn(user_query: str, session_id: str = "local-cli", design_engine: str | None = None) -> TurnResult:
+    """
+    Async version of `run_turn`: the graph runs with `app.ainvoke` and the
+    memory is loaded/persisted with redis.asyncio, all on the event loop
+    (LLM and Redis calls are awaited, not parked on a thread).
+
+    The save is not awaited: it runs as a task (`TurnResult.saved`) while the
+    caller builds and serializes the response. The next turn of the same
+    session waits for it before loading.
+    """
+    previous = _PENDING_SAVES.get(session_id)
+    if previous is not None:
+        await asyncio.gather(previous, return_exceptions=True)
+
+    with telemetry.collect_turn() as timings:
+        memory = AsyncChatMemory(redis_url=s.REDIS_URL, session_id=session_id, ttl_seconds=300)
+        with telemetry.stage("memory_load"):
+            persisted = await _aprepare_turn(memory, user_query)
+        if design_engine:
+            persisted["design_engine"] = design_engine
+
+        try:
+            print("\n🚀 [Graph] Invoking the agent graph (async)...")
+            final_state_obj = await get_app().ainvoke(AgentState(**persisted))
+            print("   - Graph execution finished successfully.")
+        except Exception as e:
+            final_state_obj = _graph_failed(persisted, e)
+
+        final_msg, lean_state, ai_message_for_history = _lean_turn_output(persisted, final_state_obj)
+
+    # um turno concorrente da mesma sessão pode ter agendado um save nesse meio tempo
+    saved = asyncio.create_task(_persist_in_order(
+        session_id, _PENDING_SAVES.get(session_id), memory.save_turn(lean_state, ai_message_for_history)
+    ))
+    _PENDING_SAVES[session_id] = saved
+    saved.add_done_callback(lambda t: _PENDING_SAVES.pop(session_id, None) if _PENDING_SAVES.get(session_id) is t else None)
+    return TurnResult(final_message=final_msg, state=lean_state, timings=timings.as_event(), saved=saved)
+
+
+def _invoke_graph(user_query: str, session_id: str = "local-cli", design_engine: str | None = None) -> str:
+    """Single turn, final message only (CLI)."""
+    return run_turn(user_query, session_id=session_id, design_engine=design_engine).final_message
+
 
 def run_sales_quote(query: str) -> str:
     """Útil para API externa ou testes em uma chamada."""
@@ -0,0 +1,119 @@
+# services/ai_engine/scripts/bench_import_time.py
+"""
+Benchmark de import do engine (`python -X importtime`).
+
+Para cada módulo, roda um interpretador novo com `-X importtime`, soma o tempo
+cumulativo do import de topo e lista os módulos mais caros. Opcionalmente mede
+também o `warm_up()` (LLMs, grafo compilado, catálogo e índices).
+
+Uso (a partir de ai_assistant/, onde `ai_engine` é importável):
+    python ai_engine/scripts/bench_import_time.py
+    python ai_engine/scripts/bench_import_time.py --modules ai_engine.app.core.graph --top 25
+    python ai_engine/scripts/bench_import_time.py --warm-up --repeat 5
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+DEFAULT_MODULES = [
+    "ai_engine.app.run",            # servidor FastAPI (health checks)
+    "ai_engine.app.api.compat",     # router de turns → engine
+    "ai_engine.app.core.graph",     # helpers do grafo (testes/CLIs)
+    "ai_engine.main",               # runner do engine
+]
+
+# "import time: self [us] | cumulative | imported package"
+_LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S.*)$")
+
+
+def _run_importtime(module: str) -> Tuple[float, List[Tuple[int, str]]]:
+    """Retorna (cumulativo do módulo em ms, [(cumulativo_us, nome)] de todos os imports)."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if proc.returncode != 0:
+        tail = "\n".join(proc.stderr.strip().splitlines()[-5:])
+        raise RuntimeError(f"import {module} failed:\n{tail}")
+
+    rows: List[Tuple[int, str]] = []
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if not m:
+            continue
+        cumulative, indent, name = int(m.group(2)), len(m.group(3)), m.group(4).strip()
+        rows.append((cumulative, name))
+        # imports de topo do módulo alvo e dos pacotes pai (ignora o que o site carrega)
+        if indent <= 1 and (name == module or module.startswith(name + ".")):
+            total_us += cumulative
+    return total_us / 1000.0, rows
+
+
+def _run_warm_up() -> float:
+    code = (
+        "import time; t0 = time.perf_counter();"
+        "from ai_engine.main import warm_up; warm_up();"
+        "print(f'__WARM__ {time.perf_counter() - t0:.4f}')"
+    )
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    m = re.search(r"__WARM__ ([\d.]+)", proc.stdout)
+    if proc.returncode != 0 or not m:
+        raise RuntimeError(f"warm_up failed:\n{proc.stderr[-2000:]}")
+    return float(m.group(1)) * 1000.0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Import-time benchmark for the AI engine.")
+    ap.add_argument("--modules", nargs="+", default=DEFAULT_MODULES)
+    ap.add_argument("--repeat", type=int, default=3, help="runs per module (reports the median)")
+    ap.add_argument("--top", type=int, default=15, help="most expensive imports to list per module")
+    ap.add_argument("--warm-up", action="store_true", help="also time ai_engine.main.warm_up() (needs data + API key)")
+    ap.add_argument("--budget-ms", type=float, default=1000.0, help="flag modules slower than this")
+    args = ap.parse_args()
+
+    results: Dict[str, float] = {}
+    for module in args.modules:
+        runs, last_rows = [], []
+        try:
+            for _ in range(max(1, args.repeat)):
+                total_ms, last_rows = _run_importtime(module)
+                runs.append(total_ms)
+        except RuntimeError as e:
+            print(f"[error] {e}")
+            continue
+
+        med = statistics.median(runs)
+        results[module] = med
+        print(f"\n=== {module}: median {med:.1f} ms over {len(runs)} run(s) ===")
+        seen = set()
+        for cumulative, name in sorted(last_rows, reverse=True):
+            if name in seen:
+                continue
+            seen.add(name)
+            print(f"  {cumulative / 1000.0:9.1f} ms  {name}")
+            if len(seen) >= args.top:
+                break
+
+    if args.warm_up:
+        try:
+            print(f"\n=== warm_up(): {_run_warm_up():.1f} ms (includes importing ai_engine.main) ===")
+        except RuntimeError as e:
+            print(f"[error] {e}")
+
+    print("\nSummary")
+    for module, ms in results.items():
+        flag = "  <-- over budget" if ms > args.budget_ms else ""
+        print(f"  {ms:9.1f} ms  {module}{flag}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# services/ai_engine/scripts/bench_prefork.py
+"""
+Memória por worker e escala de throughput do modo prefork (ai_engine.app.serve).
+
+Para cada valor de --workers sobe o servidor, espera o /readyz, lê RSS e PSS do
+master e de cada worker em /proc/<pid>/smaps_rollup (PSS divide as páginas
+compartilhadas copy-on-write entre os processos, RSS conta tudo em cada um),
+dispara --requests requisições com --concurrency clientes e mede req/s e
+latências. Os turnos chamam o LLM de verdade: use uma chave de teste ou aponte
+--path/--body para o que quiser medir.
+
+Uso (a partir de ai_assistant/, Linux):
+    python ai_engine/scripts/bench_prefork.py --workers 1 2 4 --requests 200 --concurrency 16
+    python ai_engine/scripts/bench_prefork.py --workers 4 --no-freeze   # compara sem gc.freeze()
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+
+def _children(pid: int) -> List[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(x) for x in f.read().split()]
+    except FileNotFoundError:
+        return []
+
+
+def _mem_kb(pid: int) -> Dict[str, int]:
+    out = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Dirty"):
+                out[key] = int(rest.split()[0])
+    return out
+
+
+def _wait_ready(base: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base}/readyz", timeout=2) as r:
+                if r.status == 200:
+                    return
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"{base} not ready after {timeout}s")
+
+
+def _request(url: str, body: bytes, i: int) -> float:
+    headers = {"Content-Type": "application/json", "X-Session-Id": f"bench-{i}"}
+    req = urllib.request.Request(url, data=body, headers=headers, method="POST" if body else "GET")
+    t0 = time.perf_counter()
+    with urllib.request.urlopen(req, timeout=300) as r:
+        r.read()
+    return time.perf_counter() - t0
+
+
+def _run(args, workers: int) -> None:
+    base = f"http://127.0.0.1:{args.port}"
+    cmd = [sys.executable, "-m", "ai_engine.app.serve", "--workers", str(workers),
+           "--port", str(args.port), "--host", "127.0.0.1", "--log-level", "warning"]
+    if args.no_freeze:
+        cmd.append("--no-freeze")
+    master = subprocess.Popen(cmd, stdout=subprocess.DEVNULL if not args.verbose else None)
+    try:
+        _wait_ready(base, args.ready_timeout)
+        time.sleep(1)  # todos os workers passam pelo startup
+        kids = _children(master.pid)
+        mem = {pid: _mem_kb(pid) for pid in [master.pid, *kids]}
+
+        body = args.body.encode() if args.body else b""
+        url = base + args.path
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            list(pool.map(lambda i: _request(url, body, i), range(min(args.concurrency, args.requests))))  # aquecimento
+            t0 = time.perf_counter()
+            lat = sorted(pool.map(lambda i: _request(url, body, i), range(args.requests)))
+            wall = time.perf_counter() - t0
+
+        w_rss = [mem[p]["Rss"] for p in kids]
+        w_pss = [mem[p]["Pss"] for p in kids]
+        print(f"\nworkers={workers}{' (no freeze)' if args.no_freeze else ''}")
+        print(f"  master   RSS {mem[master.pid]['Rss'] / 1024:8.1f} MB | PSS {mem[master.pid]['Pss'] / 1024:8.1f} MB")
+        print(f"  worker   RSS {statistics.mean(w_rss) / 1024:8.1f} MB | PSS {statistics.mean(w_pss) / 1024:8.1f} MB (mean of {len(kids)})")
+        print(f"  total PSS {sum(m['Pss'] for m in mem.values()) / 1024:8.1f} MB")
+        print(f"  {args.requests / wall:8.2f} req/s | p50 {lat[len(lat) // 2] * 1000:.0f} ms "
+              f"| p95 {lat[int(len(lat) * 0.95) - 1] * 1000:.0f} ms")
+    finally:
+        master.terminate()
+        master.wait(timeout=30)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Prefork RSS/PSS and throughput benchmark.")
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--port", type=int, default=18002)
+    ap.add_argument("--path", default="/turns/")
+    ap.add_argument("--body", default=json.dumps({"message": "Quote 48 Meraki MR44 access points for 300 users"}))
+    ap.add_argument("--requests", type=int, default=100)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--ready-timeout", type=float, default=300)
+    ap.add_argument("--no-freeze", action="store_true")
+    ap.add_argument("--verbose", action="store_true")
+    args = ap.parse_args()
+
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        sys.exit("needs Linux /proc/<pid>/smaps_rollup")
+    for n in args.workers:
+        _run(args, n)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# services/ai_engine/scripts/bench_redis_round_trips.py
+"""
+Conta round trips ao Redis por turno (memória de conversa do engine).
+
+Cada `send_packed_command` numa conexão é uma ida ao servidor: um pipeline
+conta 1, um comando avulso conta 1. Comparamos:
+
+  - turn:   o caminho real do engine — `_prepare_turn` (load_turn) + `_finish_turn`
+            (save_turn), com um estado final sintético no lugar da execução do grafo
+            (sem LLM). O compat recebe o lean state de volta, sem nova leitura.
+  - legacy: a sequência de chamadas por operação usada antes do load_turn/save_turn
+            (add_user, get_state, get_messages, get_summary, get_state, set_state,
+            add_ai e o get_state do compat). Com a implementação antiga eram 14
+            round trips (RPUSH+2×EXPIRE, HEXISTS+HGET, HSET+EXPIRE...).
+
+Uso (a partir de ai_assistant/, com um Redis de teste acessível):
+    REDIS_URL=redis://localhost:6379/15 python ai_engine/scripts/bench_redis_round_trips.py --turns 5
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import time
+import uuid
+
+import redis
+
+from ai_engine.app.core.memory import ChatMemory
+
+
+class CountingConnection(redis.Connection):
+    """Connection que conta cada envio (= um round trip)."""
+
+    sends = 0
+
+    def send_packed_command(self, command, check_health=True):
+        CountingConnection.sends += 1
+        return super().send_packed_command(command, check_health)
+
+
+def _fake_final_state(turn: int) -> dict:
+    return {
+        "next_flow": "quote",
+        "final_response": f"Quote #{turn} ready.",
+        "solution_designs": [{
+            "summary": "Essential (Good)",
+            "justification": "bench",
+            "components": [{"part_number": "MR44-HW", "quantity": 5, "role": "ap"}],
+        }],
+        "pricing_results": {"Essential (Good)": [{"part_number": "MR44-HW", "quantity": 5, "unit_price": 100.0}]},
+        "users_count": 50,
+    }
+
+
+def _turn_pipelined(memory: ChatMemory, turn: int) -> None:
+    from ai_engine.main import _finish_turn, _prepare_turn
+
+    persisted = _prepare_turn(memory, f"bench question {turn}")
+    _finish_turn(memory, persisted, _fake_final_state(turn))
+
+
+def _turn_legacy(memory: ChatMemory, turn: int) -> None:
+    memory.add_user(f"bench question {turn}")
+    memory.get_state()
+    memory.get_messages()
+    memory.get_summary()
+    memory.get_state()                     # users_count re-read
+    memory.set_state(_fake_final_state(turn))
+    memory.add_ai(f"Quote #{turn} ready.")
+    memory.get_state()                     # compat re-read of the lean state
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Redis round trips per engine turn.")
+    ap.add_argument("--redis-url", default=os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    ap.add_argument("--turns", type=int, default=5)
+    args = ap.parse_args()
+
+    pool = redis.ConnectionPool.from_url(args.redis_url, connection_class=CountingConnection)
+    client = redis.Redis(connection_pool=pool)
+    client.ping()  # abre a conexão (handshake fora da contagem)
+
+    for mode, run in (("legacy", _turn_legacy), ("turn", _turn_pipelined)):
+        session = f"bench-{mode}-{uuid.uuid4().hex[:8]}"
+        memory = ChatMemory(redis_url=args.redis_url, session_id=session, client=client)
+        trips, elapsed = [], []
+        try:
+            for turn in range(1, args.turns + 1):
+                before = CountingConnection.sends
+                t0 = time.perf_counter()
+                run(memory, turn)
+                elapsed.append((time.perf_counter() - t0) * 1000)
+                trips.append(CountingConnection.sends - before)
+        finally:
+            memory.reset_state()
+        print(f"{mode:>7}: round trips/turn min={min(trips)} max={max(trips)} "
+              f"| memory time/turn median={statistics.median(elapsed):.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# services/ai_engine/scripts/bench_serialization.py
+"""
+CPU de serialização de uma sessão de quote grande: 3 cenários com `--lines`
+linhas cada e `--messages` mensagens de chat.
+
+Engine: render do TurnOut (o dict que o FastAPI entrega à response class)
+com o JSONResponse padrão (json.dumps) vs FastJSONResponse (orjson).
+
+API (se o pacote `api/` estiver ao lado de ai_assistant/): frame QUOTE_UPDATED
+como era (`json.dumps(session.model_dump())`), com `model_dump_json`, e o
+snapshot com mensagens/cenários já serializados em cache (o caso de reenvio
+depois de um turno que só acrescentou mensagens).
+
+Uso (a partir de ai_assistant/):
+    python ai_engine/scripts/bench_serialization.py --lines 200 --messages 40 --repeat 200
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+from fastapi.responses import JSONResponse
+
+from ai_engine.app.core import serialization
+from ai_engine.app.core.serialization import FastJSONResponse
+from ai_engine.app.domain.models import TurnOut
+
+SCENARIOS = (("cost", "Cost-Optimized"), ("balanced", "Balanced"), ("feature", "Feature-Rich"))
+
+
+def _quote(label: str, lines: int) -> Dict[str, Any]:
+    items = [{
+        "id": f"{label}-{i}", "category": "Switch", "productCode": f"C9300-{48 + i}P-E",
+        "product": f"Catalyst 9300 48-port PoE+ switch, Network Advantage ({i})",
+        "leadTime": {"kind": "days", "value": 21}, "unitPrice": 4123.45 + i,
+        "quantity": 2 + i % 7, "currency": "USD",
+    } for i in range(lines)]
+    subtotal = round(sum(it["unitPrice"] * it["quantity"] for it in items), 2)
+    return {
+        "header": {
+            "title": f"{label} Solution", "dealId": "D-778812", "quoteNumber": "Q-100234",
+            "status": "DRAFT", "expiryDate": "2026-12-31", "priceProtectionExpiry": None,
+            "priceList": {"name": "Global Price List", "region": "NA", "currency": "USD"},
+        },
+        "items": items,
+        "summary": {"currency": "USD", "subtotal": subtotal, "tax": None, "discount": None, "total": subtotal},
+        "traceId": "7b0e3f9c-3f4b-4b8e-a1a5-2f1d1c0b9a77",
+    }
+
+
+def _session(lines: int, messages: int) -> Dict[str, Any]:
+    return {
+        "id": "sess-bench", "userId": "bench",
+        "chatMessages": [{
+            "id": f"m{i}", "sessionId": "sess-bench", "role": "user" if i % 2 == 0 else "assistant",
+            "content": "Quote 48 Meraki MR44 access points for 300 users in São Paulo " * 3,
+            "timestamp": "2026-01-01T00:00:00",
+        } for i in range(messages)],
+        "scenarios": [{"id": sid, "label": label, "quote": _quote(label, lines)} for sid, label in SCENARIOS],
+        "title": "Balanced Solution",
+    }
+
+
+def _median_us(fn: Callable[[], Any], repeat: int) -> float:
+    fn()
+    times: List[float] = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times) * 1e6
+
+
+def _row(name: str, fn: Callable[[], Any], repeat: int, base: float | None = None) -> float:
+    us = _median_us(fn, repeat)
+    size = len(fn())
+    gain = f"{base / us:5.1f}x" if base else "     -"
+    print(f"{name:>34} | {size:>8} | {us:>10.1f} | {gain}")
+    return us
+
+
+def _bench_engine(session: Dict[str, Any], repeat: int) -> None:
+    out = TurnOut(assistant_message="Here are three options.", scenarios=session["scenarios"], events=[])
+    content = out.model_dump()
+    print("\nengine: TurnOut response render")
+    base = _row("JSONResponse (json.dumps)", lambda: JSONResponse(content).body, repeat)
+    _row("FastJSONResponse", lambda: FastJSONResponse(content).body, repeat, base)
+
+
+def _bench_api(session_dict: Dict[str, Any], repeat: int) -> None:
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+    try:
+        from api.core.serialization import ws_frame
+        from api.domain.session_sync import VersionedSession
+        from api.models.quote import QuoteSession
+    except ImportError as e:
+        print(f"\napi package not importable ({e}); skipping WS frame rows")
+        return
+
+    session = QuoteSession(**session_dict)
+    entry = VersionedSession.adopt(session, version=1)
+    entry.snapshot_json()  # aquece o cache (mensagens + cenários)
+
+    print("\napi: QUOTE_UPDATED / QUOTE_SNAPSHOT frame")
+    base = _row("json.dumps(model_dump())",
+                lambda: json.dumps({"event": "QUOTE_UPDATED", "data": session.model_dump()}), repeat)
+    _row("model_dump_json frame", lambda: ws_frame("QUOTE_UPDATED", session.model_dump_json()), repeat, base)
+    _row("cached snapshot_json", lambda: ws_frame("QUOTE_SNAPSHOT", entry.snapshot_json()), repeat, base)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="JSON serialization benchmark (engine responses and WS frames).")
+    ap.add_argument("--lines", type=int, default=200, help="quote lines per scenario")
+    ap.add_argument("--messages", type=int, default=40, help="chat messages in the session")
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args()
+
+    if serialization.orjson is None:
+        print("orjson not installed: FastJSONResponse falls back to json, expect ~1x")
+    session = _session(args.lines, args.messages)
+    print(f"{'':>34} | {'bytes':>8} | {'median µs':>10} | gain")
+    _bench_engine(session, args.repeat)
+    _bench_api(session, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# services/ai_engine/scripts/bench_state_codec.py
+"""
+Tamanho e CPU do state persistido: JSON legado vs state_codec (msgpack, msgpack+zstd).
+
+O state sintético imita o lean state de um turno de quote: 3 cenários com
+`--lines` linhas de pricing cada, designs como SolutionDesign, refinements e EA.
+Decode inclui a reconstrução dos SolutionDesign (o que o _rehydrate_state faz
+com o JSON; no codec eles já voltam tipados).
+
+Uso (a partir de ai_assistant/, sem Redis):
+    python ai_engine/scripts/bench_state_codec.py --lines 40 --repeat 500
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import time
+
+from ai_engine.app.core import state_codec
+from ai_engine.app.core.state_codec import _to_jsonable, decode_state, encode_state
+from ai_engine.app.schemas.models import AgentRoutingDecision, SolutionDesign
+
+SCENARIOS = ("Essential (Good)", "Standard (Better)", "Complete (Best)")
+
+
+def _synthetic_state(lines: int) -> dict:
+    designs, pricing = [], {}
+    for name in SCENARIOS:
+        comps = [{"part_number": f"C9300-{48 + i}P-E", "quantity": 2 + i % 7, "role": "access switch",
+                  "fixed_quantity": i % 5 == 0} for i in range(lines)]
+        designs.append(SolutionDesign(summary=f"{name}: campus refresh", justification="bench " * 20,
+                                      components=comps))
+        pricing[name] = [{
+            "part_number": c["part_number"], "description": f"Catalyst 9300 {c['part_number']} switch",
+            "quantity": c["quantity"], "unit_price": 4123.45 + i, "discount_pct": 0.38,
+            "unit_net_price": round((4123.45 + i) * 0.62, 2), "subtotal": round((4123.45 + i) * 0.62 * c["quantity"], 2),
+            "currency": "USD", "lead_time_days": 21, "source": "price_book",
+        } for i, c in enumerate(comps)]
+    return {
+        "solution_designs": designs,
+        "previous_solution_designs": designs[:1],
+        "pricing_results": pricing,
+        "pricing_fingerprints": {name: "ab12cd34ef56ab78" * 4 for name in SCENARIOS},
+        "orchestrator_decision": AgentRoutingDecision(needs_design=True, needs_pricing=True),
+        "refinements": [{"question": "How many users?", "answer": "250"}] * 4,
+        "ea": {"by_scenario": {name: {"eligible": True, "spend": 123456.7} for name in SCENARIOS}},
+        "users_count": 250,
+        "client_name": "ACME",
+        "last_updated": "2026-01-01T00:00:00",
+    }
+
+
+def _legacy_encode(state: dict) -> bytes:
+    return json.dumps(_to_jsonable(state)).encode()
+
+
+def _legacy_decode(raw: bytes) -> dict:
+    st = json.loads(raw)
+    st["solution_designs"] = [SolutionDesign(**d) for d in st.get("solution_designs") or []]
+    st["previous_solution_designs"] = [SolutionDesign(**d) for d in st.get("previous_solution_designs") or []]
+    st["orchestrator_decision"] = AgentRoutingDecision(**st["orchestrator_decision"])
+    return st
+
+
+def _measure(encode, decode, state: dict, repeat: int):
+    raw = encode(state)
+    enc, dec = [], []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        raw = encode(state)
+        enc.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        decode(raw)
+        dec.append(time.perf_counter() - t0)
+    return len(raw), statistics.median(enc) * 1e6, statistics.median(dec) * 1e6
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Persisted state codec benchmark.")
+    ap.add_argument("--lines", type=int, default=40, help="pricing lines per scenario")
+    ap.add_argument("--repeat", type=int, default=500)
+    args = ap.parse_args()
+
+    state = _synthetic_state(args.lines)
+    # (nome, encode, decode, STATE_ZSTD_MIN_BYTES forçado)
+    modes = [("json (legacy)", _legacy_encode, _legacy_decode, None)]
+    if state_codec.BINARY_ENABLED:
+        modes.append(("msgpack", encode_state, decode_state, 1 << 62))
+        if state_codec.zstandard is not None:
+            modes.append(("msgpack+zstd", encode_state, decode_state, 0))
+    else:
+        print("msgpack not installed: state_codec falls back to JSON, only the legacy row is measured")
+
+    default_min = state_codec.STATE_ZSTD_MIN_BYTES
+    print(f"{'codec':>14} | {'bytes':>8} | {'encode µs':>10} | {'decode µs':>10}")
+    for name, encode, decode, zstd_min in modes:
+        state_codec.STATE_ZSTD_MIN_BYTES = default_min if zstd_min is None else zstd_min
+        size, e, d = _measure(encode, decode, state, args.repeat)
+        print(f"{name:>14} | {size:>8} | {e:>10.1f} | {d:>10.1f}")
+    state_codec.STATE_ZSTD_MIN_BYTES = default_min
+
+
+if __name__ == "__main__":
+    main()
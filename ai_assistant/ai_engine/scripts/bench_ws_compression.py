@@ -0,0 +1,127 @@
+# services/ai_engine/scripts/bench_ws_compression.py
+"""
+Bytes no fio e CPU para comprimir os frames do WebSocket da API (`api/`, ao
+lado de ai_assistant/) em sessões representativas: uma conversa de `--turns`
+turnos onde cada turno manda um QUOTE_SNAPSHOT (sessão completa, o pior caso:
+resync/reconexão) e um QUOTE_PATCH (o caso normal).
+
+Variantes:
+  raw                    texto sem compressão
+  pmd uvicorn default    permessage-deflate como o uvicorn (impl websockets)
+                         negocia hoje: window 15 bits, memLevel 8, context takeover
+  pmd sansio (12 bits)   permessage-deflate com janela de 12 bits / memLevel 5
+  app deflate L1 / L6    frame binário da API (`compress_frame`), sem estado,
+                         só acima de `--min-bytes`
+
+Uso (a partir de ai_assistant/):
+    python ai_engine/scripts/bench_ws_compression.py --turns 20 --min-bytes 4096
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import zlib
+from typing import Callable, Dict, List, Tuple
+
+from bench_serialization import _session  # mesmo formato de sessão
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+from api.core.serialization import compress_frame, dumps_str, ws_frame  # noqa: E402
+from api.domain.session_sync import VersionedSession  # noqa: E402
+from api.models.chat import ChatMessage  # noqa: E402
+from api.models.quote import QuoteSession  # noqa: E402
+
+PROFILES = {"small": (5, 6), "medium": (50, 20), "large": (200, 40)}
+
+Encoder = Callable[[bytes], int]
+
+
+def _frames(lines: int, messages: int, turns: int) -> List[Tuple[str, bytes]]:
+    """(tipo, frame) de uma conversa: a cada turno chegam 2 mensagens."""
+    entry = VersionedSession.adopt(QuoteSession(**_session(lines, messages)), version=1)
+    out: List[Tuple[str, bytes]] = []
+    for t in range(turns):
+        new = [
+            ChatMessage(id=f"t{t}-{i}", sessionId=entry.session.id, role=role,
+                        content=f"Turn {t}: add 12 more MR44 access points to the Balanced option " * 2,
+                        timestamp="2026-01-01T00:00:00")
+            for i, role in enumerate(("user", "assistant"))
+        ]
+        from_version = entry.version
+        ops = entry.commit_turn(new, new_title=None, new_scenarios_doc=None)
+        patch = {"sessionId": entry.session.id, "fromVersion": from_version,
+                 "version": entry.version, "ops": ops}
+        out.append(("patch", ('{"event":"QUOTE_PATCH","data":' + dumps_str(patch) + "}").encode()))
+        out.append(("snapshot", ws_frame("QUOTE_SNAPSHOT", entry.snapshot_json()).encode()))
+    return out
+
+
+def _pmd(wbits: int, mem_level: int) -> Encoder:
+    # mesmo que websockets.extensions.permessage_deflate.PerMessageDeflate.encode
+    enc = zlib.compressobj(wbits=-wbits, memLevel=mem_level)
+
+    def encode(data: bytes) -> int:
+        out = enc.compress(data) + enc.flush(zlib.Z_SYNC_FLUSH)
+        return len(out) - 4  # o cauda 00 00 ff ff não vai no fio
+
+    return encode
+
+
+def _app(level: int, min_bytes: int) -> Encoder:
+    def encode(data: bytes) -> int:
+        if len(data) < min_bytes:
+            return len(data)
+        return len(compress_frame(data, level))
+
+    return encode
+
+
+def _run(frames: List[Tuple[str, bytes]], make: Callable[[], Encoder]) -> Dict[str, float]:
+    # context takeover: cada conexão tem seu encoder, os frames passam em ordem
+    enc = make()
+    sizes: Dict[str, int] = {"patch": 0, "snapshot": 0}
+    times: Dict[str, List[float]] = {"patch": [], "snapshot": []}
+    for kind, data in frames:
+        t0 = time.perf_counter()
+        sizes[kind] += enc(data)
+        times[kind].append(time.perf_counter() - t0)
+    return {
+        "patch_bytes": sizes["patch"], "snapshot_bytes": sizes["snapshot"],
+        "patch_us": statistics.median(times["patch"]) * 1e6,
+        "snapshot_us": statistics.median(times["snapshot"]) * 1e6,
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="WebSocket frame compression benchmark.")
+    ap.add_argument("--turns", type=int, default=20)
+    ap.add_argument("--min-bytes", type=int, default=4096, help="threshold of the app-level frame")
+    ap.add_argument("--profiles", default="small,medium,large")
+    args = ap.parse_args()
+
+    variants: List[Tuple[str, Callable[[], Encoder]]] = [
+        ("raw", lambda: len),
+        ("pmd uvicorn default", lambda: _pmd(15, 8)),
+        ("pmd sansio (12 bits)", lambda: _pmd(12, 5)),
+        ("app deflate L1", lambda: _app(1, args.min_bytes)),
+        ("app deflate L6", lambda: _app(6, args.min_bytes)),
+    ]
+    for name in args.profiles.split(","):
+        lines, messages = PROFILES[name]
+        frames = _frames(lines, messages, args.turns)
+        print(f"\n{name}: {lines} lines x 3 scenarios, {messages}+ messages, {args.turns} turns")
+        print(f"{'':>22} | {'snapshot B':>10} | {'µs':>7} | {'patch B':>8} | {'µs':>6} | ratio")
+        raw = None
+        for label, make in variants:
+            r = _run(frames, make)
+            total = r["patch_bytes"] + r["snapshot_bytes"]
+            raw = raw or total
+            print(f"{label:>22} | {r['snapshot_bytes'] / args.turns:>10.0f} | {r['snapshot_us']:>7.1f}"
+                  f" | {r['patch_bytes'] / args.turns:>8.0f} | {r['patch_us']:>6.1f} | {raw / total:4.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+# services/ai_engine/scripts/loadtest.py
+"""
+Teste de carga ponta a ponta sem OpenAI: o engine roda com os dublês de
+loadtest_fakes.py (LLM e embeddings determinísticos com latência configurável,
+fakeredis na memória) e o script mede turns/s e p50/p95/p99 do turno e de cada
+nó / chamada de LLM / perna do retriever.
+
+Modos:
+  turns  POST /turns/ do engine. Em processo (httpx + ASGI) ou contra --engine-url.
+         Os tempos por nó vêm do evento "timings" de cada resposta.
+  ws     WebSocket da API (`api/`, ao lado de ai_assistant/): USER_MESSAGE ->
+         QUOTE_PATCH/QUOTE_SNAPSHOT, como o client. Sem --api-url sobe engine e
+         API em processo (uvicorn em portas livres); os spans saem da telemetria.
+  serve  só o engine com os dublês (uvicorn), para apontar uma API ou outro
+         gerador de carga para ele.
+
+Cada usuário virtual roda conversas do QUERY_MIX em sequência (quote nova,
+revisões, perguntas), numa sessão nova por conversa. Os fakes precisam de
+langchain_core, fakeredis e lupa (scripts Lua da memória); langchain_openai e
+a chave da OpenAI não são usados.
+
+Uso (a partir de ai_assistant/):
+    python ai_engine/scripts/loadtest.py turns --turns 200 --users 16
+    python ai_engine/scripts/loadtest.py turns --latency designer=0.2,nba=0.1 --json out.json --max-p95-ms 3000
+    python ai_engine/scripts/loadtest.py ws --turns 100 --users 8
+    python ai_engine/scripts/loadtest.py serve --port 8002
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+import zlib
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import loadtest_fakes
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+
+# (peso, conversa): a primeira mensagem abre a quote, as outras a refinam
+QUERY_MIX: List[Tuple[int, List[str]]] = [
+    (5, ["Quote Meraki access points for Acme Corp with 120 users in a 3-floor office",
+         "Change the Balanced option to 10 access points",
+         "Does the MR44 support Wi-Fi 6E?"]),
+    (3, ["quote 5 units of C9179F-01 for Globex Retail with 50 users, budget is important",
+         "Add 3-year licenses to every option"]),
+    (3, ["I need a Catalyst switch quote for Initech with 300 users and PoE+ on every port",
+         "Replace the 48-port switches with 24-port ones",
+         "What is the difference between the Essential and Complete options?"]),
+    (2, ["What is the lead time for MR57 access points?"]),
+    (1, ["Quote 20 MR46 for Umbrella Labs with 400 users",
+         "Increase the quantity to 25",
+         "Remove the licenses from the Essential option",
+         "How many users can each MR46 handle?"]),
+]
+
+
+def _conversations(seed: int):
+    rnd = random.Random(seed)  # nosec B311: mix de carga reprodutível
+    weights = [w for w, _ in QUERY_MIX]
+    while True:
+        yield rnd.choices([c for _, c in QUERY_MIX], weights=weights)[0]
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"n": 0}
+    v = sorted(values)
+
+    def pct(p: float) -> float:
+        return v[min(len(v) - 1, max(0, int(round(p / 100 * len(v) + 0.5)) - 1))]
+
+    return {"n": len(v), "p50": pct(50), "p95": pct(95), "p99": pct(99),
+            "max": v[-1], "mean": statistics.fmean(v)}
+
+
+class Results:
+    """Latências ponta a ponta (ms) e spans (ms) agrupados por "tipo:nome"."""
+
+    def __init__(self) -> None:
+        self.turns: List[float] = []
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.spans: Dict[str, List[float]] = defaultdict(list)
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def add_span(self, kind: str, name: str, ms: float) -> None:
+        self.spans[f"{kind}:{name}"].append(ms)
+
+    def add_timings_event(self, event: Dict[str, Any]) -> None:
+        if event.get("total_ms") is not None:
+            self.add_span("engine", "total", event["total_ms"])
+        for name, ms in (event.get("nodes") or {}).items():
+            self.add_span("node", name, ms)
+        for name, ms in ((event.get("llm") or {}).get("ms") or {}).items():
+            self.add_span("llm", name, ms)
+        for name, ms in (event.get("retriever") or {}).items():
+            self.add_span("retriever", name, ms)
+
+    def summary(self) -> Dict[str, Any]:
+        wall = (self.finished or time.perf_counter()) - self.started
+        return {
+            "turns": len(self.turns),
+            "errors": dict(self.errors),
+            "wall_s": round(wall, 2),
+            "turns_per_s": round(len(self.turns) / wall, 2) if wall else 0.0,
+            "turn_ms": _percentiles(self.turns),
+            "spans_ms": {k: _percentiles(v) for k, v in sorted(self.spans.items())},
+        }
+
+
+def _print_report(title: str, s: Dict[str, Any]) -> None:
+    print(f"\n=== {title} ===")
+    print(f"turns: {s['turns']}  errors: {sum(s['errors'].values())} {s['errors'] or ''}")
+    print(f"wall: {s['wall_s']}s  throughput: {s['turns_per_s']} turns/s")
+    print(f"\n{'':>28} | {'n':>5} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8} | {'max ms':>8}")
+    rows = [("turn (end to end)", s["turn_ms"])]
+    rows += sorted(s["spans_ms"].items(), key=lambda kv: -kv[1].get("p95", 0))
+    for name, p in rows:
+        if not p.get("n"):
+            continue
+        print(f"{name:>28} | {p['n']:>5} | {p['p50']:>8.1f} | {p['p95']:>8.1f} | {p['p99']:>8.1f} | {p['max']:>8.1f}")
+
+
+def _hook_telemetry(results: Results) -> None:
+    """Copia cada span da telemetria do engine (em processo) para os resultados."""
+    from ai_engine.app.core import telemetry
+
+    original = telemetry._record
+
+    def record(kind: str, name: str, seconds: float, failed: bool = False, **extra: Any) -> None:
+        results.add_span(kind, name, seconds * 1000)
+        original(kind, name, seconds, failed, **extra)
+
+    telemetry._record = record
+
+
+async def _warm_up_engine() -> None:
+    from ai_engine.main import warm_up
+
+    t0 = time.perf_counter()
+    await asyncio.to_thread(warm_up)
+    print(f"engine warm-up: {time.perf_counter() - t0:.2f}s")
+
+
+# ---------- modo turns ----------
+
+
+async def _turns_user(client, url: str, convs, budget, think: float, results: Results) -> None:
+    while True:
+        conversation = next(convs)
+        session_id = f"lt-{uuid.uuid4().hex[:12]}"
+        for message in conversation:
+            if next(budget, None) is None:
+                return
+            t0 = time.perf_counter()
+            try:
+                r = await client.post(url, json={"message": message}, headers={"X-Session-Id": session_id})
+                elapsed = (time.perf_counter() - t0) * 1000
+                if r.status_code != 200:
+                    results.errors[f"http_{r.status_code}"] += 1
+                    continue
+                results.turns.append(elapsed)
+                for event in r.json().get("events") or []:
+                    if event.get("type") == "timings":
+                        results.add_timings_event(event)
+            except Exception as e:
+                results.errors[type(e).__name__] += 1
+            if think:
+                await asyncio.sleep(think)
+
+
+async def run_turns(args) -> Dict[str, Any]:
+    import httpx
+
+    results = Results()
+    timeout = httpx.Timeout(args.timeout)
+    if args.engine_url:
+        client = httpx.AsyncClient(timeout=timeout, limits=httpx.Limits(max_connections=args.users))
+        url = args.engine_url.rstrip("/") + "/turns/"
+        lifespan = None
+    else:
+        from ai_engine.app.run import app
+
+        await _warm_up_engine()
+        lifespan = app.router.lifespan_context(app)
+        await lifespan.__aenter__()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://engine", timeout=timeout)
+        url = "/turns/"
+
+    convs = _conversations(args.seed)
+    budget = iter(range(args.turns))
+    results.started = time.perf_counter()
+    try:
+        await asyncio.gather(*[
+            _turns_user(client, url, convs, budget, args.think, results) for _ in range(args.users)
+        ])
+    finally:
+        results.finished = time.perf_counter()
+        await client.aclose()
+        if lifespan is not None:
+            await lifespan.__aexit__(None, None, None)
+    return results.summary()
+
+
+# ---------- modo ws ----------
+
+
+async def _start_server(app: Any) -> Tuple[Any, "asyncio.Task[None]", int]:
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning", lifespan="on"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, task, port
+
+
+def _decode_frame(raw: Any) -> Dict[str, Any]:
+    # frames grandes chegam binários (zlib) quando a conexão pede compress=deflate
+    if isinstance(raw, (bytes, bytearray)):
+        raw = zlib.decompress(raw)
+    return json.loads(raw)
+
+
+async def _ws_user(n: int, ws_url: str, token: str, convs, budget, args, results: Results) -> None:
+    import websockets
+
+    async with websockets.connect(f"{ws_url}?token={token}&compress=deflate", max_size=None) as ws:
+        while True:
+            conversation = next(convs)
+            session_id = f"lt-{uuid.uuid4().hex[:12]}"
+            session: Dict[str, Any] = {"id": session_id, "userId": f"loadtest-{n}",
+                                       "chatMessages": [], "scenarios": [], "title": "New quote"}
+            version: Optional[int] = None
+            for message in conversation:
+                if next(budget, None) is None:
+                    return
+                msg = {"id": uuid.uuid4().hex, "sessionId": session_id, "role": "user",
+                       "content": message, "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")}
+                payload: Dict[str, Any] = {"sessionId": session_id, "baseVersion": version, "message": msg}
+                if version is None:
+                    payload["session"] = session
+                t0 = time.perf_counter()
+                try:
+                    await ws.send(json.dumps({"event": "USER_MESSAGE", "data": payload}))
+                    while True:
+                        frame = _decode_frame(await asyncio.wait_for(ws.recv(), timeout=args.timeout))
+                        event, data = frame.get("event"), frame.get("data") or {}
+                        if event in ("QUOTE_PATCH", "QUOTE_SNAPSHOT") and data.get("sessionId") == session_id:
+                            version = data.get("version")
+                            results.turns.append((time.perf_counter() - t0) * 1000)
+                            break
+                        if event == "RESYNC_REQUIRED":
+                            # o cliente real reenvia com a sessão; aqui conta como erro do protocolo
+                            results.errors["resync_required"] += 1
+                            version = None
+                            break
+                        if event == "ERROR":
+                            results.errors["ws_error"] += 1
+                            break
+                except asyncio.TimeoutError:
+                    results.errors["timeout"] += 1
+                    return
+                if args.think:
+                    await asyncio.sleep(args.think)
+
+
+async def run_ws(args) -> Dict[str, Any]:
+    results = Results()
+    servers: List[Tuple[Any, "asyncio.Task[None]"]] = []
+    if args.api_url:
+        ws_url = args.api_url
+        if not args.secret:
+            raise SystemExit("--secret (the API SECRET_KEY) is needed to mint tokens for --api-url")
+        os.environ["SECRET_KEY"] = args.secret
+    else:
+        from ai_engine.app.run import app as engine_app
+
+        await _warm_up_engine()
+        _hook_telemetry(results)
+        server, task, engine_port = await _start_server(engine_app)
+        servers.append((server, task))
+        # API em processo apontando para o engine; sem limites de admissão por usuário
+        os.environ["AGENT_BASE_URL"] = f"http://127.0.0.1:{engine_port}/turns"
+        os.environ.setdefault("TENANT_RATE_PER_MIN", "1000000")
+        os.environ.setdefault("TENANT_BURST", "1000000")
+        os.environ.setdefault("ADMISSION_MAX_INFLIGHT", str(max(16, args.users)))
+        sys.path.insert(0, REPO_ROOT)
+        from api.main import app as api_app
+
+        server, task, api_port = await _start_server(api_app)
+        servers.append((server, task))
+        ws_url = f"ws://127.0.0.1:{api_port}/ws"
+
+    sys.path.insert(0, REPO_ROOT)
+    from api.auth.security import create_access_token
+
+    convs = _conversations(args.seed)
+    budget = iter(range(args.turns))
+    results.started = time.perf_counter()
+    try:
+        await asyncio.gather(*[
+            _ws_user(n, ws_url, create_access_token(sub=f"loadtest-{n}"), convs, budget, args, results)
+            for n in range(args.users)
+        ])
+    finally:
+        results.finished = time.perf_counter()
+        for server, task in reversed(servers):
+            server.should_exit = True
+            await task
+    return results.summary()
+
+
+# ---------- main ----------
+
+
+def _parse_latency(spec: str) -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        kind, _, seconds = part.partition("=")
+        if kind not in loadtest_fakes.DEFAULT_LATENCY:
+            raise SystemExit(f"unknown latency kind {kind!r}; use {sorted(loadtest_fakes.DEFAULT_LATENCY)}")
+        out[kind] = float(seconds)
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Offline end-to-end load test (fake LLM, embeddings and Redis).")
+    ap.add_argument("mode", choices=("turns", "ws", "serve"))
+    ap.add_argument("--turns", type=int, default=100, help="total turns to send")
+    ap.add_argument("--users", type=int, default=8, help="concurrent virtual users")
+    ap.add_argument("--think", type=float, default=0.0, help="seconds between turns of a user")
+    ap.add_argument("--timeout", type=float, default=120.0)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--latency", default="", help="fake LLM latency per kind, e.g. designer=1.5,nba=0.8")
+    ap.add_argument("--jitter", type=float, default=0.25)
+    ap.add_argument("--embedding-dim", type=int, default=1536, help="must match the FAISS index")
+    ap.add_argument("--embedding-latency", type=float, default=0.0)
+    ap.add_argument("--engine-url", help="turns mode: existing engine (started with `serve`)")
+    ap.add_argument("--api-url", help="ws mode: existing API WebSocket, e.g. ws://localhost:8000/ws")
+    ap.add_argument("--secret", help="ws mode with --api-url: the API SECRET_KEY, to mint tokens")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8002)
+    ap.add_argument("--json", help="write the summary to this file")
+    ap.add_argument("--max-p95-ms", type=float, help="exit 1 if the end-to-end p95 is above this")
+    args = ap.parse_args()
+
+    # os dublês entram antes de qualquer import do engine
+    loadtest_fakes.install(
+        latency=_parse_latency(args.latency),
+        jitter=args.jitter,
+        embedding_dim=args.embedding_dim,
+        embedding_latency=args.embedding_latency,
+    )
+
+    if args.mode == "serve":
+        import uvicorn
+
+        from ai_engine.app.run import app
+
+        uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+        return
+
+    summary = asyncio.run(run_turns(args) if args.mode == "turns" else run_ws(args))
+    summary["config"] = {k: v for k, v in vars(args).items() if k not in ("secret",)}
+    _print_report(f"{args.mode}: {args.users} users", summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+    p95 = summary["turn_ms"].get("p95")
+    errors = sum(summary["errors"].values())
+    if args.max_p95_ms is not None and (p95 is None or p95 > args.max_p95_ms or errors):
+        print(f"\n❌ p95 {p95 or 0:.1f} ms (limit {args.max_p95_ms:.0f} ms), {errors} errors")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
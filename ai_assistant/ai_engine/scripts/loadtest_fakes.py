@@ -0,0 +1,281 @@
+# services/ai_engine/scripts/loadtest_fakes.py
+"""
+Dublês locais para rodar o engine sem OpenAI nem Redis (usados pelo loadtest.py).
+
+  - FakeChatOpenAI: chat model determinístico no lugar do ChatOpenAI. Responde o
+    JSON do orchestrator, os cenários do designer (QuoteScenarios, só com SKUs que
+    estão no prompt), o NBAOutput e o summary, com latência configurável por tipo
+    de chamada. Passa pelos callbacks normais: os spans "llm" e os tokens da
+    telemetria saem como numa chamada real.
+  - FakeEmbeddings: vetores unitários derivados do hash do texto (mesmo texto,
+    mesmo vetor), na dimensão do índice FAISS (text-embedding-3-small = 1536).
+  - fakeredis no lugar dos pools de `ai_engine.app.core.memory` (sync e asyncio
+    sobre o mesmo FakeServer; os scripts Lua da memória precisam do `lupa`).
+
+`install()` tem que rodar antes do primeiro turno: troca `langchain_openai.ChatOpenAI`
+e `OpenAIEmbeddings` (o engine importa os dois sob demanda) e as fábricas de Redis.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import sys
+import time
+import types
+from typing import Any, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+# latência média (s) por tipo de chamada; o jitter é ± `jitter` * média
+DEFAULT_LATENCY = {"orchestrator": 0.6, "designer": 1.8, "nba": 0.9, "summary": 0.5, "other": 0.4}
+
+_SKU_IN_CONTEXT = re.compile(r'"(?:sku|part_number)":\s*"([^"]+)"')
+_SKU_IN_TEXT = re.compile(r"\b(?:(\d+)\s*(?:x|units? of)?\s*)?([A-Z][A-Z0-9]{1,}(?:-[A-Z0-9]+)+)\b")
+_USERS = re.compile(r"(\d+)\s*users", re.I)
+_CLIENT = re.compile(r"\bfor\s+([A-Z][\w&.]*(?:\s+[A-Z][\w&.]*)*)")
+_REVISION_WORDS = ("change", "revise", "increase", "decrease", "remove", "replace", "instead", "add ", "swap")
+_QUESTION_WORDS = ("what", "does", "do ", "how", "can", "is ", "are ", "which", "why")
+
+SCENARIO_NAMES = ("Essential (Good)", "Standard (Better)", "Complete (Best)")
+
+
+def _prompt_text(messages: List[BaseMessage]) -> str:
+    return "\n".join(m.content if isinstance(m.content, str) else json.dumps(m.content) for m in messages)
+
+
+def _user_query(prompt: str) -> str:
+    """A pergunta do usuário no fim do prompt do orchestrator."""
+    _, _, tail = prompt.rpartition("USER QUERY:")
+    return tail.strip() or prompt[-300:]
+
+
+def _users_count(text: str) -> Optional[int]:
+    m = _USERS.search(text)
+    return int(m.group(1)) if m else None
+
+
+class FakeChatOpenAI(BaseChatModel):
+    """Stand-in determinístico do ChatOpenAI (aceita os mesmos kwargs do construtor)."""
+
+    model: str = "fake-gpt-4o-mini"
+    model_name: Optional[str] = None
+    temperature: float = 0.0
+    top_p: float = 1.0
+    model_kwargs: Dict[str, Any] = {}
+    latency: Dict[str, float] = dict(DEFAULT_LATENCY)
+    jitter: float = 0.25
+    seed: int = 42
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-openai"
+
+    # ---------- conteúdo ----------
+
+    def _kind(self, prompt: str, schema: Optional[str]) -> str:
+        if schema in ("QuoteScenarios", "ThreeScenarios", "SolutionDesign"):
+            return "designer"
+        if schema == "NBAOutput":
+            return "nba"
+        if schema == "AgentRoutingDecision" or "expert orchestrator AI" in prompt:
+            return "orchestrator"
+        if "Condense the following chat history" in prompt:
+            return "summary"
+        return "other"
+
+    def _orchestrator(self, prompt: str) -> Dict[str, Any]:
+        q = _user_query(prompt)
+        low = q.lower()
+        if low.endswith("?") or low.startswith(_QUESTION_WORDS):
+            intent = "question"
+        elif any(w in low for w in _REVISION_WORDS) and "quote" not in low.split()[:2]:
+            intent = "revision"
+        else:
+            intent = "quote"
+        sku_map = {sku: int(n or 1) for n, sku in _SKU_IN_TEXT.findall(q)} or None
+        client = _CLIENT.search(q)
+        domain = "switch" if re.search(r"switch|catalyst|\bMS\d", q, re.I) else "Wi-Fi"
+        verb = {"quote": "Generate a quote with 3 options for", "revision": "Revise the quote:"}.get(intent, "")
+        return {
+            "intent": intent,
+            "client_name": client.group(1) if client else None,
+            "users_count": _users_count(q),
+            "product_domain": domain,
+            "sku_map": sku_map,
+            "search_query": f"Cisco {domain} {q}"[:200],
+            "query_refined": f"{verb} {q}".strip(),
+        }
+
+    def _scenarios(self, prompt: str, schema: str) -> Dict[str, Any]:
+        skus = list(dict.fromkeys(_SKU_IN_CONTEXT.findall(prompt))) or ["MR44-HW"]
+        qty = max(1, (_users_count(prompt) or 50) // 25)
+        scenarios = []
+        for i, name in enumerate(SCENARIO_NAMES):
+            picked = skus[: i + 1] if len(skus) > i else skus
+            if schema == "QuoteScenarios":
+                comps = [{"sku": s, "quantity": qty * (i + 1)} for s in picked]
+                scenarios.append({"name": name, "justification": f"{name}: fake designer output.", "components": comps})
+            else:
+                comps = [{"part_number": s, "quantity": qty * (i + 1), "role": "hardware"} for s in picked]
+                scenarios.append({"summary": name, "justification": "fake designer output.", "components": comps})
+        if schema == "SolutionDesign":
+            return scenarios[1]
+        return {"scenarios": scenarios}
+
+    def _content(self, prompt: str, kind: str, schema: Optional[str]) -> str:
+        if kind == "designer":
+            return json.dumps(self._scenarios(prompt, schema or "QuoteScenarios"))
+        if kind == "nba":
+            users = _users_count(prompt)
+            hint = f" for {users} users" if users else ""
+            return json.dumps({
+                "question_for_refinement": "Here are three options sized" + hint + ".\n\n"
+                "**Next Step:** Would you like to add licenses or adjust the quantities?",
+                "refinements": [],
+            })
+        if kind == "orchestrator":
+            data = self._orchestrator(prompt)
+            if schema == "AgentRoutingDecision":
+                needs = data["intent"] in ("quote", "revision")
+                return json.dumps({"needs_design": needs, "needs_pricing": needs,
+                                   "needs_technical": not needs})
+            return json.dumps(data)
+        if kind == "summary":
+            return "The user is building a Cisco quote; keep the client, user count and chosen SKUs."
+        return "OK."
+
+    # ---------- geração ----------
+
+    def _plan(self, messages: List[BaseMessage], kwargs: Dict[str, Any]):
+        prompt = _prompt_text(messages)
+        schema = kwargs.get("fake_schema")
+        kind = self._kind(prompt, schema)
+        digest = hashlib.sha256(f"{self.seed}:{prompt}".encode()).digest()
+        rnd = random.Random(digest)  # nosec B311: jitter de benchmark, não é segurança
+        base = self.latency.get(kind, self.latency.get("other", 0.0))
+        delay = max(0.0, base * (1 + self.jitter * (2 * rnd.random() - 1)))
+        return prompt, kind, schema, delay
+
+    def _result(self, prompt: str, kind: str, schema: Optional[str]) -> ChatResult:
+        content = self._content(prompt, kind, schema)
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=content))],
+            llm_output={"token_usage": usage, "model_name": self.model},
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        prompt, kind, schema, delay = self._plan(messages, kwargs)
+        time.sleep(delay)
+        return self._result(prompt, kind, schema)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        prompt, kind, schema, delay = self._plan(messages, kwargs)
+        await asyncio.sleep(delay)
+        return self._result(prompt, kind, schema)
+
+    def with_structured_output(self, schema, *, include_raw: bool = False, **kwargs: Any):
+        """O schema vai como kwarg para o `_generate`; a saída JSON vira uma instância dele."""
+        def parse(message: AIMessage):
+            parsed = schema(**json.loads(message.content))
+            return {"raw": message, "parsed": parsed, "parsing_error": None} if include_raw else parsed
+
+        return self.bind(fake_schema=schema.__name__) | RunnableLambda(parse)
+
+
+class FakeEmbeddings(Embeddings):
+    """Embeddings determinísticos (hash do texto) com latência opcional por chamada."""
+
+    def __init__(self, size: int = 1536, latency: float = 0.0, **_: Any) -> None:
+        self.size = size
+        self.latency = latency
+
+    def _vector(self, text: str) -> List[float]:
+        rnd = random.Random(hashlib.sha256(text.encode()).digest())  # nosec B311
+        v = [rnd.gauss(0.0, 1.0) for _ in range(self.size)]
+        norm = math.sqrt(sum(x * x for x in v)) or 1.0
+        return [x / norm for x in v]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._vector(t) for t in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+def install_fake_redis() -> Any:
+    """Troca os pools de Redis da memória por fakeredis (um FakeServer por processo)."""
+    import fakeredis
+    import fakeredis.aioredis
+
+    from ai_engine.app.core import memory
+
+    server = fakeredis.FakeServer()
+    memory.get_redis = lambda redis_url: fakeredis.FakeRedis(server=server)
+    memory.get_async_redis = lambda redis_url: fakeredis.aioredis.FakeRedis(server=server)
+    return server
+
+
+def install(
+    latency: Optional[Dict[str, float]] = None,
+    jitter: float = 0.25,
+    embedding_dim: int = 1536,
+    embedding_latency: float = 0.0,
+    fake_redis: bool = True,
+) -> None:
+    """Instala os dublês no processo atual (antes do primeiro turno / warm-up)."""
+    # sem LangSmith: nada de rede durante o teste
+    os.environ["LANGCHAIN_TRACING_V2"] = "false"
+    os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+
+    lat = {**DEFAULT_LATENCY, **(latency or {})}
+
+    class _Chat(FakeChatOpenAI):
+        def __init__(self, **kwargs: Any) -> None:
+            kwargs.setdefault("latency", lat)
+            kwargs.setdefault("jitter", jitter)
+            super().__init__(**kwargs)
+
+    class _Embeddings(FakeEmbeddings):
+        def __init__(self, **kwargs: Any) -> None:
+            super().__init__(size=embedding_dim, latency=embedding_latency)
+
+    try:
+        import langchain_openai as module
+    except ImportError:
+        # o pacote real não é necessário para o teste de carga
+        module = types.ModuleType("langchain_openai")
+        sys.modules["langchain_openai"] = module
+    module.ChatOpenAI = _Chat  # type: ignore[attr-defined]
+    module.OpenAIEmbeddings = _Embeddings  # type: ignore[attr-defined]
+
+    # clientes que já tenham sido construídos (warm-up antes do install) saem da cache
+    for mod, names in (("ai_engine.app.core.graph", ("get_llm", "get_structured_llm")),
+                       ("ai_engine.main", ("get_summarizer_chain",)),
+                       ("ai_engine.app.utils.retriever", ("get_embeddings",))):
+        loaded = sys.modules.get(mod)
+        for name in names if loaded else ():
+            getattr(loaded, name).cache_clear()
+
+    if fake_redis:
+        install_fake_redis()
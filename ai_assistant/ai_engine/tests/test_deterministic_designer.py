@@ -0,0 +1,97 @@
+import random
+
+from ai_engine.app.core.graph import _design_engine_for, deterministic_designs
+
+
+def _product(sku: str, name: str, family: str, product_type: str, price: float, ports: int = 0) -> dict:
+    # mesmo formato do product_context montado pelo context collector
+    return {
+        "sku": sku,
+        "commercial_name": name,
+        "family": family,
+        "product_type": product_type,
+        "list_price_usd": price,
+        "ports": ports,
+        "lifecycle": {"status": "Active"},
+    }
+
+
+CONTEXT = [
+    _product("MR28-HW", "Meraki MR28 Wi-Fi 6 Access Point", "Wireless", "Access Point", 500),
+    _product("MR36-HW", "Meraki MR36 Wi-Fi 6 Access Point", "Wireless", "Access Point", 800),
+    _product("MR44-HW", "Meraki MR44 Wi-Fi 6 Access Point", "Wireless", "Access Point", 1200),
+    _product("MR57-HW", "Meraki MR57 Wi-Fi 6E Access Point", "Wireless", "Access Point", 2000),
+    _product("MR20-HW", "Meraki MR20 Wi-Fi 5 Access Point", "Wireless", "Access Point", 300),
+    _product("MS130-24P-HW", "Meraki MS130 24-port 370W PoE Switch", "Switches", "Meraki -Switch", 1500, 24),
+    _product("MS225-24P-HW", "Meraki MS225 24-port 370W PoE Switch", "Switches", "Meraki -Switch", 3000, 24),
+    _product("MS250-48FP-HW", "Meraki MS250 48-port 740W PoE Switch", "Switches", "Meraki -Switch", 6000, 48),
+    _product("MS130-24-HW", "Meraki MS130 24-port Data Only Switch", "Switches", "Meraki -Switch", 900, 24),
+    _product("LIC-MS130-24P-3Y", "Meraki MS130 24P Enterprise License, 3 Years", "Switches", "License", 400),
+]
+
+
+def _state(**overrides) -> dict:
+    state = {
+        "product_context": list(CONTEXT),
+        "user_query": "quote wifi 6 access points and poe switches for the office",
+        "product_domain": "Wi-Fi",
+        "users_count": 60,
+    }
+    state.update(overrides)
+    return state
+
+
+def _skus(design) -> list:
+    return [c.part_number for c in design.components]
+
+
+def test_builds_good_better_best_with_one_part_per_role():
+    designs = deterministic_designs(_state())
+
+    assert [d.summary.split(":")[0] for d in designs] == ["Essential (Good)", "Standard (Better)", "Complete (Best)"]
+    for d in designs:
+        roles = sorted(c.role for c in d.components)
+        assert roles == ["Access Point", "PoE Switch"]
+
+
+def test_hard_filters_drop_licenses_data_only_switches_and_older_wifi():
+    used = {sku for d in deterministic_designs(_state()) for sku in _skus(d)}
+
+    assert not used & {"MR20-HW", "MS130-24-HW", "LIC-MS130-24P-3Y"}
+
+
+def test_quantities_follow_users_count():
+    for d in deterministic_designs(_state(users_count=60)):
+        qty = {c.role: c.quantity for c in d.components}
+        assert qty["Access Point"] == 6  # 1 AP a cada 10 usuários
+        ports = next(p["ports"] for p in CONTEXT if p["sku"] in _skus(d) and p["ports"])
+        assert qty["PoE Switch"] == -(-60 // ports)
+
+
+def test_tiers_do_not_get_cheaper():
+    price = {p["sku"]: p["list_price_usd"] for p in CONTEXT}
+    good, better, best = (
+        sum(price[c.part_number] * c.quantity for c in d.components) for d in deterministic_designs(_state())
+    )
+
+    assert good <= better <= best
+
+
+def test_same_request_gives_the_same_designs_regardless_of_context_order():
+    expected = [_skus(d) for d in deterministic_designs(_state())]
+    shuffled = list(CONTEXT)
+    random.Random(7).shuffle(shuffled)
+
+    assert [_skus(d) for d in deterministic_designs(_state(product_context=shuffled))] == expected
+
+
+def test_returns_none_so_the_caller_falls_back_to_the_llm():
+    # papel pedido sem candidato no contexto
+    assert deterministic_designs(_state(user_query="quote a firewall and wifi 6 access points")) is None
+    # nenhum papel reconhecido na consulta
+    assert deterministic_designs(_state(user_query="hello there", product_domain=None)) is None
+
+
+def test_design_engine_comes_from_the_request_or_defaults_to_llm():
+    assert _design_engine_for({"design_engine": "Deterministic"}) == "deterministic"
+    assert _design_engine_for({"design_engine": "quantum"}) == "llm"
@@ -0,0 +1,70 @@
+from ai_engine.app.core import graph
+from ai_engine.app.core.graph import _price_book_version, _scenario_fingerprint, pricing_agent_node
+from ai_engine.app.schemas.models import SolutionComponent, SolutionDesign
+
+
+def _comps(*items) -> list:
+    return [{"part_number": sku, "quantity": qty, "fixed_quantity": fixed} for sku, qty, fixed in items]
+
+
+def test_fingerprint_ignores_component_order_and_sku_case():
+    a = _comps(("MR44-HW", 5, False), ("MS130-24P-HW", 2, False))
+    b = _comps(("ms130-24p-hw", 2, False), ("mr44-hw", 5, False))
+
+    assert _scenario_fingerprint(a, 50, "pb") == _scenario_fingerprint(b, 50, "pb")
+
+
+def test_fingerprint_changes_with_anything_that_changes_the_price():
+    base = _comps(("MR44-HW", 5, False))
+    fp = _scenario_fingerprint(base, 50, "pb")
+
+    assert _scenario_fingerprint(_comps(("MR44-HW", 6, False)), 50, "pb") != fp
+    assert _scenario_fingerprint(_comps(("MR44-HW", 5, True)), 50, "pb") != fp
+    assert _scenario_fingerprint(_comps(("MR57-HW", 5, False)), 50, "pb") != fp
+    assert _scenario_fingerprint(base, 80, "pb") != fp
+    assert _scenario_fingerprint(base, 50, "other-pb") != fp
+
+
+def test_price_book_version_prefers_the_explicit_version():
+    assert _price_book_version({"price_book_version": "2025-Q3"}) == "2025-Q3"
+    assert _price_book_version(None) == _price_book_version({})
+    assert _price_book_version({"price_agreements": [{"sku": "MR44-HW", "discount": 10}]}) != _price_book_version({})
+
+
+def _state() -> dict:
+    def design(name, *items):
+        comps = [SolutionComponent(part_number=sku, quantity=qty, role="") for sku, qty in items]
+        return SolutionDesign(summary=f"{name}: Solution", justification="", components=comps)
+
+    return {
+        "orchestrator_decision": {"needs_pricing": True},
+        "users_count": 50,
+        "solution_designs": [
+            design("Essential (Good)", ("MR28-HW", 5), ("MS130-24P-HW", 2)),
+            design("Standard (Better)", ("MR44-HW", 5), ("MS225-24P-HW", 2)),
+            design("Complete (Best)", ("MR57-HW", 5), ("MS250-24P-HW", 2)),
+        ],
+    }
+
+
+def test_unchanged_scenarios_reuse_the_persisted_pricing(monkeypatch):
+    state = _state()
+    first = pricing_agent_node(state)
+
+    priced = []
+    original = graph._compute_client_adjusted_price
+    monkeypatch.setattr(
+        graph, "_compute_client_adjusted_price", lambda sku, *a, **kw: priced.append(sku) or original(sku, *a, **kw)
+    )
+    # próximo turno: o state persistido volta com os designs e o pricing anteriores
+    second_state = {**state, **first}
+    second_state["solution_designs"][2].components[0].part_number = "MR46-HW"
+    second = pricing_agent_node(second_state)
+
+    assert priced and set(priced) <= {"MR46-HW", "MS250-24P-HW"}
+    for name in ("Essential (Good)", "Standard (Better)"):
+        assert second["pricing_results"][name] is first["pricing_results"][name]
+        assert second["pricing_fingerprints"][name] == first["pricing_fingerprints"][name]
+    assert second["pricing_fingerprints"]["Complete (Best)"] != first["pricing_fingerprints"]["Complete (Best)"]
+    assert {line["part_number"] for line in second["pricing_results"]["Complete (Best)"]} == {"MR46-HW", "MS250-24P-HW"}
+    assert second["ea"] == pricing_agent_node({**_state(), "solution_designs": second_state["solution_designs"]})["ea"]
@@ -0,0 +1,117 @@
+import pytest
+
+from ai_engine.app.core import graph
+from ai_engine.app.core.graph import _try_local_revision, apply_revision, parse_revision_intent
+from ai_engine.app.schemas.models import RevisionRequest, SolutionComponent, SolutionDesign
+
+# SKUs do catálogo versionado em data/processed (os testes rodam a partir de ai_assistant/)
+LICENSE = "LIC-MS22-3YR"
+
+
+def _designs() -> list:
+    def comp(sku, qty):
+        return SolutionComponent(part_number=sku, quantity=qty, role="")
+
+    return [
+        SolutionDesign(summary="Essential (Good): Solution", justification="",
+                       components=[comp("MR28-HW", 5), comp("MS130-24P-HW", 2), comp(LICENSE, 2)]),
+        SolutionDesign(summary="Standard (Better): Solution", justification="",
+                       components=[comp("MR44-HW", 5), comp("MS225-24P-HW", 2)]),
+        SolutionDesign(summary="Complete (Best): Solution", justification="",
+                       components=[comp("MR44-HW", 5), comp("MS250-24P-HW", 2)]),
+    ]
+
+
+def _skus(design) -> dict:
+    return {c.part_number: c.quantity for c in design.components}
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("replace MR44 with MR57 in Best", RevisionRequest("Complete", "replace", "MR44", "MR57")),
+        ("swap the switches for MS250-48FP", RevisionRequest(None, "replace", "SWITCHES", "MS250-48FP")),
+        ("set switches to 12", RevisionRequest(None, "set_qty", "SWITCHES", None, 12)),
+        ("change the quantity of MR28 to 7", RevisionRequest(None, "set_qty", "MR28", None, 7)),
+        ("remove the license from Good", RevisionRequest("Essential", "remove", "LICENSE")),
+        ("add 5 MR57 to Standard", RevisionRequest("Standard", "add", None, "MR57", 5)),
+        ("add MR36", RevisionRequest(None, "add", None, "MR36", None)),
+    ],
+)
+def test_parse_revision_intent(query, expected):
+    assert parse_revision_intent(query) == expected
+
+
+def test_parse_revision_intent_ignores_text_without_an_edit():
+    assert parse_revision_intent("how much does it cost overall") is None
+
+
+def test_replace_only_touches_the_target_scenario_and_copies_the_input():
+    designs = _designs()
+    new, changed, summary = apply_revision(designs, RevisionRequest("Complete", "replace", "MR44", "MR57"))
+
+    assert changed == ["Complete (Best)"]
+    assert _skus(new[2]) == {"MR57-HW": 5, "MS250-24P-HW": 2}
+    assert _skus(new[1]) == _skus(designs[1])
+    assert _skus(designs[2]) == {"MR44-HW": 5, "MS250-24P-HW": 2}  # entrada intacta
+    assert summary == "Replaced MR44 with MR57-HW in Complete (Best)."
+
+
+def test_set_qty_by_category_pins_the_quantity():
+    new, changed, _ = apply_revision(_designs(), RevisionRequest(None, "set_qty", "SWITCHES", None, 12))
+
+    assert len(changed) == 3
+    for d in new:
+        switch = next(c for c in d.components if c.part_number.startswith("MS"))
+        assert (switch.quantity, switch.fixed_quantity) == (12, True)
+        # a licença (LIC-MS...) não é um switch
+        assert all(c.quantity != 12 for c in d.components if c.part_number == LICENSE)
+
+
+def test_remove_and_add():
+    new, changed, _ = apply_revision(_designs(), RevisionRequest(None, "remove", "LICENSE"))
+    assert changed == ["Essential (Good)"]
+    assert LICENSE not in _skus(new[0])
+
+    new, changed, _ = apply_revision(_designs(), RevisionRequest("Standard", "add", None, "MR57", 5))
+    assert changed == ["Standard (Better)"]
+    added = next(c for c in new[1].components if c.part_number == "MR57-HW")
+    assert (added.quantity, added.fixed_quantity) == (5, True)
+
+
+@pytest.mark.parametrize(
+    "rev",
+    [
+        RevisionRequest(None, "replace", "MR44", "NOT-A-SKU9"),  # fora do catálogo
+        RevisionRequest(None, "replace", None, "MORE"),  # palavra solta, não SKU
+        RevisionRequest(None, "remove", "MR99"),  # nada casa
+        RevisionRequest("Standard", "add", None, "MR44", None),  # já está no cenário
+        RevisionRequest("Premium", "remove", "LICENSE"),  # cenário inexistente
+    ],
+)
+def test_unsafe_edits_fall_back_to_the_llm(rev):
+    assert apply_revision(_designs(), rev) is None
+
+
+def test_local_revision_fast_path():
+    state = {"user_query": "replace MR44 with MR57 in Best", "solution_designs": _designs()}
+    update = _try_local_revision(state)
+
+    assert update["next_flow"] == "revision"
+    assert update["local_revision"]["scenarios"] == ["Complete (Best)"]
+    assert update["previous_solution_designs"] is state["solution_designs"]
+    assert "MR57-HW" in _skus(update["solution_designs"][2])
+
+    # perguntas e conversas sem cotação seguem o fluxo normal
+    assert _try_local_revision({**state, "user_query": "what if I replace MR44 with MR57?"}) is None
+    assert _try_local_revision({**state, "solution_designs": []}) is None
+
+
+def test_nba_runs_after_pricing_except_on_the_local_fast_path():
+    edges = {(e.source, e.target) for e in graph.build_workflow().compile().get_graph().edges}
+
+    # o NBA pergunta sobre as quantidades que o pricing gravou nos designs
+    assert {("llm_designer", "price"), ("price", "nba_agent"), ("nba_agent", "synth")} <= edges
+    assert ("llm_designer", "nba_agent") not in edges
+    assert graph.route_after_price({"next_flow": "quote"}) == "nba_agent"
+    assert graph.route_after_price({"local_revision": {"action": "replace"}}) == "synth"
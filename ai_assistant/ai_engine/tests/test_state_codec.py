@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from ai_engine.app.core import state_codec
+from ai_engine.app.core.state_codec import FLAG_ZSTD, decode_state, encode_state
+from ai_engine.app.schemas.models import AgentRoutingDecision, RevisionRequest, SolutionComponent, SolutionDesign
+
+
+def _state(n_designs: int = 1) -> dict:
+    designs = [
+        SolutionDesign(
+            summary=f"Option {i}: Solution",
+            justification="Wi-Fi 6 for 120 users",
+            components=[SolutionComponent(part_number="MR44-HW", quantity=12, role="Access Point", fixed_quantity=True)],
+        )
+        for i in range(n_designs)
+    ]
+    return {
+        "user_query": "quote 12 MR44 for Acme – São Paulo",
+        "users_count": 120,
+        "solution_designs": designs,
+        "orchestrator_decision": AgentRoutingDecision(needs_design=True, needs_pricing=True),
+        "revision_request": RevisionRequest("Complete", "replace", "MR44", "MR57"),
+        "pricing_results": {"Option 0": [{"part_number": "MR44-HW", "unit_price": 1297.75}]},
+        "pricing_fingerprints": {"Option 0": "ab" * 32},
+        "sku_map": {"MR44-HW": 12},
+    }
+
+
+def test_round_trip_keeps_typed_objects():
+    state = _state()
+    raw = encode_state(state)
+
+    assert raw[:2] == b"\x00" + bytes((state_codec.CODEC_VERSION,))
+    out = decode_state(raw)
+    assert out == state
+    assert isinstance(out["solution_designs"][0], SolutionDesign)
+    assert isinstance(out["solution_designs"][0].components[0], SolutionComponent)
+    assert isinstance(out["orchestrator_decision"], AgentRoutingDecision)
+    assert isinstance(out["revision_request"], RevisionRequest)
+
+
+def test_large_states_are_compressed():
+    raw = encode_state(_state(n_designs=50))
+
+    assert raw[2] & FLAG_ZSTD
+    assert decode_state(raw) == _state(n_designs=50)
+
+
+def test_legacy_json_state_is_still_readable():
+    # formato anterior ao codec: o JSON de _to_jsonable, gravado como str ou bytes
+    legacy = state_codec._to_jsonable(_state())
+    text = json.dumps(legacy)
+
+    assert decode_state(text) == legacy
+    assert decode_state(text.encode()) == legacy
+    assert decode_state(None) == {} and decode_state(b"") == {}
+
+
+def test_unknown_codec_version_starts_fresh():
+    raw = encode_state({"user_query": "hi"})
+    newer = raw[:1] + bytes((state_codec.CODEC_VERSION + 1,)) + raw[2:]
+
+    assert decode_state(newer) == {}
+
+
+def test_without_msgpack_the_state_is_written_as_json(monkeypatch):
+    monkeypatch.setattr(state_codec, "BINARY_ENABLED", False)
+    raw = encode_state(_state())
+
+    assert not raw.startswith(b"\x00")
+    assert decode_state(raw) == state_codec._to_jsonable(_state())
+
+
+def test_changed_schema_falls_back_to_the_plain_dict(monkeypatch):
+    raw = encode_state({"revision_request": RevisionRequest("Complete", "replace", "MR44", "MR57")})
+    cls, dump, _ = state_codec._TYPES[3]
+    monkeypatch.setitem(state_codec._TYPES, 3, (cls, dump, lambda d: RevisionRequest(**d, removed_field=1)))
+
+    assert decode_state(raw)["revision_request"]["sku_to"] == "MR57"
+
+
+@pytest.mark.parametrize("value", [("a", 1), {1: "int keys"}])
+def test_tuples_and_int_keys_survive(value):
+    out = decode_state(encode_state({"v": value}))["v"]
+
+    assert out == (list(value) if isinstance(value, tuple) else value)
@@ -0,0 +1,108 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from ai_engine.app.core.exceptions import AppError
+from ai_engine.app.core.scheduler import TurnScheduler
+
+
+class _SharedLanes:
+    """O que o Redis guarda para a coordenação, num processo só (vários schedulers = vários workers)."""
+
+    def __init__(self) -> None:
+        self.seq = {}
+        self.leases = {}
+        self.schedulers = []
+
+
+class _Coordinator:
+    def __init__(self, shared: _SharedLanes) -> None:
+        self.shared = shared
+
+    async def ticket(self, session_id):
+        self.shared.seq[session_id] = self.shared.seq.get(session_id, 0) + 1
+        return self.shared.seq[session_id]
+
+    async def is_latest(self, session_id, ticket):
+        return self.shared.seq.get(session_id) == ticket
+
+    @asynccontextmanager
+    async def lease(self, session_id):
+        lock = self.shared.leases.setdefault(session_id, asyncio.Lock())
+        async with lock:
+            yield
+
+    async def cancel(self, session_id):
+        upto = await self.ticket(session_id)
+        for scheduler in self.shared.schedulers:
+            scheduler._cancel_shared(session_id, upto)
+        return self.shared.leases[session_id].locked()
+
+    async def listen(self, on_cancel):
+        await asyncio.Event().wait()
+
+
+def _workers(n: int):
+    shared = _SharedLanes()
+    for _ in range(n):
+        scheduler = TurnScheduler(4, 8, coordinator=_Coordinator(shared))
+        shared.schedulers.append(scheduler)
+    return shared.schedulers
+
+
+async def _turn(log: list, name: str, seconds: float = 0.05) -> str:
+    log.append(f"start {name}")
+    await asyncio.sleep(seconds)
+    log.append(f"end {name}")
+    return name
+
+
+async def _outcome(scheduler: TurnScheduler, turn) -> str:
+    try:
+        return await scheduler.run("s1", turn)
+    except AppError as e:
+        return e.code
+
+
+def test_turns_of_a_session_never_overlap_across_workers():
+    w1, w2 = _workers(2)
+    w1.cancel_superseded = w2.cancel_superseded = False
+    log: list = []
+
+    async def main():
+        return await asyncio.gather(
+            _outcome(w1, lambda: _turn(log, "a")), _outcome(w2, lambda: _turn(log, "b")))
+
+    assert asyncio.run(main()) == ["a", "b"]
+    assert log == ["start a", "end a", "start b", "end b"]
+
+
+def test_newer_message_on_another_worker_supersedes_the_waiting_turn():
+    w1, w2 = _workers(2)
+    log: list = []
+
+    async def main():
+        first = asyncio.ensure_future(_outcome(w1, lambda: _turn(log, "a")))
+        await asyncio.sleep(0.01)
+        waiting = asyncio.ensure_future(_outcome(w1, lambda: _turn(log, "b")))
+        await asyncio.sleep(0)
+        newest = asyncio.ensure_future(_outcome(w2, lambda: _turn(log, "c")))
+        return await asyncio.gather(first, waiting, newest)
+
+    assert asyncio.run(main()) == ["a", "turn_superseded", "c"]
+
+
+def test_cancel_reaches_the_worker_running_the_turn_but_not_newer_turns():
+    w1, w2 = _workers(2)
+    log: list = []
+
+    async def main():
+        running = asyncio.ensure_future(_outcome(w1, lambda: _turn(log, "old", 5)))
+        await asyncio.sleep(0.01)
+        cancelled = await w2.cancel_everywhere("s1")
+        newer = asyncio.ensure_future(_outcome(w1, lambda: _turn(log, "new")))
+        await asyncio.sleep(0.01)
+        # o mesmo aviso chegando atrasado (ticket 2) não derruba a mensagem nova (ticket 3)
+        w1._cancel_shared("s1", 2)
+        return cancelled, await running, await newer
+
+    assert asyncio.run(main()) == (True, "turn_cancelled", "new")
@@ -0,0 +1,278 @@
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import itertools
+import logging
+import math
+import time
+
+log = logging.getLogger(__name__)
+
+PositionFn = Callable[[int], Awaitable[None]]
+
+
+class AdmissionRejected(RuntimeError):
+    def __init__(self, message: str, reason: str, retry_after: float = 0.0) -> None:
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+# ---------- rate limit (token bucket por tenant) ----------
+
+
+class LocalTokenBucket:
+    """Token bucket en memoria: `rate` turnos/seg, ráfagas de hasta `burst`."""
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._buckets: Dict[str, List[float]] = {}  # tenant -> [tokens, ts]
+
+    async def take(self, tenant: str) -> float:
+        """Consume un token; devuelve 0 o los segundos a esperar si no hay."""
+        now = time.monotonic()
+        b = self._buckets.setdefault(tenant, [float(self.burst), now])
+        b[0] = min(self.burst, b[0] + (now - b[1]) * self.rate)
+        b[1] = now
+        if b[0] >= 1:
+            b[0] -= 1
+            return 0.0
+        return (1 - b[0]) / self.rate
+
+
+# TIME de Redis: todas las instancias de la API usan el mismo reloj
+_TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local b = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(b[1]) or burst
+local ts = tonumber(b[2]) or now
+tokens = math.min(burst, tokens + (now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+else
+  wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class RedisTokenBucket:
+    """
+    El mismo bucket, compartido entre instancias de la API vía un script Lua
+    atómico. Si Redis falla se usa el bucket local (fail-open).
+    """
+
+    def __init__(
+        self, client: Any, rate: float, burst: int, prefix: str = "api:bucket"
+    ) -> None:
+        self.client = client
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.prefix = prefix
+        self._script = client.register_script(_TOKEN_BUCKET_LUA)
+        self._local = LocalTokenBucket(rate, burst)
+
+    async def take(self, tenant: str) -> float:
+        try:
+            raw = await self._script(
+                keys=[f"{self.prefix}:{tenant}"], args=[self.rate, self.burst]
+            )
+            return float(raw)
+        except Exception as e:
+            log.warning("redis token bucket failed, using local bucket: %r", e)
+            return await self._local.take(tenant)
+
+
+# ---------- cola justa ponderada ----------
+
+
+@dataclass
+class _Ticket:
+    finish: float
+    seq: int
+    tenant: str
+    granted: "asyncio.Future[None]"
+    on_position: Optional[PositionFn] = None
+    position: int = field(default=-1)
+
+
+class FairQueue:
+    """
+    Weighted fair queuing (tiempos de fin virtuales): cada turno de un tenant
+    recibe `finish = max(V, último finish del tenant) + 1/peso` y se despacha
+    el de menor finish entre los tenants que no llegaron a su tope de turnos
+    simultáneos. Un usuario con 20 turnos encolados no retrasa a otro que
+    recién llega más de lo que le toca por peso. Es por proceso: con varios
+    workers cada uno reparte sólo sus propios turnos.
+    """
+
+    def __init__(
+        self,
+        max_inflight: int,
+        tenant_max_inflight: int,
+        tenant_max_queued: int,
+        weights: Optional[Dict[str, float]] = None,
+    ) -> None:
+        self.max_inflight = max(1, max_inflight)
+        self.tenant_max_inflight = max(1, tenant_max_inflight)
+        self.tenant_max_queued = max(0, tenant_max_queued)
+        self.weights = weights or {}
+        self._vtime = 0.0
+        self._last_finish: Dict[str, float] = {}
+        self._waiting: List[_Ticket] = []
+        self._running: Dict[str, int] = {}
+        self._seq = itertools.count()
+
+    @property
+    def running(self) -> int:
+        return sum(self._running.values())
+
+    def _eligible(self, tenant: str) -> bool:
+        return self._running.get(tenant, 0) < self.tenant_max_inflight
+
+    async def acquire(self, tenant: str, on_position: Optional[PositionFn]) -> None:
+        if (
+            not self._waiting
+            and self.running < self.max_inflight
+            and self._eligible(tenant)
+        ):
+            self._grant_now(tenant)
+            return
+        if (
+            sum(1 for t in self._waiting if t.tenant == tenant)
+            >= self.tenant_max_queued
+        ):
+            raise AdmissionRejected(
+                "Too many queued requests for this user.", reason="queue_full"
+            )
+
+        weight = max(0.01, self.weights.get(tenant, 1.0))
+        finish = max(self._vtime, self._last_finish.get(tenant, 0.0)) + 1.0 / weight
+        self._last_finish[tenant] = finish
+        ticket = _Ticket(
+            finish,
+            next(self._seq),
+            tenant,
+            asyncio.get_running_loop().create_future(),
+            on_position,
+        )
+        self._waiting.append(ticket)
+        self._waiting.sort(key=lambda t: (t.finish, t.seq))
+        self._dispatch()
+        try:
+            await ticket.granted
+        except asyncio.CancelledError:
+            if ticket.granted.done() and not ticket.granted.cancelled():
+                self.release(tenant)  # el slot ya era nuestro
+            elif ticket in self._waiting:
+                self._waiting.remove(ticket)
+                self._report_positions()
+            raise
+
+    def _grant_now(self, tenant: str) -> None:
+        self._running[tenant] = self._running.get(tenant, 0) + 1
+
+    def release(self, tenant: str) -> None:
+        left = self._running.get(tenant, 1) - 1
+        if left <= 0:
+            self._running.pop(tenant, None)
+        else:
+            self._running[tenant] = left
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self.running < self.max_inflight:
+            ticket = next((t for t in self._waiting if self._eligible(t.tenant)), None)
+            if ticket is None:
+                break
+            self._waiting.remove(ticket)
+            self._vtime = max(self._vtime, ticket.finish)
+            self._grant_now(ticket.tenant)
+            ticket.granted.set_result(None)
+        if not self._waiting:
+            # cola vacía: los finish viejos ya no dan prioridad a nadie
+            self._last_finish.clear()
+        self._report_positions()
+
+    def _report_positions(self) -> None:
+        for pos, ticket in enumerate(self._waiting, start=1):
+            if ticket.position != pos and ticket.on_position is not None:
+                ticket.position = pos
+                asyncio.ensure_future(ticket.on_position(pos))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "waiting": len(self._waiting),
+            "tenants_running": len(self._running),
+            "max_inflight": self.max_inflight,
+        }
+
+
+class Admission:
+    """
+    Rate limit por tenant + cola justa delante del agente. El bucket se comparte
+    entre procesos vía Redis; la cola (y con ella la justicia entre tenants y
+    los topes de turnos simultáneos) es de cada proceso de la API.
+    """
+
+    def __init__(self, bucket: Any, queue: FairQueue) -> None:
+        self.bucket = bucket
+        self.queue = queue
+        self.rejected: Dict[str, int] = {"rate_limited": 0, "queue_full": 0}
+
+    @classmethod
+    def from_settings(cls, settings: Any) -> "Admission":
+        rate = settings.TENANT_RATE_PER_MIN / 60.0
+        bucket: Any = LocalTokenBucket(rate, settings.TENANT_BURST)
+        if settings.REDIS_URL:
+            try:
+                import redis.asyncio as aioredis
+
+                bucket = RedisTokenBucket(
+                    aioredis.from_url(settings.REDIS_URL), rate, settings.TENANT_BURST
+                )
+            except ImportError:
+                log.warning("REDIS_URL set but 'redis' is not installed; local buckets")
+        queue = FairQueue(
+            settings.ADMISSION_MAX_INFLIGHT,
+            settings.TENANT_MAX_INFLIGHT,
+            settings.TENANT_MAX_QUEUED,
+            settings.TENANT_WEIGHTS,
+        )
+        return cls(bucket, queue)
+
+    @asynccontextmanager
+    async def slot(
+        self, tenant: str, on_position: Optional[PositionFn] = None
+    ) -> AsyncIterator[None]:
+        wait = await self.bucket.take(tenant)
+        if wait > 0:
+            self.rejected["rate_limited"] += 1
+            raise AdmissionRejected(
+                f"Rate limit reached, please retry in {math.ceil(wait)}s.",
+                reason="rate_limited",
+                retry_after=wait,
+            )
+        try:
+            await self.queue.acquire(tenant, on_position)
+        except AdmissionRejected as e:
+            self.rejected[e.reason] = self.rejected.get(e.reason, 0) + 1
+            raise
+        try:
+            yield
+        finally:
+            self.queue.release(tenant)
+
+    def stats(self) -> Dict[str, Any]:
+        s = self.queue.stats()
+        s["rejected"] = dict(self.rejected)
+        return s
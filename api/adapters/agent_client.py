@@ -1,34 +1,160 @@
 from typing import Protocol, Optional, Dict, Tuple, List, Any
+import asyncio
+import logging
+import random
 import uuid
 import httpx
 
+log = logging.getLogger(__name__)
+
+# Errores en los que el request todavía no salió: reintentar es seguro
+_CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
 
 class AgentPort(Protocol):
     async def turn(
-        self, session_id: str, message: str, prior_quote_state: Optional[Dict[str, Any]]
+        self,
+        session_id: str,
+        message: str,
+        prior_quote_state: Optional[Dict[str, Any]],
+        idempotency_key: Optional[str] = None,
     ) -> Tuple[str, List[dict]]: ...
 
+    async def cancel(self, session_id: str) -> bool: ...
+
 
 class HttpAgentClient(AgentPort):
+    """
+    Cliente del agente con un único httpx.AsyncClient por proceso: pool de
+    conexiones keep-alive (y HTTP/2 opcional), timeouts separados de connect y
+    read, y reintentos con jitter sólo en errores de conexión.
+    Crear en el lifespan y cerrar con `aclose()`.
+    """
+
     def __init__(
         self,
         base_url: str,  # e.g. "http://localhost:8002/turns/" o ".../turns"
         timeout: float = 20.0,
         default_quote_state: Optional[Dict[str, Any]] = None,
         follow_redirects: bool = True,
+        *,
+        connect_timeout: Optional[float] = None,
+        write_timeout: Optional[float] = None,
+        pool_timeout: Optional[float] = None,
+        max_connections: int = 100,
+        max_keepalive: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = False,
+        connect_retries: int = 2,
+        retry_backoff: float = 0.2,
     ) -> None:
         base = base_url.rstrip("/")
         self.base_url = base if base.endswith("/turns") else f"{base}/turns"
         self.timeout = timeout
         self.default_quote_state = default_quote_state or {}
         self.follow_redirects = follow_redirects
+        self.connect_retries = max(0, connect_retries)
+        self.retry_backoff = retry_backoff
+
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                log.warning("AGENT_HTTP2 set but 'h2' is not installed; using HTTP/1.1")
+                http2 = False
+
+        self.stats: Dict[str, int] = {
+            "requests": 0,
+            "in_flight": 0,
+            "connections_opened": 0,
+            "connect_retries": 0,
+            "errors": 0,
+            "cancels": 0,
+        }
+        self._client = httpx.AsyncClient(
+            # `timeout` es el read; None en los demás = mismo valor que el read
+            timeout=httpx.Timeout(
+                timeout,
+                connect=connect_timeout if connect_timeout is not None else timeout,
+                write=write_timeout if write_timeout is not None else timeout,
+                pool=pool_timeout if pool_timeout is not None else timeout,
+            ),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            http2=http2,
+            follow_redirects=follow_redirects,
+        )
+
+    @classmethod
+    def from_settings(cls, settings: Any) -> "HttpAgentClient":
+        return cls(
+            settings.AGENT_BASE_URL,
+            timeout=settings.AGENT_READ_TIMEOUT,
+            connect_timeout=settings.AGENT_CONNECT_TIMEOUT,
+            write_timeout=settings.AGENT_WRITE_TIMEOUT,
+            pool_timeout=settings.AGENT_POOL_TIMEOUT,
+            max_connections=settings.AGENT_MAX_CONNECTIONS,
+            max_keepalive=settings.AGENT_MAX_KEEPALIVE,
+            keepalive_expiry=settings.AGENT_KEEPALIVE_EXPIRY,
+            http2=settings.AGENT_HTTP2,
+            connect_retries=settings.AGENT_CONNECT_RETRIES,
+            retry_backoff=settings.AGENT_RETRY_BACKOFF,
+        )
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    async def _trace(self, event_name: str, info: Dict[str, Any]) -> None:
+        # httpcore avisa cada conexión nueva: requests - connections_opened = reusadas
+        if event_name == "connection.connect_tcp.complete":
+            self.stats["connections_opened"] += 1
+
+    def pool_stats(self) -> Dict[str, Any]:
+        s: Dict[str, Any] = dict(self.stats)
+        s["reused_ratio"] = (
+            round(1 - s["connections_opened"] / s["requests"], 3)
+            if s["requests"]
+            else None
+        )
+        return s
+
+    async def _post(
+        self, url: str, payload: Dict[str, Any], headers: Dict[str, str]
+    ) -> httpx.Response:
+        attempt = 0
+        while True:
+            try:
+                return await self._client.post(
+                    url,
+                    json=payload,
+                    headers=headers,
+                    extensions={"trace": self._trace},
+                )
+            except _CONNECT_ERRORS:
+                if attempt >= self.connect_retries:
+                    raise
+                self.stats["connect_retries"] += 1
+                # full jitter: evita que todos los reintentos lleguen juntos
+                await asyncio.sleep(
+                    random.uniform(0, self.retry_backoff * (2**attempt))  # nosec B311
+                )
+                attempt += 1
 
     async def turn(
         self,
         session_id: str,
         message: str,
         prior_quote_state: Optional[Dict[str, Any]],
+        idempotency_key: Optional[str] = None,
     ) -> Tuple[str, List[dict]]:
+        """
+        `idempotency_key` identifica el turno (ids de los mensajes del cliente),
+        nunca su texto: el engine comparte la ejecución de un reenvío del mismo
+        turno, pero dos mensajes iguales del usuario corren dos veces.
+        """
         sid = session_id or str(uuid.uuid4())
         payload: Dict[str, Any] = {
             "message": message,
@@ -36,30 +162,56 @@ class HttpAgentClient(AgentPort):
             "quote_state": prior_quote_state or self.default_quote_state or {},
         }
         headers = {"X-Session-Id": sid}
-        async with httpx.AsyncClient(
-            timeout=self.timeout, follow_redirects=self.follow_redirects
-        ) as client:
-            # el endpoint real del agente es POST /turns/
-            url = f"{self.base_url}/"
-            resp = await client.post(url, json=payload, headers=headers)
+        if idempotency_key:
+            headers["Idempotency-Key"] = idempotency_key
+        # el endpoint real del agente es POST /turns/
+        url = f"{self.base_url}/"
+        self.stats["requests"] += 1
+        self.stats["in_flight"] += 1
+        try:
+            resp = await self._post(url, payload, headers)
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            self.stats["in_flight"] -= 1
 
-            try:
-                resp.raise_for_status()
-                if (
-                    "application/json"
-                    not in (resp.headers.get("content-type") or "").lower()
-                ):
-                    raise RuntimeError(
-                        f"Agent returned non-JSON (status={resp.status_code})"
-                    )
-                data = resp.json()
-            except Exception as e:
-                # si hay 422, esto te mostrará el detalle de validación
-                detail = (resp.text or "")[:800]
+        try:
+            resp.raise_for_status()
+            if (
+                "application/json"
+                not in (resp.headers.get("content-type") or "").lower()
+            ):
                 raise RuntimeError(
-                    f"Agent error at {url} (status={resp.status_code}): {detail}"
-                ) from e
+                    f"Agent returned non-JSON (status={resp.status_code})"
+                )
+            data = resp.json()
+        except Exception as e:
+            self.stats["errors"] += 1
+            # si hay 422, esto te mostrará el detalle de validación
+            detail = (resp.text or "")[:800]
+            raise RuntimeError(
+                f"Agent error at {url} (status={resp.status_code}): {detail}"
+            ) from e
+
+        assistant_msg = data.get("assistant_message", "Processing your request…")
+        scenarios = data.get("scenarios") or []
+        return assistant_msg, scenarios
 
-            assistant_msg = data.get("assistant_message", "Processing your request…")
-            scenarios = data.get("scenarios") or []
-            return assistant_msg, scenarios
+    async def cancel(self, session_id: str) -> bool:
+        """
+        Avisa al agente que aborte el turno en vuelo de la sesión (el último
+        mensaje ganó). Best-effort: un fallo sólo se loguea.
+        """
+        try:
+            resp = await self._client.post(
+                f"{self.base_url}/cancel",
+                headers={"X-Session-Id": session_id},
+                timeout=self._client.timeout.connect,
+            )
+            resp.raise_for_status()
+            self.stats["cancels"] += 1
+            return bool(resp.json().get("cancelled"))
+        except Exception as e:
+            log.warning("agent cancel failed for session %s: %r", session_id, e)
+            return False
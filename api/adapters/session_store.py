@@ -0,0 +1,363 @@
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
+import logging
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from api.domain.session_sync import SessionRegistry, VersionedSession
+from api.models.quote import QuoteSession
+from api.models.quote_record import QUOTE_SESSION_VERSION_SEQ, QuoteSessionRecord
+
+log = logging.getLogger(__name__)
+
+SessionmakerFactory = Callable[[], async_sessionmaker[AsyncSession]]
+
+# SQLSTATE de errores que dependen de la fila y no de la tabla: 22 (valor
+# inválido, texto demasiado largo) y 23 (FK, unique, not null)
+_ROW_ERROR_CLASSES = ("22", "23")
+
+
+class SessionForbidden(PermissionError):
+    """La sesión existe pero es de otro usuario (o el que pregunta es anónimo)."""
+
+
+class SessionStore:
+    """
+    Repositorio de QuoteSessions: cache caliente en memoria (la misma LRU que
+    usa el protocolo de patches) delante de la tabla JSONB `quote_sessions`.
+
+    Las escrituras son write-behind: `mark_dirty` sólo anota la sesión y una
+    tarea de fondo hace un único upsert por lote cada `flush_interval` segundos
+    (o antes si se juntan `flush_batch` sesiones). Varias escrituras de la misma
+    sesión entre flushes se colapsan en una. Sin DATABASE_URL queda sólo la cache.
+
+    Varios workers pueden compartir la tabla: las versiones salen de una
+    secuencia de Postgres (`next_version`), así que nunca se repiten entre
+    procesos, y cada escritura es condicional a la versión que este proceso
+    leyó o escribió por última vez. Si otro worker escribió antes, la fila no
+    se toca, la sesión sale de la cache y el próximo mensaje del cliente no
+    coincide con la versión de la tabla, así que recibe RESYNC_REQUIRED.
+    Crear en el lifespan con `start()` y cerrar con `aclose()` (hace el último flush).
+    """
+
+    def __init__(
+        self,
+        sessionmaker: Optional[SessionmakerFactory],
+        cache_size: int = 1000,
+        flush_interval: float = 1.0,
+        flush_batch: int = 200,
+        max_retries: int = 3,
+    ) -> None:
+        self._sessionmaker = sessionmaker
+        self.cache = SessionRegistry(cache_size)
+        self.flush_interval = flush_interval
+        self.flush_batch = max(1, flush_batch)
+        self.max_retries = max(0, max_retries)
+        self._dirty: Dict[str, VersionedSession] = {}
+        self._failures: Dict[str, int] = {}
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.stats: Dict[str, int] = {
+            "cache_hits": 0,
+            "db_loads": 0,
+            "flushes": 0,
+            "rows_written": 0,
+            "flush_errors": 0,
+            "rows_dropped": 0,
+            "conflicts": 0,
+        }
+
+    @classmethod
+    def from_settings(cls, settings: Any) -> "SessionStore":
+        sessionmaker: Optional[SessionmakerFactory] = None
+        if settings.DATABASE_URL:
+            from api.core.db import get_sessionmaker
+
+            sessionmaker = get_sessionmaker
+        else:
+            log.warning("DATABASE_URL not set; quote sessions are kept in memory only")
+        return cls(
+            sessionmaker,
+            cache_size=settings.WS_SESSION_CACHE_SIZE,
+            flush_interval=settings.SESSION_FLUSH_INTERVAL,
+            flush_batch=settings.SESSION_FLUSH_BATCH,
+            max_retries=settings.SESSION_FLUSH_MAX_RETRIES,
+        )
+
+    @property
+    def persistent(self) -> bool:
+        return self._sessionmaker is not None
+
+    async def start(self) -> None:
+        if self.persistent and self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def next_version(self, entry: Optional[VersionedSession]) -> int:
+        """
+        Versión para el próximo estado de la sesión. Con base de datos sale de
+        la secuencia (única entre workers, así dos turnos concurrentes nunca
+        quedan con la misma versión); en memoria basta con `version + 1`.
+        """
+        local = entry.version + 1 if entry is not None else 0
+        if self._sessionmaker is None:
+            return local
+        try:
+            async with self._sessionmaker()() as db:
+                version = (
+                    await db.execute(select(QUOTE_SESSION_VERSION_SEQ.next_value()))
+                ).scalar_one()
+        except Exception as e:
+            # la escritura condicional sigue protegiendo la fila: sin secuencia
+            # sólo se pierde la detección de turnos cruzados entre workers
+            log.warning("version sequence unavailable, using local version: %r", e)
+            return local
+        return max(int(version), local)
+
+    # ---------- lectura ----------
+
+    async def get(
+        self, session_id: str, owner: Optional[str]
+    ) -> Optional[VersionedSession]:
+        """
+        La sesión de `owner`, o None si no existe (ni en cache ni en la tabla).
+        Si existe y es de otro usuario levanta SessionForbidden: sólo una sesión
+        que de verdad no existe se puede adoptar como nueva.
+        """
+        entry = self.cache.get(session_id)
+        if entry is not None:
+            self.stats["cache_hits"] += 1
+        elif self._sessionmaker is not None:
+            entry = await self._load(session_id)
+            if entry is not None:
+                self.stats["db_loads"] += 1
+                self.cache.put(entry)
+        if entry is None:
+            return None
+        _check_owner(entry, owner)
+        return entry
+
+    async def _load(self, session_id: str) -> Optional[VersionedSession]:
+        assert self._sessionmaker is not None
+        async with self._sessionmaker()() as db:
+            row = (
+                await db.execute(
+                    select(
+                        QuoteSessionRecord.user_id,
+                        QuoteSessionRecord.version,
+                        QuoteSessionRecord.data,
+                    ).where(QuoteSessionRecord.id == session_id)
+                )
+            ).first()
+        if row is None:
+            return None
+        entry = VersionedSession.adopt(
+            QuoteSession.model_validate(row.data),
+            version=row.version,
+            owner=row.user_id,
+        )
+        entry.persisted_version = row.version
+        return entry
+
+    # ---------- escritura ----------
+
+    def put(self, entry: VersionedSession) -> VersionedSession:
+        cached = self.cache.get(entry.session.id)
+        if cached is not None:
+            _check_owner(cached, entry.owner)
+            # la escritura condicional parte de lo que ya está en la tabla
+            entry.persisted_version = cached.persisted_version
+        self.cache.put(entry)
+        self.mark_dirty(entry)
+        return entry
+
+    def mark_dirty(self, entry: VersionedSession) -> None:
+        if self._sessionmaker is None:
+            return
+        self._dirty[entry.session.id] = entry
+        if len(self._dirty) >= self.flush_batch:
+            self._wake.set()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """
+        Escribe las sesiones pendientes en una sola transacción, una fila por
+        savepoint: una fila mala (título demasiado largo, FK) no tumba a las
+        demás, y tras `max_retries` flushes fallidos se descarta con un error
+        en el log. Cualquier otro error (tabla que falta, base caída) es del
+        store, no de la fila: el lote entero vuelve a quedar pendiente sin
+        contar reintentos, así nada se descarta hasta que la base vuelva. Una fila que otro worker cambió primero es un conflicto:
+        no se pisa y la sesión se vuelve a leer de la tabla (ver `_conflict`).
+        Devuelve cuántas filas se escribieron.
+        """
+        if self._sessionmaker is None or not self._dirty:
+            return 0
+        async with self._flush_lock:
+            batch, self._dirty = self._dirty, {}
+            # la versión base se fija acá: un turno que llegue durante el flush
+            # no debe moverla antes de que la fila se escriba
+            pending = {
+                sid: (entry.persisted_version, _row(entry))
+                for sid, entry in batch.items()
+            }
+            written: List[str] = []
+            conflicts: List[str] = []
+            failed: List[str] = []
+            try:
+                async with self._sessionmaker()() as db:
+                    async with db.begin():
+                        for sid, (base, row) in pending.items():
+                            try:
+                                async with db.begin_nested():
+                                    ok = await self._write(db, base, row)
+                            except DBAPIError as row_error:
+                                if not _is_row_error(row_error):
+                                    raise
+                                self.stats["flush_errors"] += 1
+                                self._retry_later(sid, batch[sid], row_error)
+                                failed.append(sid)
+                                continue
+                            (written if ok else conflicts).append(sid)
+            except Exception as e:
+                # esquema o conexión: nada de este lote quedó escrito y ninguna
+                # fila tiene la culpa, se reintenta entero en el próximo flush
+                self.stats["flush_errors"] += 1
+                log.error("session flush failed (%s rows kept): %r", len(pending), e)
+                for sid, entry in batch.items():
+                    if sid not in failed:
+                        self._requeue(sid, entry)
+                return 0
+            for sid in written:
+                self._failures.pop(sid, None)
+                self._persisted(sid, pending[sid][1]["version"])
+            for sid in conflicts:
+                self._failures.pop(sid, None)
+                self._conflict(sid, batch[sid])
+            if written:
+                self.stats["flushes"] += 1
+                self.stats["rows_written"] += len(written)
+            return len(written)
+
+    async def _write(
+        self, db: AsyncSession, base: Optional[int], row: Dict[str, Any]
+    ) -> bool:
+        """
+        Escritura condicional de una fila. Sin versión base (la sesión no estaba
+        en la tabla) inserta sólo si nadie la creó antes; con base actualiza sólo
+        si la tabla sigue en esa versión y el dueño no cambia. False si perdió.
+        """
+        if base is None:
+            insert = (
+                pg_insert(QuoteSessionRecord)
+                .values(row)
+                .on_conflict_do_nothing(index_elements=[QuoteSessionRecord.id])
+                .returning(QuoteSessionRecord.version)
+            )
+            return (await db.execute(insert)).first() is not None
+        stmt = (
+            update(QuoteSessionRecord)
+            .where(
+                QuoteSessionRecord.id == row["id"],
+                QuoteSessionRecord.version == base,
+                QuoteSessionRecord.user_id == row["user_id"],
+            )
+            .values(
+                title=row["title"],
+                version=row["version"],
+                data=row["data"],
+                updated_at=func.now(),
+            )
+            .returning(QuoteSessionRecord.version)
+        )
+        return (await db.execute(stmt)).first() is not None
+
+    def _persisted(self, sid: str, version: int) -> None:
+        # puede haber un objeto más nuevo (adoptado durante el flush) en la
+        # cache o en el lote siguiente: su próxima escritura parte de acá
+        for entry in (self.cache.get(sid), self._dirty.get(sid)):
+            if entry is not None and (
+                entry.persisted_version is None or entry.persisted_version < version
+            ):
+                entry.persisted_version = version
+
+    def _conflict(self, sid: str, entry: VersionedSession) -> None:
+        """
+        Otro worker escribió la sesión primero. Nuestra copia (y cualquier turno
+        encolado sobre ella) sale de la cache: el próximo mensaje la vuelve a
+        leer de la tabla, ve otra versión y el cliente recibe RESYNC_REQUIRED.
+        """
+        self.stats["conflicts"] += 1
+        log.warning(
+            "session %s was written by another worker (local version %s); "
+            "dropping the cached copy",
+            sid,
+            entry.version,
+        )
+        self.cache.discard(sid)
+        self._dirty.pop(sid, None)
+
+    def _retry_later(self, sid: str, entry: VersionedSession, error: Exception) -> None:
+        failures = self._failures.get(sid, 0) + 1
+        if failures > self.max_retries:
+            self._failures.pop(sid, None)
+            self.stats["rows_dropped"] += 1
+            log.error(
+                "dropping session %s after %s failed flushes: %r", sid, failures, error
+            )
+            return
+        self._failures[sid] = failures
+        self._requeue(sid, entry)
+
+    def _requeue(self, sid: str, entry: VersionedSession) -> None:
+        # lo que se volvió a ensuciar mientras tanto es más nuevo
+        self._dirty.setdefault(sid, entry)
+
+    def store_stats(self) -> Dict[str, Any]:
+        s: Dict[str, Any] = dict(self.stats)
+        s["cached"] = len(self.cache)
+        s["dirty"] = len(self._dirty)
+        s["persistent"] = self.persistent
+        return s
+
+
+def _row(entry: VersionedSession) -> Dict[str, Any]:
+    return {
+        "id": entry.session.id,
+        "user_id": entry.owner or entry.session.userId,
+        "title": entry.session.title,
+        "version": entry.version,
+        "data": entry.session.model_dump(mode="json"),
+    }
+
+
+def _is_row_error(error: DBAPIError) -> bool:
+    # asyncpg no siempre llega como DataError/IntegrityError: se mira el SQLSTATE
+    sqlstate = getattr(error.orig, "sqlstate", None) or ""
+    return str(sqlstate)[:2] in _ROW_ERROR_CLASSES
+
+
+def _check_owner(entry: VersionedSession, owner: Optional[str]) -> None:
+    # estricto: una sesión con dueño no la ve un anónimo ni otro usuario
+    if entry.owner != owner:
+        raise SessionForbidden(f"Session {entry.session.id} belongs to another user")
@@ -0,0 +1,82 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Generic, Optional, Tuple, TypeVar
+import hashlib
+import time
+
+from api.models.auth import TokenData
+
+V = TypeVar("V")
+
+
+class _ExpiringLRU(Generic[V]):
+    """LRU acotada donde cada entrada vence en un instante (epoch) propio."""
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max(1, max_entries)
+        self._data: "OrderedDict[str, Tuple[float, V]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[V]:
+        hit = self._data.get(key)
+        if hit is None or hit[0] <= time.time():
+            if hit is not None:
+                self._data.pop(key, None)
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return hit[1]
+
+    def put(self, key: str, value: V, expires_at: float) -> None:
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def pop(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TokenCache(_ExpiringLRU[TokenData]):
+    """
+    Tokens ya verificados (firma + exp), por hash del token: un token repetido
+    no vuelve a pasar por jwt.decode. Cada entrada vive hasta el `exp` del JWT,
+    así un token vencido nunca sale de la cache como válido.
+    """
+
+    @staticmethod
+    def key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def lookup(self, token: str) -> Optional[TokenData]:
+        return self.get(self.key(token))
+
+    def remember(self, token: str, data: TokenData) -> None:
+        self.put(self.key(token), data, float(data.exp))
+
+
+@dataclass(frozen=True)
+class UserProfile:
+    username: str
+    full_name: Optional[str]
+    disabled: bool
+
+
+class ProfileCache(_ExpiringLRU[UserProfile]):
+    """Perfiles de usuario por `ttl_seconds` delante del SELECT de /auth/me."""
+
+    def __init__(self, ttl_seconds: float, max_entries: int) -> None:
+        super().__init__(max_entries)
+        self.ttl_seconds = ttl_seconds
+
+    def remember(self, profile: UserProfile) -> None:
+        if self.ttl_seconds > 0:
+            self.put(profile.username, profile, time.time() + self.ttl_seconds)
@@ -1,4 +1,5 @@
 from __future__ import annotations
+import asyncio
 from api.core.config import settings
 from datetime import datetime, timedelta, timezone
 from passlib.context import CryptContext
@@ -24,7 +25,8 @@ async def authenticate_user(
     user = res.scalar_one_or_none()
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    # bcrypt tarda decenas de ms: fuera del event loop para no frenar el WS
+    if not await asyncio.to_thread(verify_password, password, user.hashed_password):
         return None
     if user.disabled:
         return None
@@ -1,4 +1,4 @@
-from typing import Any, List, Optional
+from typing import Any, Dict, List, Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import AliasChoices, Field, field_validator
 
@@ -19,10 +19,53 @@ class Settings(BaseSettings):
     SECRET_KEY: str = Field(default="dev-secret-change-me")
     ALGORITHM: str = Field(default="HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = Field(default=120)
+    # Tokens ya verificados (hasta su exp) y perfiles de /auth/me por N segundos
+    AUTH_TOKEN_CACHE_SIZE: int = Field(default=10000)
+    AUTH_PROFILE_TTL: float = Field(default=60.0)
+    AUTH_PROFILE_CACHE_SIZE: int = Field(default=1000)
     DATABASE_URL: Optional[str] = Field(
         default=None, validation_alias=AliasChoices("DATABASE_URL")
     )
 
+    # Cliente HTTP del agente (uno por proceso, creado en el lifespan)
+    AGENT_CONNECT_TIMEOUT: float = Field(default=3.0)
+    AGENT_READ_TIMEOUT: float = Field(default=20.0)
+    AGENT_WRITE_TIMEOUT: float = Field(default=10.0)
+    AGENT_POOL_TIMEOUT: float = Field(default=5.0)
+    AGENT_MAX_CONNECTIONS: int = Field(default=100)
+    AGENT_MAX_KEEPALIVE: int = Field(default=20)
+    AGENT_KEEPALIVE_EXPIRY: float = Field(default=30.0)
+    AGENT_HTTP2: bool = Field(default=False)  # requiere el paquete h2
+    AGENT_CONNECT_RETRIES: int = Field(default=2)
+    AGENT_RETRY_BACKOFF: float = Field(default=0.2)
+
+    # Sesiones versionadas del protocolo de patches del WS (LRU en memoria)
+    WS_SESSION_CACHE_SIZE: int = Field(default=1000)
+    # Write-behind a Postgres: flush cada N segundos o al juntar M sesiones
+    SESSION_FLUSH_INTERVAL: float = Field(default=1.0)
+    SESSION_FLUSH_BATCH: int = Field(default=200)
+    # Flushes fallidos de una sesión antes de descartarla (con error en el log)
+    SESSION_FLUSH_MAX_RETRIES: int = Field(default=3)
+    # Turnos por conexión WS: ventana para juntar ráfagas (0 = sin coalescing)
+    # y cada cuánto se manda TURN_PROGRESS mientras el agente trabaja
+    WS_COALESCE_MS: int = Field(default=0)
+    WS_HEARTBEAT_SECONDS: float = Field(default=5.0)
+    # Frames binarios comprimidos (zlib) para clientes con ?compress=deflate:
+    # desde N bytes (0 = nunca) y con este nivel (1 = rápido; ver bench_ws_compression)
+    WS_COMPRESS_MIN_BYTES: int = Field(default=4096)
+    WS_COMPRESS_LEVEL: int = Field(default=1)
+
+    # Admisión de turnos por usuario (tenant = `sub` del JWT): token bucket
+    # compartido vía Redis si hay REDIS_URL, y cola justa ponderada por proceso
+    REDIS_URL: Optional[str] = Field(default=None)
+    TENANT_RATE_PER_MIN: float = Field(default=20.0)
+    TENANT_BURST: int = Field(default=5)
+    ADMISSION_MAX_INFLIGHT: int = Field(default=16)
+    TENANT_MAX_INFLIGHT: int = Field(default=2)
+    TENANT_MAX_QUEUED: int = Field(default=10)
+    # JSON: {"usuario": peso}; sin entrada = 1.0
+    TENANT_WEIGHTS: Dict[str, float] = Field(default_factory=dict)
+
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
     @field_validator("CORS_ORIGINS", mode="before")
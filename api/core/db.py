@@ -18,6 +18,8 @@ from api.core.config import settings
 
 log = logging.getLogger(__name__)
 
+_SCHEMA_LOCK_KEY = 0x5C_E3_A0_01
+
 
 class Base(DeclarativeBase):
     pass
@@ -92,8 +94,16 @@ async def ping_db() -> bool:
 
 
 async def create_schema_if_needed():
+    # registra las tablas en Base.metadata antes del create_all
+    import api.models.user  # noqa: F401
+    import api.models.quote_record  # noqa: F401
+
     engine = get_engine()
     async with engine.begin() as conn:
+        # varios workers arrancan a la vez: uno crea, los demás esperan y ven las tablas
+        await conn.execute(
+            text("SELECT pg_advisory_xact_lock(:key)"), {"key": _SCHEMA_LOCK_KEY}
+        )
         await conn.run_sync(Base.metadata.create_all)
 
 
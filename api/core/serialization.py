@@ -0,0 +1,57 @@
+from typing import Any, Union
+import json
+import zlib
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # opcional: json de la stdlib
+    orjson = None  # type: ignore[assignment]
+
+# Capa única de JSON de la API: orjson si está instalado (en C, directo a bytes),
+# json de la stdlib con la misma salida compacta si no.
+
+
+def _default(obj: Any) -> Any:
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json")
+    return str(obj)
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(
+        obj, default=_default, ensure_ascii=False, separators=(",", ":")
+    ).encode()
+
+
+def dumps_str(obj: Any) -> str:
+    return dumps(obj).decode()
+
+
+def loads(raw: Union[bytes, bytearray, str]) -> Any:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def ws_frame(event: str, data_json: str) -> str:
+    """Frame `{"event", "data"}` con `data` ya serializado (p.ej. `model_dump_json`)."""
+    return '{"event":' + dumps_str(event) + ',"data":' + data_json + "}"
+
+
+def compress_frame(frame: Union[str, bytes], level: int = 6) -> bytes:
+    """
+    Frame binario del WS: el mismo JSON comprimido con zlib (RFC 1950), lo que
+    el navegador abre con `DecompressionStream("deflate")`. Cada frame es
+    independiente (sin contexto entre mensajes).
+    """
+    data = frame.encode() if isinstance(frame, str) else frame
+    return zlib.compress(data, level)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
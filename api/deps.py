@@ -1,13 +1,69 @@
 from __future__ import annotations
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Optional
 
+from fastapi.requests import HTTPConnection
 
 if TYPE_CHECKING:
-    from api.adapters.agent_client import AgentPort
+    from api.adapters.admission import Admission
+    from api.adapters.agent_client import HttpAgentClient
+    from api.adapters.session_store import SessionStore
+
+
+_fallback_client: Optional["HttpAgentClient"] = None
+_fallback_store: Optional["SessionStore"] = None
+_fallback_admission: Optional["Admission"] = None
 
 
-def get_agent_client() -> "AgentPort":
+def build_agent_client() -> "HttpAgentClient":
     from api.adapters.agent_client import HttpAgentClient
     from api.core.config import settings
 
-    return HttpAgentClient(settings.AGENT_BASE_URL)
+    return HttpAgentClient.from_settings(settings)
+
+
+def get_agent_client(conn: HTTPConnection) -> "HttpAgentClient":
+    """Cliente del agente del proceso (creado en el lifespan, compartido por todas las conexiones)."""
+    global _fallback_client
+    client = getattr(conn.app.state, "agent_client", None)
+    if client is not None:
+        return client
+    # sin lifespan (p.ej. tests con TestClient sin context manager): singleton perezoso
+    if _fallback_client is None:
+        _fallback_client = build_agent_client()
+    return _fallback_client
+
+
+def build_session_store() -> "SessionStore":
+    from api.adapters.session_store import SessionStore
+    from api.core.config import settings
+
+    return SessionStore.from_settings(settings)
+
+
+def get_session_store(conn: HTTPConnection) -> "SessionStore":
+    """Repositorio de sesiones del proceso (cache caliente + write-behind a Postgres)."""
+    global _fallback_store
+    store = getattr(conn.app.state, "session_store", None)
+    if store is not None:
+        return store
+    if _fallback_store is None:
+        _fallback_store = build_session_store()
+    return _fallback_store
+
+
+def build_admission() -> "Admission":
+    from api.adapters.admission import Admission
+    from api.core.config import settings
+
+    return Admission.from_settings(settings)
+
+
+def get_admission(conn: HTTPConnection) -> "Admission":
+    """Rate limit y cola justa de turnos del proceso."""
+    global _fallback_admission
+    admission = getattr(conn.app.state, "admission", None)
+    if admission is not None:
+        return admission
+    if _fallback_admission is None:
+        _fallback_admission = build_admission()
+    return _fallback_admission
@@ -0,0 +1,44 @@
+from typing import Any, Dict, List
+
+# Operaciones estilo JSON-Patch (RFC 6902): sólo add / remove / replace.
+PatchOp = Dict[str, Any]
+
+
+def escape_pointer(token: str) -> str:
+    # RFC 6901: "~" -> "~0" y "/" -> "~1" (en ese orden)
+    return token.replace("~", "~0").replace("/", "~1")
+
+
+def diff(old: Any, new: Any, path: str = "") -> List[PatchOp]:
+    """
+    Ops que llevan `old` a `new`. Dicts se comparan clave por clave; listas
+    que sólo crecen se emiten como `add` al final (`/-`), listas del mismo
+    largo elemento por elemento y cualquier otro cambio como `replace`.
+    """
+    if old == new:
+        return []
+
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops: List[PatchOp] = []
+        for key in old:
+            if key not in new:
+                ops.append({"op": "remove", "path": f"{path}/{escape_pointer(key)}"})
+        for key, value in new.items():
+            sub = f"{path}/{escape_pointer(key)}"
+            if key not in old:
+                ops.append({"op": "add", "path": sub, "value": value})
+            else:
+                ops.extend(diff(old[key], value, sub))
+        return ops
+
+    if isinstance(old, list) and isinstance(new, list):
+        n = len(old)
+        if len(new) > n and new[:n] == old:
+            return [{"op": "add", "path": f"{path}/-", "value": v} for v in new[n:]]
+        if len(new) == n:
+            ops = []
+            for i in range(n):
+                ops.extend(diff(old[i], new[i], f"{path}/{i}"))
+            return ops
+
+    return [{"op": "replace", "path": path, "value": new}]
@@ -0,0 +1,137 @@
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from api.core.serialization import dumps_str
+from api.domain.patch import PatchOp, diff
+from api.models.chat import ChatMessage
+from api.models.quote import QuoteSession
+
+
+@dataclass
+class VersionedSession:
+    """
+    Copia del lado servidor de una QuoteSession. `version` cambia en cada turno
+    (con base de datos la da la secuencia, ver SessionStore.next_version);
+    `scenarios_doc` es el último dump de los escenarios, para no volver a
+    serializarlos al calcular el diff.
+    """
+
+    session: QuoteSession
+    version: int = 0
+    scenarios_doc: List[Dict[str, Any]] = field(default_factory=list)
+    # usuario autenticado dueño de la sesión (el `userId` del payload es del cliente)
+    owner: Optional[str] = None
+    # versión que tiene la fila en `quote_sessions` (None: todavía no existe)
+    persisted_version: Optional[int] = None
+    # un turno a la vez por sesión aunque lleguen desde varias conexiones
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
+    # JSON ya serializado de lo que no cambia entre snapshots: los mensajes
+    # (sólo se agregan) y los escenarios (se invalidan cuando el turno los cambia)
+    _messages_json: List[str] = field(default_factory=list, repr=False)
+    _scenarios_json: Optional[str] = field(default=None, repr=False)
+
+    @classmethod
+    def adopt(
+        cls, session: QuoteSession, version: int = 0, owner: Optional[str] = None
+    ) -> "VersionedSession":
+        return cls(
+            session=session,
+            version=version,
+            owner=owner,
+            scenarios_doc=[s.model_dump(mode="json") for s in session.scenarios],
+        )
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "sessionId": self.session.id,
+            "version": self.version,
+            "data": self.session.model_dump(mode="json"),
+        }
+
+    def snapshot_json(self) -> str:
+        """Igual que `snapshot()` pero ya en JSON, reusando las partes cacheadas."""
+        s = self.session
+        if len(self._messages_json) > len(s.chatMessages):
+            self._messages_json = []
+        for m in s.chatMessages[len(self._messages_json) :]:
+            self._messages_json.append(m.model_dump_json())
+        if self._scenarios_json is None:
+            self._scenarios_json = (
+                "[" + ",".join(sc.model_dump_json() for sc in s.scenarios) + "]"
+            )
+        data = (
+            '{"id":'
+            + dumps_str(s.id)
+            + ',"userId":'
+            + dumps_str(s.userId)
+            + ',"chatMessages":['
+            + ",".join(self._messages_json)
+            + '],"scenarios":'
+            + self._scenarios_json
+            + ',"title":'
+            + dumps_str(s.title)
+            + "}"
+        )
+        return (
+            '{"sessionId":'
+            + dumps_str(s.id)
+            + ',"version":'
+            + str(self.version)
+            + ',"data":'
+            + data
+            + "}"
+        )
+
+    def commit_turn(
+        self,
+        new_messages: List[ChatMessage],
+        new_title: Optional[str] = None,
+        new_scenarios_doc: Optional[List[Dict[str, Any]]] = None,
+        version: Optional[int] = None,
+    ) -> List[PatchOp]:
+        """
+        Aplica el resultado de un turno (mensajes ya agregados a `session`) y
+        devuelve las ops que llevan al cliente de `version` a la nueva versión
+        (`version` si se pasa, si no `version + 1`). El costo depende del turno, no del largo de la conversación.
+        """
+        ops: List[PatchOp] = [
+            {"op": "add", "path": "/chatMessages/-", "value": m.model_dump(mode="json")}
+            for m in new_messages
+        ]
+        if new_scenarios_doc is not None:
+            ops.extend(diff(self.scenarios_doc, new_scenarios_doc, "/scenarios"))
+            self.scenarios_doc = new_scenarios_doc
+            self._scenarios_json = None
+        if new_title is not None:
+            ops.append({"op": "replace", "path": "/title", "value": new_title})
+        self.version = version if version is not None else self.version + 1
+        return ops
+
+
+class SessionRegistry:
+    """LRU en memoria de sesiones versionadas (una por id, compartida entre conexiones)."""
+
+    def __init__(self, max_sessions: int = 1000) -> None:
+        self.max_sessions = max(1, max_sessions)
+        self._data: "OrderedDict[str, VersionedSession]" = OrderedDict()
+
+    def get(self, session_id: str) -> Optional[VersionedSession]:
+        entry = self._data.get(session_id)
+        if entry is not None:
+            self._data.move_to_end(session_id)
+        return entry
+
+    def put(self, entry: VersionedSession) -> VersionedSession:
+        self._data[entry.session.id] = entry
+        self._data.move_to_end(entry.session.id)
+        while len(self._data) > self.max_sessions:
+            self._data.popitem(last=False)
+        return entry
+
+    def discard(self, session_id: str) -> None:
+        self._data.pop(session_id, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,98 @@
+from typing import Awaitable, Callable, Dict, Optional
+import asyncio
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+
+class TurnControl:
+    """Estado de un turno en vuelo (lo lee el heartbeat y quien lo cancela)."""
+
+    def __init__(self, key: str, message_id: Optional[str]) -> None:
+        self.key = key
+        self.message_id = message_id
+        self.started = time.monotonic()
+        self.stage = "queued"
+        # el request ya salió al agente: al cancelar hay que avisarle
+        self.dispatched = False
+        self.task: Optional["asyncio.Task[None]"] = None
+
+    def elapsed_ms(self) -> int:
+        return int((time.monotonic() - self.started) * 1000)
+
+
+TurnFn = Callable[[TurnControl], Awaitable[None]]
+ProgressFn = Callable[[TurnControl], Awaitable[None]]
+
+
+class TurnTasks:
+    """
+    Turnos de una conexión WS corriendo como tasks, uno por sesión: el último
+    mensaje gana. `supersede` cancela (y espera) el turno anterior de la sesión;
+    con `coalesce_seconds` > 0 cada turno espera esa ventana antes de llamar al
+    agente, así una ráfaga de correcciones termina en una sola llamada.
+    Mientras el turno corre, `progress` se llama cada `heartbeat_seconds`.
+    """
+
+    def __init__(
+        self,
+        coalesce_seconds: float = 0.0,
+        heartbeat_seconds: float = 5.0,
+        progress: Optional[ProgressFn] = None,
+    ) -> None:
+        self.coalesce_seconds = max(0.0, coalesce_seconds)
+        self.heartbeat_seconds = heartbeat_seconds
+        self.progress = progress
+        self._active: Dict[str, TurnControl] = {}
+
+    def active(self, key: str) -> Optional[TurnControl]:
+        return self._active.get(key)
+
+    async def supersede(self, key: str) -> Optional[TurnControl]:
+        """Cancela el turno en vuelo de `key` y devuelve su control (o None)."""
+        ctl = self._active.pop(key, None)
+        if ctl is None or ctl.task is None or ctl.task.done():
+            return None
+        ctl.task.cancel()
+        await asyncio.gather(ctl.task, return_exceptions=True)
+        return ctl
+
+    def start(self, key: str, message_id: Optional[str], fn: TurnFn) -> TurnControl:
+        ctl = TurnControl(key, message_id)
+        ctl.task = asyncio.create_task(self._run(ctl, fn))
+        self._active[key] = ctl
+        return ctl
+
+    async def _run(self, ctl: TurnControl, fn: TurnFn) -> None:
+        beat: Optional["asyncio.Task[None]"] = None
+        try:
+            if self.coalesce_seconds:
+                ctl.stage = "coalescing"
+                await asyncio.sleep(self.coalesce_seconds)
+            if self.progress is not None and self.heartbeat_seconds > 0:
+                beat = asyncio.create_task(self._heartbeat(ctl))
+            ctl.stage = "running"
+            await fn(ctl)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("turn task failed (session=%s)", ctl.key)
+        finally:
+            if beat is not None:
+                beat.cancel()
+            if self._active.get(ctl.key) is ctl:
+                self._active.pop(ctl.key, None)
+
+    async def _heartbeat(self, ctl: TurnControl) -> None:
+        assert self.progress is not None
+        while True:
+            try:
+                await self.progress(ctl)
+            except Exception:
+                # la conexión pudo cerrarse: el turno sigue y se guarda igual
+                return
+            await asyncio.sleep(self.heartbeat_seconds)
+
+    def __len__(self) -> int:
+        return len(self._active)
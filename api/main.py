@@ -5,21 +5,41 @@ from contextlib import asynccontextmanager
 import logging
 
 from api.core.config import settings
+from api.core.serialization import FastJSONResponse
 from api.routers import health, ws, quotes, auth
 
 from api.core.db import wait_for_db, create_schema_if_needed
+from api.deps import build_admission, build_agent_client, build_session_store
 
 log = logging.getLogger(__name__)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await wait_for_db()
-    await create_schema_if_needed()
-    yield
-
-
-app = FastAPI(title="IA-Agent API", version="0.1.0")
+    if settings.DATABASE_URL:
+        # crea las tablas que falten (users, quote_sessions) antes de aceptar tráfico
+        await wait_for_db()
+        await create_schema_if_needed()
+    # un solo cliente del agente por proceso: conexiones keep-alive reusadas entre turnos
+    app.state.agent_client = build_agent_client()
+    # sesiones en memoria con flush por lotes a Postgres en background
+    app.state.session_store = build_session_store()
+    await app.state.session_store.start()
+    # rate limit + cola justa por usuario delante del agente
+    app.state.admission = build_admission()
+    try:
+        yield
+    finally:
+        await app.state.session_store.aclose()
+        await app.state.agent_client.aclose()
+
+
+app = FastAPI(
+    title="IA-Agent API",
+    version="0.1.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
+)
 
 app.add_middleware(TrustedHostMiddleware, allowed_hosts=["*"])
 app.add_middleware(
@@ -15,6 +15,7 @@ from .quote import (
     Scenario,
     QuoteSession,
 )
+from .ws import UserMessageIn, SessionResyncIn
 
 __all__ = [
     "Role",
@@ -32,4 +33,6 @@ __all__ = [
     "Quote",
     "Scenario",
     "QuoteSession",
+    "UserMessageIn",
+    "SessionResyncIn",
 ]
@@ -0,0 +1,28 @@
+from datetime import datetime
+from typing import Any, Dict
+from sqlalchemy import JSON, DateTime, Integer, Sequence, String, func
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+from api.core.db import Base
+
+# versiones de sesión únicas entre workers (ver SessionStore.next_version)
+QUOTE_SESSION_VERSION_SEQ = Sequence(
+    "quote_session_version_seq", metadata=Base.metadata
+)
+
+
+class QuoteSessionRecord(Base):
+    """Copia persistida de una QuoteSession (documento completo en JSONB)."""
+
+    __tablename__ = "quote_sessions"
+
+    id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    user_id: Mapped[str] = mapped_column(String(64), index=True)
+    title: Mapped[str] = mapped_column(String(255), default="")
+    version: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    data: Mapped[Dict[str, Any]] = mapped_column(
+        JSON().with_variant(JSONB(), "postgresql")
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
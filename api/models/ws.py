@@ -0,0 +1,21 @@
+from typing import Optional
+from pydantic import BaseModel
+from .chat import ChatMessage
+from .quote import QuoteSession
+
+
+class UserMessageIn(BaseModel):
+    """
+    Evento USER_MESSAGE: sólo el mensaje nuevo y la versión sobre la que el
+    cliente lo escribió. `session` viaja únicamente la primera vez o después de
+    un RESYNC_REQUIRED (la copia confirmada del cliente, sin el mensaje nuevo).
+    """
+
+    sessionId: str
+    baseVersion: Optional[int] = None
+    message: ChatMessage
+    session: Optional[QuoteSession] = None
+
+
+class SessionResyncIn(BaseModel):
+    sessionId: str
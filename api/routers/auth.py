@@ -1,6 +1,7 @@
 from typing import Optional
 from api.core.config import settings
 from fastapi import APIRouter, HTTPException, status, Header, Depends
+from api.auth.cache import ProfileCache, TokenCache, UserProfile
 from api.auth.security import authenticate_user, create_access_token
 from api.auth.schemas import LoginRequest, TokenResponse, MeResponse
 from api.models.auth import TokenData
@@ -12,6 +13,12 @@ from api.core.db import get_db
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
+# por proceso: la verificación del JWT y el perfil no dependen de la DB por request
+token_cache = TokenCache(settings.AUTH_TOKEN_CACHE_SIZE)
+profile_cache = ProfileCache(
+    settings.AUTH_PROFILE_TTL, settings.AUTH_PROFILE_CACHE_SIZE
+)
+
 
 @router.post(
     "/login", response_model=TokenResponse, summary="Login con username/password (JSON)"
@@ -25,6 +32,13 @@ async def login(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials"
         )
     token = create_access_token(sub=user.username)
+    # el /auth/me y el WS que siguen al login no vuelven a decodificar ni a consultar
+    token_cache.remember(token, decode_token(token))
+    profile_cache.remember(
+        UserProfile(
+            username=user.username, full_name=user.full_name, disabled=user.disabled
+        )
+    )
     return TokenResponse(access_token=token)
 
 
@@ -37,15 +51,39 @@ def _extract_bearer_token(authorization: Optional[str]) -> str:
 
 
 def decode_token(token: str) -> TokenData:
+    cached = token_cache.lookup(token)
+    if cached is not None:
+        return cached
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
         )
-        return TokenData(sub=payload["sub"], exp=payload["exp"])
+        data = TokenData(sub=payload["sub"], exp=payload["exp"])
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    token_cache.remember(token, data)
+    return data
+
+
+async def get_profile(session: AsyncSession, username: str) -> Optional[UserProfile]:
+    profile = profile_cache.get(username)
+    if profile is not None:
+        return profile
+
+    from sqlalchemy import select
+    from api.models.user import User
+
+    res = await session.execute(select(User).where(User.username == username))
+    user = res.scalar_one_or_none()
+    if not user:
+        return None
+    profile = UserProfile(
+        username=user.username, full_name=user.full_name, disabled=user.disabled
+    )
+    profile_cache.remember(profile)
+    return profile
 
 
 @router.get("/me", response_model=MeResponse)
@@ -55,12 +93,7 @@ async def me(
 ) -> MeResponse:
     token = _extract_bearer_token(authorization)
     data = decode_token(token)
-
-    from sqlalchemy import select
-    from api.models.user import User
-
-    res = await session.execute(select(User).where(User.username == data.sub))
-    user = res.scalar_one_or_none()
+    user = await get_profile(session, data.sub)
 
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -1,6 +1,9 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
+from api.adapters.admission import Admission
+from api.adapters.agent_client import HttpAgentClient
+from api.adapters.session_store import SessionStore
 from api.core.db import ping_db
-
+from api.deps import get_admission, get_agent_client, get_session_store
 
 router = APIRouter(prefix="/healthz", tags=["health"])
 
@@ -9,3 +12,18 @@ router = APIRouter(prefix="/healthz", tags=["health"])
 async def healthz():
     ok = await ping_db()
     return {"status": "ok" if ok else "degraded", "db": ok}
+
+
+@router.get("/agent")
+async def agent_pool(agent: HttpAgentClient = Depends(get_agent_client)):
+    return agent.pool_stats()
+
+
+@router.get("/sessions")
+async def session_store(store: SessionStore = Depends(get_session_store)):
+    return store.store_stats()
+
+
+@router.get("/admission")
+async def admission_stats(admission: Admission = Depends(get_admission)):
+    return admission.stats()
@@ -1,7 +1,11 @@
 from uuid import uuid4
 from datetime import datetime
-from fastapi import APIRouter, Depends
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, status
+from api.adapters.session_store import SessionForbidden, SessionStore
 from api.auth.deps import get_current_username
+from api.deps import get_session_store
+from api.domain.session_sync import VersionedSession
 from api.models.user import Role
 from api.models.chat import ChatMessage
 from api.models.quote import (
@@ -21,14 +25,43 @@ router = APIRouter(prefix="/quote", tags=["quotes"])
 
 
 @router.post("/", response_model=QuoteSession)
-def quote(
-    session: QuoteSession, current_user: str = Depends(get_current_username)
+async def quote(
+    session: QuoteSession,
+    current_user: str = Depends(get_current_username),
+    store: SessionStore = Depends(get_session_store),
 ) -> QuoteSession:
+    prev = await _owned(store, session.id, current_user)
+    version = await store.next_version(prev)
+    store.put(VersionedSession.adopt(session, version=version, owner=current_user))
     return session
 
 
 @router.get("/", response_model=QuoteSession)
-def get_quote(current_user: str = Depends(get_current_username)) -> QuoteSession:
+async def get_quote(
+    sessionId: Optional[str] = None,
+    current_user: str = Depends(get_current_username),
+    store: SessionStore = Depends(get_session_store),
+) -> QuoteSession:
+    if sessionId:
+        entry = await _owned(store, sessionId, current_user)
+        if entry is not None:
+            return entry.session
+    return _sample_session()
+
+
+async def _owned(
+    store: SessionStore, session_id: str, current_user: str
+) -> Optional[VersionedSession]:
+    try:
+        return await store.get(session_id, current_user)
+    except SessionForbidden:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Session belongs to another user",
+        )
+
+
+def _sample_session() -> QuoteSession:
     header = QuoteHeaderData(
         title="Sample Quote",
         dealId="D12345",
@@ -1,100 +1,436 @@
 from __future__ import annotations
-import json
 import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Set
 from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect, Depends
 from pydantic import ValidationError
 
-from api.deps import get_agent_client
+from api.core.config import settings
+from api.core.serialization import compress_frame, dumps_str, loads, ws_frame
+from api.deps import get_admission, get_agent_client, get_session_store
+from api.adapters.admission import Admission, AdmissionRejected
 from api.adapters.agent_client import AgentPort
+from api.adapters.session_store import SessionForbidden, SessionStore
 from api.domain.services import (
     QuoteService,
     extract_last_user_message,
     pick_prior_quote_state,
 )
+from api.domain.session_sync import VersionedSession
+from api.domain.turn_tasks import TurnControl, TurnTasks
 
+from api.models.chat import ChatMessage
 from api.models.quote import QuoteSession
+from api.models.ws import SessionResyncIn, UserMessageIn
 from api.routers.auth import decode_token
 
 router = APIRouter(tags=["ws"])
 logger = logging.getLogger(__name__)
 _service = QuoteService()
 
+# Protocolo de patches (el evento QUOTE_UPDATED_CLIENT con la sesión completa
+# sigue funcionando igual):
+#   cliente -> USER_MESSAGE {sessionId, baseVersion, message[, session]}
+#   servidor -> QUOTE_PATCH {sessionId, fromVersion, version, ops}
+#   servidor -> RESYNC_REQUIRED {sessionId, version, messageId} si no tiene la
+#               sesión o la versión no coincide; el cliente reenvía con `session`
+#   cliente -> SESSION_RESYNC {sessionId}; servidor -> QUOTE_SNAPSHOT
+#               {sessionId, version, data} (sólo aquí viaja la sesión completa)
+# Cada turno corre como task de la conexión; un mensaje nuevo de la misma sesión
+# cancela el anterior (TURN_CANCELLED, y el agente recibe un cancel si ya lo
+# estaba procesando). Mientras corre: TURN_PROGRESS {stage, elapsedMs}; si el
+# turno espera en la cola justa del usuario, stage "queued" y {position}.
+# El token se verifica al conectar (inválido o vencido -> close 4401, no hay
+# conexiones anónimas) y su exp se revisa en cada mensaje (sin DB): vencido ->
+# AUTH_EXPIRED {exp} y close 4401; el cliente vuelve al login y reconecta.
+# Con ?compress=deflate los frames de más de WS_COMPRESS_MIN_BYTES viajan como
+# mensajes binarios (el mismo JSON, zlib); los chicos siguen como texto.
+
+
+@dataclass
+class _Connection:
+    """Lo que comparte una conexión WS entre sus handlers y sus turnos en vuelo."""
+
+    websocket: WebSocket
+    agent: AgentPort
+    store: SessionStore
+    owner: Optional[str]
+    turns: TurnTasks
+    admission: Admission
+    # exp (epoch) del JWT con que se abrió la conexión
+    token_exp: Optional[int] = None
+    # mensajes del usuario cuyo turno fue cancelado/coalescido y aún no se confirmaron
+    carry: Dict[str, List[ChatMessage]] = field(default_factory=dict)
+    # ids de mensajes que ya llegaron al agente (no se le vuelven a mandar)
+    dispatched: Set[str] = field(default_factory=set)
+
+    @property
+    def tenant(self) -> str:
+        # sin usuario, cada cliente (IP) tiene su propio bucket y su lugar en la cola
+        if self.owner:
+            return self.owner
+        client = self.websocket.client
+        return f"anon:{client.host if client else id(self.websocket)}"
+
+    def token_expired(self) -> bool:
+        return self.token_exp is not None and self.token_exp <= time.time()
+
+
+async def _transmit(websocket: WebSocket, frame: str) -> None:
+    min_bytes = getattr(websocket.state, "compress_min_bytes", 0)
+    if min_bytes and len(frame) >= min_bytes:
+        await websocket.send_bytes(compress_frame(frame, settings.WS_COMPRESS_LEVEL))
+    else:
+        await websocket.send_text(frame)
+
+
+async def _send(websocket: WebSocket, event: str, data: Any) -> None:
+    await _transmit(websocket, dumps_str({"event": event, "data": data}))
+
+
+async def _send_json(websocket: WebSocket, event: str, data_json: str) -> None:
+    # `data_json` ya viene serializado (model_dump_json / snapshot cacheado)
+    await _transmit(websocket, ws_frame(event, data_json))
+
+
+async def _send_quietly(
+    websocket: WebSocket, event: str, data: Any = None, data_json: str = ""
+) -> None:
+    # los turnos terminan (y se guardan) aunque el cliente se haya desconectado
+    try:
+        if data_json:
+            await _send_json(websocket, event, data_json)
+        else:
+            await _send(websocket, event, data)
+    except Exception as e:
+        logger.debug("WS send after disconnect dropped (%s): %r", event, e)
+
+
+async def _apply_turn(
+    conn: _Connection,
+    session: QuoteSession,
+    user_msg: str,
+    ctl: Optional[TurnControl] = None,
+    new_messages: Sequence[ChatMessage] = (),
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Corre el turno del agente sobre `session` (agrega `new_messages`, la
+    respuesta, escenarios y título). Devuelve el dump de los escenarios nuevos,
+    o None si no cambiaron. Nada se toca antes de que el agente responda: si el
+    turno se cancela, `session` queda como estaba. Si la admisión rechaza el
+    turno (rate limit / cola llena) se responde con un mensaje del asistente.
+    La Idempotency-Key del agente son los ids de los mensajes del turno.
+    """
+    prior = pick_prior_quote_state(session)
+
+    async def on_position(position: int) -> None:
+        await _send_quietly(
+            conn.websocket,
+            "TURN_PROGRESS",
+            {
+                "sessionId": session.id,
+                "messageId": ctl.message_id if ctl else None,
+                "stage": "queued",
+                "position": position,
+                "elapsedMs": ctl.elapsed_ms() if ctl else 0,
+            },
+        )
+
+    try:
+        if ctl is not None:
+            ctl.stage = "queued"
+        async with conn.admission.slot(conn.tenant, on_position):
+            if ctl is not None:
+                ctl.dispatched = True
+                ctl.stage = "agent"
+            assistant_text, scenario_states = await conn.agent.turn(
+                session.id, user_msg, prior, _idempotency_key(ctl, new_messages)
+            )
+    except AdmissionRejected as e:
+        session.chatMessages.extend(new_messages)
+        _service.attach_assistant_message(session, f"⏳ {e}")
+        return None
+    except Exception as e:
+        session.chatMessages.extend(new_messages)
+        _service.attach_assistant_message(session, f"⚠️ Agent error: {str(e)}")
+        return None
+
+    quotes = _service.map_states_to_quotes(scenario_states)
+    new_scenarios = _service.build_scenarios(quotes)
+
+    session.chatMessages.extend(new_messages)
+    _service.attach_assistant_message(session, assistant_text)
+    if new_scenarios:
+        session.scenarios = new_scenarios
+    _service.update_title_from_balanced(session)
+    if not new_scenarios:
+        return None
+    return [s.model_dump(mode="json") for s in new_scenarios]
+
+
+def _idempotency_key(
+    ctl: Optional[TurnControl], messages: Sequence[ChatMessage]
+) -> Optional[str]:
+    # un reenvío del mismo mensaje (reconnect) comparte el turno en el engine;
+    # el mismo texto en un mensaje nuevo tiene otro id y corre de nuevo
+    ids = [m.id for m in messages if m.id]
+    if ids:
+        return "+".join(ids)
+    return ctl.message_id if ctl else None
+
+
+async def _supersede(conn: _Connection, session_id: str) -> None:
+    """Último mensaje gana: cancela el turno en vuelo de la sesión y avisa."""
+    prev = await conn.turns.supersede(session_id)
+    if prev is None:
+        return
+    await _send(
+        conn.websocket,
+        "TURN_CANCELLED",
+        {"sessionId": session_id, "messageId": prev.message_id, "reason": "superseded"},
+    )
+    if prev.dispatched:
+        # el agente sigue corriendo el grafo aunque cortemos el request
+        await conn.agent.cancel(session_id)
+
+
+async def _report_progress(conn: _Connection, ctl: TurnControl) -> None:
+    await _send(
+        conn.websocket,
+        "TURN_PROGRESS",
+        {
+            "sessionId": ctl.key,
+            "messageId": ctl.message_id,
+            "stage": ctl.stage,
+            "elapsedMs": ctl.elapsed_ms(),
+        },
+    )
+
+
+async def _handle_user_message(conn: _Connection, data: Any) -> None:
+    websocket, store = conn.websocket, conn.store
+    try:
+        req = UserMessageIn(**(data or {}))
+    except ValidationError as e:
+        await _send(websocket, "ERROR", str(e))
+        return
+
+    try:
+        entry = await store.get(req.sessionId, conn.owner)
+    except SessionForbidden as e:
+        await _send(websocket, "ERROR", str(e))
+        return
+    resync = False
+    if entry is None or entry.version != req.baseVersion:
+        if req.session is None or req.session.id != req.sessionId:
+            await _send(
+                websocket,
+                "RESYNC_REQUIRED",
+                {
+                    "sessionId": req.sessionId,
+                    "version": entry.version if entry else None,
+                    "messageId": req.message.id,
+                },
+            )
+            return
+        resync = True
+
+    await _supersede(conn, req.sessionId)
+    if resync:
+        assert req.session is not None
+        # el cliente manda su copia confirmada (con los mensajes previos): la
+        # adoptamos y respondemos con snapshot para quedar en la misma versión
+        version = await store.next_version(entry)
+        entry = store.put(
+            VersionedSession.adopt(req.session, version=version, owner=conn.owner)
+        )
+        conn.carry.pop(req.sessionId, None)
+    assert entry is not None
+    conn.carry.setdefault(req.sessionId, []).append(req.message)
+
+    target = entry
+    base_version = target.version
+
+    async def run(ctl: TurnControl) -> None:
+        await _run_user_turn(conn, ctl, target, base_version, resync)
+
+    conn.turns.start(req.sessionId, req.message.id, run)
+
+
+async def _run_user_turn(
+    conn: _Connection,
+    ctl: TurnControl,
+    entry: VersionedSession,
+    base_version: int,
+    resync: bool,
+) -> None:
+    websocket = conn.websocket
+    async with entry.lock:
+        pending = list(conn.carry.get(ctl.key, []))
+        if entry.version != base_version:
+            # otro turno de la misma sesión (otra pestaña) ganó la carrera
+            conn.carry.pop(ctl.key, None)
+            await _send_quietly(
+                websocket,
+                "RESYNC_REQUIRED",
+                {
+                    "sessionId": ctl.key,
+                    "version": entry.version,
+                    "messageId": ctl.message_id,
+                },
+            )
+            return
+
+        session = entry.session
+        from_version = entry.version
+        first_new = len(session.chatMessages)
+        old_title = session.title
+        # al agente sólo va lo que todavía no vio (ráfagas coalescidas van juntas)
+        user_text = (
+            "\n".join(m.content for m in pending if (m.id or "") not in conn.dispatched)
+            or pending[-1].content
+        )
+        conn.dispatched.update(m.id for m in pending if m.id)
+
+        scenarios_doc = await _apply_turn(
+            conn, session, user_text, ctl, new_messages=pending
+        )
+        ops = entry.commit_turn(
+            session.chatMessages[first_new:],
+            new_title=session.title if session.title != old_title else None,
+            new_scenarios_doc=scenarios_doc,
+            version=await conn.store.next_version(entry),
+        )
+        conn.store.mark_dirty(entry)
+        conn.carry.pop(ctl.key, None)
+        conn.dispatched.difference_update(m.id for m in pending if m.id)
+
+        if resync:
+            await _send_quietly(
+                websocket, "QUOTE_SNAPSHOT", data_json=entry.snapshot_json()
+            )
+        else:
+            await _send_quietly(
+                websocket,
+                "QUOTE_PATCH",
+                {
+                    "sessionId": session.id,
+                    "fromVersion": from_version,
+                    "version": entry.version,
+                    "ops": ops,
+                },
+            )
+
+
+async def _handle_resync(conn: _Connection, data: Any) -> None:
+    websocket = conn.websocket
+    try:
+        req = SessionResyncIn(**(data or {}))
+    except ValidationError as e:
+        await _send(websocket, "ERROR", str(e))
+        return
+    # reconexión: la sesión sale de la cache (o de Postgres si este proceso no la tiene)
+    try:
+        entry = await conn.store.get(req.sessionId, conn.owner)
+    except SessionForbidden as e:
+        await _send(websocket, "ERROR", str(e))
+        return
+    if entry is None:
+        await _send(
+            websocket,
+            "RESYNC_REQUIRED",
+            {"sessionId": req.sessionId, "version": None, "messageId": None},
+        )
+        return
+    await _send_json(websocket, "QUOTE_SNAPSHOT", entry.snapshot_json())
+
+
+async def _handle_full_session(conn: _Connection, data: Any) -> None:
+    try:
+        session = QuoteSession(**data)
+    except ValidationError as e:
+        await _send(conn.websocket, "ERROR", str(e))
+        return
+
+    user_msg = extract_last_user_message(session)
+    if not user_msg:
+        await _send_json(conn.websocket, "QUOTE_UPDATED", session.model_dump_json())
+        return
+
+    async def run(ctl: TurnControl) -> None:
+        await _apply_turn(conn, session, user_msg, ctl)
+        await _send_quietly(
+            conn.websocket, "QUOTE_UPDATED", data_json=session.model_dump_json()
+        )
+
+    await _supersede(conn, session.id)
+    last = session.chatMessages[-1] if session.chatMessages else None
+    conn.turns.start(session.id, last.id if last else None, run)
+
 
 @router.websocket("/ws")
 async def websocket_endpoint(
     websocket: WebSocket,
     agent: AgentPort = Depends(get_agent_client),
+    store: SessionStore = Depends(get_session_store),
+    admission: Admission = Depends(get_admission),
     token: str = Query(...),
+    compress: Optional[str] = Query(default=None),
 ):
+    await websocket.accept()
     try:
-        data = decode_token(token)
-    except Exception:
-        pass
+        claims = decode_token(token)
+    except Exception as e:
+        # sin conexiones anónimas: el cliente pide un token nuevo (o vuelve al login)
+        logger.info("WS token rejected: %r", e)
+        await websocket.close(code=4401, reason="Invalid or expired token")
+        return
+    owner, token_exp = claims.sub, claims.exp
+    if compress == "deflate" and settings.WS_COMPRESS_MIN_BYTES > 0:
+        websocket.state.compress_min_bytes = settings.WS_COMPRESS_MIN_BYTES
+    conn = _Connection(
+        websocket=websocket,
+        agent=agent,
+        store=store,
+        owner=owner,
+        turns=TurnTasks(
+            coalesce_seconds=settings.WS_COALESCE_MS / 1000,
+            heartbeat_seconds=settings.WS_HEARTBEAT_SECONDS,
+        ),
+        admission=admission,
+        token_exp=token_exp,
+    )
 
-    await websocket.accept()
+    async def progress(ctl: TurnControl) -> None:
+        await _report_progress(conn, ctl)
+
+    conn.turns.progress = progress
     try:
         while True:
             raw = await websocket.receive_text()
+            if conn.token_expired():
+                await _send(websocket, "AUTH_EXPIRED", {"exp": conn.token_exp})
+                await websocket.close(code=4401, reason="Token expired")
+                logger.info("WebSocket closed: token expired (%s)", owner)
+                return
             try:
-                msg = json.loads(raw)
+                msg = loads(raw)
                 event = msg.get("event")
                 data = msg.get("data")
 
-                if event != "QUOTE_UPDATED_CLIENT":
-                    await websocket.send_text(
-                        json.dumps({"event": "UNKNOWN_EVENT", "data": event})
-                    )
-                    continue
-
-                try:
-                    session = QuoteSession(**data)
-                except ValidationError as e:
-                    await websocket.send_text(
-                        json.dumps({"event": "ERROR", "data": str(e)})
-                    )
-                    continue
-
-                user_msg = extract_last_user_message(session)
-                if not user_msg:
-                    await websocket.send_text(
-                        json.dumps(
-                            {"event": "QUOTE_UPDATED", "data": session.model_dump()}
-                        )
-                    )
-                    continue
-
-                prior = pick_prior_quote_state(session)
-
-                try:
-                    assistant_text, scenario_states = await agent.turn(
-                        session.id, user_msg, prior
-                    )
-                except Exception as e:
-                    _service.attach_assistant_message(
-                        session, f"⚠️ Agent error: {str(e)}"
-                    )
-                    await websocket.send_text(
-                        json.dumps(
-                            {"event": "QUOTE_UPDATED", "data": session.model_dump()}
-                        )
-                    )
-                    continue
-
-                quotes = _service.map_states_to_quotes(scenario_states)
-                new_scenarios = _service.build_scenarios(quotes)
-
-                _service.attach_assistant_message(session, assistant_text)
-                if new_scenarios:
-                    session.scenarios = new_scenarios
-                _service.update_title_from_balanced(session)
-
-                await websocket.send_text(
-                    json.dumps({"event": "QUOTE_UPDATED", "data": session.model_dump()})
-                )
+                if event == "USER_MESSAGE":
+                    await _handle_user_message(conn, data)
+                elif event == "SESSION_RESYNC":
+                    await _handle_resync(conn, data)
+                elif event == "QUOTE_UPDATED_CLIENT":
+                    await _handle_full_session(conn, data)
+                else:
+                    await _send(websocket, "UNKNOWN_EVENT", event)
 
             except Exception as e:
-                await websocket.send_text(
-                    json.dumps({"event": "ERROR", "data": str(e)})
-                )
+                await _send(websocket, "ERROR", str(e))
     except WebSocketDisconnect:
-        logger.info("WebSocket disconnected")
+        # los turnos en vuelo no se cancelan: terminan, se guardan y el cliente
+        # los recibe con SESSION_RESYNC al reconectar
+        logger.info("WebSocket disconnected (%s turn(s) in flight)", len(conn.turns))
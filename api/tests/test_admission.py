@@ -0,0 +1,147 @@
+import asyncio
+from typing import Any, List, Tuple
+
+import pytest
+
+from api.adapters import admission as admission_mod
+from api.adapters.admission import (
+    Admission,
+    AdmissionRejected,
+    FairQueue,
+    LocalTokenBucket,
+    RedisTokenBucket,
+)
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> _Clock:
+    c = _Clock()
+    monkeypatch.setattr(admission_mod.time, "monotonic", c)
+    return c
+
+
+def test_token_bucket_allows_the_burst_then_asks_to_wait(clock: _Clock) -> None:
+    bucket = LocalTokenBucket(rate=0.5, burst=2)
+
+    assert asyncio.run(bucket.take("alice")) == 0.0
+    assert asyncio.run(bucket.take("alice")) == 0.0
+    assert asyncio.run(bucket.take("alice")) == pytest.approx(2.0)
+    # cada tenant tiene su propio bucket
+    assert asyncio.run(bucket.take("bob")) == 0.0
+
+    clock.now += 2.0
+    assert asyncio.run(bucket.take("alice")) == 0.0
+
+
+def test_redis_bucket_fails_open_to_the_local_bucket() -> None:
+    class _BrokenRedis:
+        def register_script(self, script: str) -> Any:
+            async def run(keys: List[str], args: List[Any]) -> str:
+                raise ConnectionError("redis down")
+
+            return run
+
+    bucket = RedisTokenBucket(_BrokenRedis(), rate=1.0, burst=1)
+
+    assert asyncio.run(bucket.take("alice")) == 0.0
+    assert asyncio.run(bucket.take("alice")) > 0
+
+
+async def _take_turns(
+    queue: FairQueue, tenants: List[str]
+) -> Tuple[List[str], List[Tuple[str, int]]]:
+    """Encola un turno por tenant (en orden) y devuelve el orden de despacho."""
+    order: List[str] = []
+    positions: List[Tuple[str, int]] = []
+    gate = asyncio.Event()
+
+    async def turn(i: int, tenant: str) -> None:
+        async def on_position(pos: int) -> None:
+            positions.append((f"{tenant}{i}", pos))
+
+        await queue.acquire(tenant, on_position)
+        order.append(f"{tenant}{i}")
+        await gate.wait()
+        queue.release(tenant)
+        gate.clear()
+
+    tasks = []
+    for i, tenant in enumerate(tenants):
+        tasks.append(asyncio.create_task(turn(i, tenant)))
+        await asyncio.sleep(0)
+    while not all(t.done() for t in tasks):
+        gate.set()
+        await asyncio.sleep(0)
+    return order, positions
+
+
+def test_fair_queue_interleaves_tenants_by_virtual_finish_time() -> None:
+    queue = FairQueue(max_inflight=1, tenant_max_inflight=1, tenant_max_queued=10)
+    order, _ = asyncio.run(_take_turns(queue, ["a", "a", "a", "a", "b"]))
+
+    # "b" llega último pero no espera a que "a" vacíe su cola
+    assert order.index("b4") < order.index("a3")
+    assert queue.running == 0 and queue.stats()["waiting"] == 0
+
+
+def test_fair_queue_honours_weights() -> None:
+    queue = FairQueue(1, 1, 10, weights={"vip": 2.0})
+    order, _ = asyncio.run(_take_turns(queue, ["std", "std", "std", "vip", "vip"]))
+
+    # peso 2: cada turno de "vip" avanza medio tiempo virtual
+    assert order == ["std0", "vip3", "std1", "vip4", "std2"]
+    unweighted, _ = asyncio.run(
+        _take_turns(FairQueue(1, 1, 10), ["std", "std", "std", "vip", "vip"])
+    )
+    assert unweighted == ["std0", "std1", "vip3", "std2", "vip4"]
+
+
+def test_fair_queue_reports_positions() -> None:
+    queue = FairQueue(1, 1, 10)
+    _, positions = asyncio.run(_take_turns(queue, ["a", "b", "c"]))
+
+    assert ("b1", 1) in positions and ("c2", 2) in positions and ("c2", 1) in positions
+
+
+def test_fair_queue_rejects_when_the_tenant_queue_is_full() -> None:
+    async def scenario() -> None:
+        queue = FairQueue(max_inflight=1, tenant_max_inflight=1, tenant_max_queued=1)
+        await queue.acquire("a", None)
+        waiting = asyncio.create_task(queue.acquire("a", None))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as e:
+            await queue.acquire("a", None)
+        assert e.value.reason == "queue_full"
+        # cancelar un turno encolado libera su lugar
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        assert queue.stats()["waiting"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_admission_slot_rate_limits_and_releases(clock: _Clock) -> None:
+    async def scenario() -> None:
+        adm = Admission(LocalTokenBucket(rate=0.4, burst=1), FairQueue(1, 1, 1))
+        async with adm.slot("alice"):
+            assert adm.queue.running == 1
+        assert adm.queue.running == 0
+
+        with pytest.raises(AdmissionRejected) as e:
+            async with adm.slot("alice"):
+                pass
+        # 2.5s de espera: el mensaje redondea hacia arriba
+        assert e.value.reason == "rate_limited"
+        assert e.value.retry_after == pytest.approx(2.5)
+        assert "3s" in str(e.value)
+        assert adm.stats()["rejected"]["rate_limited"] == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,145 @@
+import copy
+import json
+from typing import Any, Dict, List
+
+import pytest
+
+from api.domain.patch import PatchOp, diff, escape_pointer
+from api.domain.session_sync import VersionedSession
+from api.models.chat import ChatMessage
+from api.models.user import Role
+from api.routers.quotes import _sample_session
+
+
+def _apply(doc: Any, ops: List[PatchOp]) -> Any:
+    # referencia en Python de applyPatch (client/src/services/patch.ts)
+    doc = copy.deepcopy(doc)
+    for op in ops:
+        if op["path"] == "":
+            doc = op["value"]
+            continue
+        tokens = [
+            t.replace("~1", "/").replace("~0", "~") for t in op["path"][1:].split("/")
+        ]
+        parent = doc
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+        last = tokens[-1]
+        if isinstance(parent, list):
+            index = len(parent) if last == "-" else int(last)
+            if op["op"] == "add":
+                parent.insert(index, op["value"])
+            elif op["op"] == "remove":
+                del parent[index]
+            else:
+                parent[index] = op["value"]
+        elif op["op"] == "remove":
+            del parent[last]
+        else:
+            parent[last] = op["value"]
+    return doc
+
+
+SESSION: Dict[str, Any] = {
+    "id": "s1",
+    "title": "New Session",
+    "chatMessages": [{"id": "m1", "role": "user", "content": "hi"}],
+    "scenarios": [
+        {"id": "cost", "label": "Cost", "quote": {"items": [{"qty": 1}]}},
+        {"id": "balanced", "label": "Balanced", "quote": None},
+    ],
+}
+
+
+def test_equal_documents_produce_no_ops() -> None:
+    assert diff(SESSION, copy.deepcopy(SESSION)) == []
+
+
+def test_appended_messages_are_adds_at_the_end() -> None:
+    new = copy.deepcopy(SESSION)
+    reply = {"id": "m2", "role": "assistant", "content": "hello"}
+    new["chatMessages"].append(reply)
+    assert diff(SESSION, new) == [
+        {"op": "add", "path": "/chatMessages/-", "value": reply}
+    ]
+
+
+def test_nested_change_is_a_single_replace() -> None:
+    new = copy.deepcopy(SESSION)
+    new["scenarios"][0]["quote"]["items"][0]["qty"] = 3
+    assert diff(SESSION, new) == [
+        {"op": "replace", "path": "/scenarios/0/quote/items/0/qty", "value": 3}
+    ]
+
+
+def test_removed_keys_and_shrunk_lists() -> None:
+    new = copy.deepcopy(SESSION)
+    del new["title"]
+    new["scenarios"] = new["scenarios"][:1]
+    ops = diff(SESSION, new)
+    assert {"op": "remove", "path": "/title"} in ops
+    # una lista que se achica se reemplaza entera
+    assert {"op": "replace", "path": "/scenarios", "value": new["scenarios"]} in ops
+
+
+def test_keys_are_escaped_as_json_pointer_tokens() -> None:
+    assert escape_pointer("a/b~c") == "a~1b~0c"
+    assert diff({"a/b": 1}, {"a/b": 2}) == [
+        {"op": "replace", "path": "/a~1b", "value": 2}
+    ]
+
+
+def test_root_type_change_replaces_the_document() -> None:
+    assert diff([1], {"a": 1}) == [{"op": "replace", "path": "", "value": {"a": 1}}]
+
+
+@pytest.mark.parametrize(
+    "mutate",
+    [
+        lambda s: s["chatMessages"].append({"id": "m2", "content": "x"}),
+        lambda s: s["scenarios"][1].update(quote={"items": []}),
+        lambda s: s["scenarios"].reverse(),
+        lambda s: s.update(title="Acme / DUO ~ renewal", extra={"k": [1, 2]}),
+        lambda s: s.pop("chatMessages"),
+        lambda s: s["scenarios"].insert(0, {"id": "feature"}),
+    ],
+)
+def test_diff_then_apply_round_trips(mutate: Any) -> None:
+    new = copy.deepcopy(SESSION)
+    mutate(new)
+    assert _apply(SESSION, diff(SESSION, new)) == new
+
+
+def test_commit_turn_ops_take_the_client_to_the_new_version() -> None:
+    session = _sample_session()
+    entry = VersionedSession.adopt(session)
+    before = entry.snapshot()["data"]
+
+    reply = ChatMessage(
+        id="m3", sessionId=session.id, role=Role.ASSISTANT, content="Updated"
+    )
+    session.chatMessages.append(reply)
+    session.scenarios[0].quote.items[0].quantity = 5
+    session.scenarios = session.scenarios[:2]
+    session.title = "Acme renewal"
+    ops = entry.commit_turn(
+        [reply],
+        new_title=session.title,
+        new_scenarios_doc=[s.model_dump(mode="json") for s in session.scenarios],
+    )
+
+    assert entry.version == 1
+    assert _apply(before, ops) == entry.snapshot()["data"]
+    assert json.loads(entry.snapshot_json()) == entry.snapshot()
+
+
+def test_commit_turn_takes_the_version_from_the_store() -> None:
+    session = _sample_session()
+    entry = VersionedSession.adopt(session, version=7)
+    entry.persisted_version = 7
+
+    entry.commit_turn([], version=42)
+
+    # la versión de la secuencia no tiene por qué ser consecutiva
+    assert entry.version == 42
+    assert entry.persisted_version == 7
@@ -28,6 +28,7 @@ const chatHistoryData = [
 export default function AIAssistantContainer() {
   const {
     quoteSession,
+    turnProgress,
     sendQuoteUpdate,
     loadExistingQuoteSession,
     loadInitialQuoteSession,
@@ -90,6 +91,7 @@ export default function AIAssistantContainer() {
               onSendText={handleSendText}
               mode={mode}
               thinking={quoteSession?.thinking}
+              progress={turnProgress}
             />
           ) : (
             <ChatHistory
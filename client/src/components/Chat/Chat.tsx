@@ -6,6 +6,7 @@ import type { DisplayMode } from "../../store/DisplayModeContext";
 import QuoteDraft from "./QuoteDraft";
 import type { Scenario, Quote } from "../../types/Quotes";
 import NewEmptyChat from "./NewEmptyChat";
+import type { TurnProgressPayload } from "../../services/socket";
 
 interface ChatProps {
   setMode?: (mode: DisplayMode) => void;
@@ -20,6 +21,15 @@ interface ChatProps {
   onSendText?: (text: string) => void;
   mode?: DisplayMode;
   thinking?: boolean;
+  progress?: TurnProgressPayload | null;
+}
+
+function thinkingLabel(progress?: TurnProgressPayload | null): string {
+  if (!progress) return "Thinking";
+  if (progress.stage === "queued") {
+    return progress.position ? `Queued (#${progress.position})` : "Queued";
+  }
+  return `Thinking (${Math.floor(progress.elapsedMs / 1000)}s)`;
 }
 
 export default function Chat({
@@ -29,6 +39,7 @@ export default function Chat({
   scenarios,
   setMode,
   thinking,
+  progress,
 }: ChatProps) {
   const hasQuote = (s: Scenario): s is Scenario & { quote: Quote } =>
     s.quote !== null;
@@ -75,7 +86,7 @@ export default function Chat({
               avatar="CC"
               message={
                 <div className="flex items-center gap-2 text-gray-600">
-                  <span className="italic">Thinking</span>
+                  <span className="italic">{thinkingLabel(progress)}</span>
                   <span className="flex items-center gap-1">
                     <span className="w-2 h-2 rounded-full bg-sky-400 animate-bounce [animation-delay:-0.3s]"></span>
                     <span className="w-2 h-2 rounded-full bg-sky-400 animate-bounce [animation-delay:-0.15s]"></span>
@@ -4,7 +4,8 @@ import Chat from "../Chat/Chat";
 import { useDisplayMode } from "../../store/DisplayModeContext";
 
 export default function MainPanelContainer() {
-  const { quoteSession, loading, error, sendQuoteUpdate } = useQuote();
+  const { quoteSession, turnProgress, loading, error, sendQuoteUpdate } =
+    useQuote();
   const { mode, setMode } = useDisplayMode();
 
   const handleSendText = (text: string) => {
@@ -46,6 +47,7 @@ export default function MainPanelContainer() {
           chatMessages={quoteSession?.chatMessages || []}
           scenarios={quoteSession?.scenarios || []}
           thinking={quoteSession?.thinking || false}
+          progress={turnProgress}
           mode={mode}
           setMode={setMode}
           onSendText={handleSendText}
@@ -0,0 +1,56 @@
+export type PatchOp = {
+  op: "add" | "remove" | "replace";
+  path: string;
+  value?: unknown;
+};
+
+type Container = Record<string, unknown> | unknown[];
+
+function unescapeToken(token: string): string {
+  return token.replace(/~1/g, "/").replace(/~0/g, "~");
+}
+
+function cloneContainer(node: unknown, path: string): Container {
+  if (Array.isArray(node)) return [...node];
+  if (node !== null && typeof node === "object") {
+    return { ...(node as Record<string, unknown>) };
+  }
+  throw new Error(`Patch path not found: ${path}`);
+}
+
+function applyOp(doc: unknown, { op, path, value }: PatchOp): unknown {
+  if (path === "") {
+    if (op === "remove") throw new Error("Cannot remove document root");
+    return value;
+  }
+  const tokens = path.slice(1).split("/").map(unescapeToken);
+  const root = cloneContainer(doc, path);
+  // copia sólo los nodos del camino: el resto se comparte con el doc anterior
+  let parent: Container = root;
+  for (const token of tokens.slice(0, -1)) {
+    const key = Array.isArray(parent) ? Number(token) : token;
+    const child = cloneContainer(
+      (parent as Record<string | number, unknown>)[key],
+      path,
+    );
+    (parent as Record<string | number, unknown>)[key] = child;
+    parent = child;
+  }
+
+  const last = tokens[tokens.length - 1];
+  if (Array.isArray(parent)) {
+    const index = last === "-" ? parent.length : Number(last);
+    if (op === "add") parent.splice(index, 0, value);
+    else if (op === "remove") parent.splice(index, 1);
+    else parent[index] = value;
+  } else if (op === "remove") {
+    delete parent[last];
+  } else {
+    parent[last] = value;
+  }
+  return root;
+}
+
+export function applyPatch<T>(doc: T, ops: PatchOp[]): T {
+  return ops.reduce<unknown>(applyOp, doc) as T;
+}
@@ -1,16 +1,79 @@
-import type { QuoteSession } from "../types/Quotes";
+import type { ChatMessage, QuoteSession } from "../types/Quotes";
+import type { PatchOp } from "./patch";
 
 type Handler<T> = (data: T) => void;
 
 const WS_BASE_URL = import.meta.env.VITE_WS_URL as string;
 
+export type UserMessagePayload = {
+  sessionId: string;
+  baseVersion: number | null;
+  message: ChatMessage;
+  session?: QuoteSession;
+};
+
+export type QuotePatchPayload = {
+  sessionId: string;
+  fromVersion: number;
+  version: number;
+  ops: PatchOp[];
+};
+
+export type QuoteSnapshotPayload = {
+  sessionId: string;
+  version: number;
+  data: QuoteSession;
+};
+
+export type ResyncRequiredPayload = {
+  sessionId: string;
+  version: number | null;
+  messageId: string | null;
+};
+
+export type TurnProgressPayload = {
+  sessionId: string;
+  messageId: string | null;
+  stage: string;
+  elapsedMs: number;
+  // posición en la cola del usuario cuando stage === "queued"
+  position?: number;
+};
+
+export type TurnCancelledPayload = {
+  sessionId: string;
+  messageId: string | null;
+  reason: string;
+};
+
 export type QuoteSocketEvents = {
   QUOTE_UPDATED: QuoteSession;
   QUOTE_UPDATED_CLIENT: QuoteSession;
+  USER_MESSAGE: UserMessagePayload;
+  SESSION_RESYNC: { sessionId: string };
+  QUOTE_PATCH: QuotePatchPayload;
+  QUOTE_SNAPSHOT: QuoteSnapshotPayload;
+  RESYNC_REQUIRED: ResyncRequiredPayload;
+  TURN_PROGRESS: TurnProgressPayload;
+  TURN_CANCELLED: TurnCancelledPayload;
+  AUTH_EXPIRED: { exp: number };
   ERROR?: string;
   UNKNOWN_EVENT?: string;
 };
 
+// el servidor cierra con 4401 si el token es inválido o vence (tras AUTH_EXPIRED)
+const AUTH_CLOSE_CODE = 4401;
+
+// frames grandes llegan binarios (JSON + zlib) si el navegador puede abrirlos
+const SUPPORTS_DEFLATE = typeof DecompressionStream !== "undefined";
+
+async function inflate(data: ArrayBuffer): Promise<string> {
+  const stream = new Blob([data])
+    .stream()
+    .pipeThrough(new DecompressionStream("deflate"));
+  return new Response(stream).text();
+}
+
 type PendingEvent<Events> = {
   [K in keyof Events]: { event: K; data: Events[K] };
 }[keyof Events];
@@ -20,6 +83,10 @@ export class QuoteSocket<Events extends Record<string, unknown>> {
   private handlers: { [K in keyof Events]?: Set<Handler<Events[K]>> } = {};
   private pendingQueue: PendingEvent<Events>[] = [];
   private urlBase: string;
+  // los frames se procesan en orden aunque alguno tenga que descomprimirse
+  private inbox: Promise<void> = Promise.resolve();
+  // token inválido o vencido (close 4401): el dueño del token decide qué hacer
+  private onUnauthorized: (() => void) | null = null;
 
   constructor(urlBase: string) {
     this.urlBase = urlBase;
@@ -34,11 +101,15 @@ export class QuoteSocket<Events extends Record<string, unknown>> {
     ) {
       return;
     }
+    const params = `token=${encodeURIComponent(token)}${
+      SUPPORTS_DEFLATE ? "&compress=deflate" : ""
+    }`;
     const urlWithToken = this.urlBase.includes("?")
-      ? `${this.urlBase}&token=${encodeURIComponent(token)}`
-      : `${this.urlBase}?token=${encodeURIComponent(token)}`;
+      ? `${this.urlBase}&${params}`
+      : `${this.urlBase}?${params}`;
 
     this.ws = new WebSocket(urlWithToken);
+    this.ws.binaryType = "arraybuffer";
 
     this.ws.onopen = () => {
       console.log("[WS] ✅ Connected:", urlWithToken);
@@ -49,20 +120,15 @@ export class QuoteSocket<Events extends Record<string, unknown>> {
 
     this.ws.onmessage = (event) => {
       console.log("[WS] 📩 Message received");
-      try {
-        const parsed = JSON.parse(event.data) as {
-          event?: keyof Events;
-          data: unknown;
-        };
-        const evt = parsed.event;
-        if (evt && this.handlers[evt]) {
-          this.handlers[evt]!.forEach((cb) =>
-            cb(parsed.data as Events[typeof evt]),
-          );
-        }
-      } catch (error) {
-        console.error("[WS] ❌ Failed to parse message:", error);
-      }
+      const raw = event.data as string | ArrayBuffer;
+      this.inbox = this.inbox
+        .then(async () => {
+          const text = typeof raw === "string" ? raw : await inflate(raw);
+          this.dispatch(text);
+        })
+        .catch((error) => {
+          console.error("[WS] ❌ Failed to decompress message:", error);
+        });
     };
 
     this.ws.onclose = (e) => {
@@ -70,6 +136,11 @@ export class QuoteSocket<Events extends Record<string, unknown>> {
         `[WS] 🔌 Connection closed. Code=${e.code}, Reason=${e.reason || "N/A"}`,
       );
       this.ws = null;
+      if (e.code === AUTH_CLOSE_CODE) {
+        // no tiene sentido reconectar con el mismo token
+        this.pendingQueue = [];
+        this.onUnauthorized?.();
+      }
     };
 
     this.ws.onerror = (e) => {
@@ -77,6 +148,10 @@ export class QuoteSocket<Events extends Record<string, unknown>> {
     };
   }
 
+  setUnauthorizedHandler(handler: (() => void) | null) {
+    this.onUnauthorized = handler;
+  }
+
   disconnect() {
     if (this.ws) {
       try {
@@ -106,6 +181,23 @@ export class QuoteSocket<Events extends Record<string, unknown>> {
     this.pendingQueue.push({ event, data } as PendingEvent<Events>);
   }
 
+  private dispatch(text: string) {
+    try {
+      const parsed = JSON.parse(text) as {
+        event?: keyof Events;
+        data: unknown;
+      };
+      const evt = parsed.event;
+      if (evt && this.handlers[evt]) {
+        this.handlers[evt]!.forEach((cb) =>
+          cb(parsed.data as Events[typeof evt]),
+        );
+      }
+    } catch (error) {
+      console.error("[WS] ❌ Failed to parse message:", error);
+    }
+  }
+
   private _send<K extends keyof Events>(event: K, data: Events[K]) {
     if (!this.ws || this.ws.readyState !== WebSocket.OPEN) {
       this.pendingQueue.push({ event, data } as PendingEvent<Events>);
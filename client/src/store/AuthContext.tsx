@@ -1,7 +1,8 @@
 import { useCallback, useEffect, useMemo, useRef, useState } from "react";
 import type { AuthState, JwtPayload } from "../types/Auth";
-import { decodeJwt } from "../services/auth"; // AuthService
+import { AuthService, decodeJwt } from "../services/auth";
 import { setAuthToken, setUnauthorizedHandler } from "../services/api";
+import { socket } from "../services/socket";
 import { AuthContext } from "./AuthContextObject";
 
 const USE_FAKE_AUTH = import.meta.env.VITE_AUTH_FAKE === "1";
@@ -40,7 +41,7 @@ export function AuthProvider({ children }: { children: React.ReactNode }) {
     payload: null,
   });
   const logoutTimer = useRef<number | null>(null);
-  // const service = useMemo(() => new AuthService(), []);
+  const service = useMemo(() => new AuthService(), []);
 
   const applyToken = useCallback(
     (token: string | null, tokenType: string | null) => {
@@ -83,7 +84,11 @@ export function AuthProvider({ children }: { children: React.ReactNode }) {
   );
 
   useEffect(() => {
+    // 401 del API o close 4401 del WS: de vuelta al login; con el token nuevo
+    // el QuoteProvider reconecta el socket
     setUnauthorizedHandler(doLogout);
+    socket.setUnauthorizedHandler(doLogout);
+    return () => socket.setUnauthorizedHandler(null);
   }, [doLogout]);
 
   useEffect(() => {
@@ -109,25 +114,32 @@ export function AuthProvider({ children }: { children: React.ReactNode }) {
 
   const login = useCallback(
     async (username: string, password: string) => {
-      if (username !== "demo" || password !== "12demo34") {
-        throw new Error("Invalid credentials");
+      if (USE_FAKE_AUTH) {
+        // sólo para desarrollo sin API: el servidor rechaza este token
+        if (username !== "demo" || password !== "12demo34") {
+          throw new Error("Invalid credentials");
+        }
+        const fakePayload = makeFakePayload({ sub: username });
+        const fakeToken = makeFakeJwt(fakePayload);
+        setState({
+          token: fakeToken,
+          tokenType: "bearer",
+          payload: fakePayload,
+        });
+        applyToken(fakeToken, "bearer");
+        scheduleAutoLogout(fakePayload);
+        return;
       }
 
-      const fakePayload = makeFakePayload({
-        sub: `${username} ${password}`,
-      });
-      const fakeToken = makeFakeJwt(fakePayload);
-      setState({ token: fakeToken, tokenType: "bearer", payload: fakePayload });
-      applyToken(fakeToken, "bearer");
-      scheduleAutoLogout(fakePayload);
-      return;
-
-      // const { token, tokenType, payload } = await service.login(username, password);
-      // setState({ token, tokenType, payload });
-      // applyToken(token, tokenType);
-      // scheduleAutoLogout(payload);
+      const { token, tokenType, payload } = await service.login(
+        username,
+        password,
+      );
+      setState({ token, tokenType, payload });
+      applyToken(token, tokenType);
+      scheduleAutoLogout(payload);
     },
-    [applyToken, scheduleAutoLogout], // service
+    [applyToken, scheduleAutoLogout, service],
   );
 
   const value = useMemo(
@@ -1,8 +1,10 @@
 import { createContext } from "react";
 import type { QuoteSession } from "../types/Quotes";
+import type { TurnProgressPayload } from "../services/socket";
 
 export type QuoteContextValue = {
   quoteSession: QuoteSession | null;
+  turnProgress: TurnProgressPayload | null;
   loading: boolean;
   error: string | null;
   loadExistingQuoteSession: (sessionId: string) => Promise<void>;
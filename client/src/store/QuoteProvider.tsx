@@ -2,11 +2,20 @@ import {
   useCallback,
   useEffect,
   useMemo,
+  useRef,
   useState,
   type ReactNode,
 } from "react";
-import type { QuoteSession } from "../types/Quotes";
-import { socket } from "../services/socket";
+import type { ChatMessage, QuoteSession } from "../types/Quotes";
+import {
+  socket,
+  type QuotePatchPayload,
+  type QuoteSnapshotPayload,
+  type ResyncRequiredPayload,
+  type TurnCancelledPayload,
+  type TurnProgressPayload,
+} from "../services/socket";
+import { applyPatch } from "../services/patch";
 import { QuoteContext, type QuoteContextValue } from "./QuoteContext";
 import { getQuote } from "../services/api";
 import { v4 as uuidv4 } from "uuid";
@@ -21,11 +30,21 @@ function getErrorMessage(err: unknown): string {
   }
 }
 
+type SyncedSession = { session: QuoteSession; version: number };
+type PendingMessage = { message: ChatMessage; base: QuoteSession };
+
 export function QuoteProvider({ children }: { children: ReactNode }) {
   const [quoteSession, setQuoteSession] = useState<QuoteSession | null>(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
+  // Último TURN_PROGRESS del turno en curso (cola / heartbeat del agente)
+  const [turnProgress, setTurnProgress] = useState<TurnProgressPayload | null>(
+    null,
+  );
   const { state: authState, isAuthenticated } = useAuth();
+  // Última versión confirmada por el servidor (base de los QUOTE_PATCH)
+  const syncedRef = useRef<SyncedSession | null>(null);
+  const pendingRef = useRef<PendingMessage | null>(null);
 
   const applyQuoteUpdate = useCallback<QuoteContextValue["applyQuoteUpdate"]>(
     (payload) => {
@@ -56,7 +75,34 @@ export function QuoteProvider({ children }: { children: ReactNode }) {
   const sendQuoteUpdate = useCallback<QuoteContextValue["sendQuoteUpdate"]>(
     (payload) => {
       setQuoteSession({ ...payload, thinking: true, lastSentAt: Date.now() });
-      socket.emit("QUOTE_UPDATED_CLIENT", payload);
+      setTurnProgress(null);
+      const message = payload.chatMessages[payload.chatMessages.length - 1];
+      if (!message || message.role !== "user") {
+        socket.emit("QUOTE_UPDATED_CLIENT", payload);
+        return;
+      }
+      const synced = syncedRef.current;
+      if (synced && synced.session.id === payload.id) {
+        pendingRef.current = { message, base: synced.session };
+        socket.emit("USER_MESSAGE", {
+          sessionId: payload.id,
+          baseVersion: synced.version,
+          message,
+        });
+        return;
+      }
+      // primera vez: la sesión completa viaja una sola vez con el mensaje
+      const base = {
+        ...payload,
+        chatMessages: payload.chatMessages.slice(0, -1),
+      };
+      pendingRef.current = { message, base };
+      socket.emit("USER_MESSAGE", {
+        sessionId: payload.id,
+        baseVersion: null,
+        message,
+        session: base,
+      });
     },
     [],
   );
@@ -66,6 +112,7 @@ export function QuoteProvider({ children }: { children: ReactNode }) {
     setError(null);
     try {
       const quoteSession = await getQuote(sessionId);
+      syncedRef.current = null;
       setQuoteSession({ ...quoteSession, thinking: false });
     } catch (e: unknown) {
       setError(getErrorMessage(e) ?? "Failed to load initial quote");
@@ -88,6 +135,7 @@ export function QuoteProvider({ children }: { children: ReactNode }) {
         lastSentAt: null,
         lastReceivedAt: null,
       };
+      syncedRef.current = null;
       setQuoteSession(emptySession);
     } catch (e: unknown) {
       setError(getErrorMessage(e) ?? "Failed to load initial quote");
@@ -98,6 +146,7 @@ export function QuoteProvider({ children }: { children: ReactNode }) {
 
   const onSocketMessage = useCallback(
     (payload: QuoteSession) => {
+      setTurnProgress(null);
       applyQuoteUpdate({
         ...payload,
         thinking: false,
@@ -108,12 +157,95 @@ export function QuoteProvider({ children }: { children: ReactNode }) {
     [applyQuoteUpdate, quoteSession],
   );
 
+  const onQuotePatch = useCallback(
+    (payload: QuotePatchPayload) => {
+      const synced = syncedRef.current;
+      if (
+        !synced ||
+        synced.session.id !== payload.sessionId ||
+        synced.version !== payload.fromVersion
+      ) {
+        socket.emit("SESSION_RESYNC", { sessionId: payload.sessionId });
+        return;
+      }
+      const session = applyPatch(synced.session, payload.ops);
+      syncedRef.current = { session, version: payload.version };
+      pendingRef.current = null;
+      onSocketMessage(session);
+    },
+    [onSocketMessage],
+  );
+
+  const onQuoteSnapshot = useCallback(
+    (payload: QuoteSnapshotPayload) => {
+      syncedRef.current = { session: payload.data, version: payload.version };
+      pendingRef.current = null;
+      onSocketMessage(payload.data);
+    },
+    [onSocketMessage],
+  );
+
+  const onResyncRequired = useCallback((payload: ResyncRequiredPayload) => {
+    syncedRef.current = null;
+    const pending = pendingRef.current;
+    if (!pending || pending.message.id !== payload.messageId) return;
+    // el servidor no tiene nuestra versión: reenviar con la copia confirmada
+    socket.emit("USER_MESSAGE", {
+      sessionId: payload.sessionId,
+      baseVersion: null,
+      message: pending.message,
+      session: pending.base,
+    });
+  }, []);
+
+  const onTurnProgress = useCallback((payload: TurnProgressPayload) => {
+    const pending = pendingRef.current;
+    // progreso de un turno que ya fue reemplazado: no pisar el del actual
+    if (
+      pending &&
+      payload.messageId &&
+      pending.message.id !== payload.messageId
+    )
+      return;
+    setTurnProgress(payload);
+  }, []);
+
+  const onTurnCancelled = useCallback((payload: TurnCancelledPayload) => {
+    const pending = pendingRef.current;
+    // el turno reemplazado por un mensaje nuevo: seguimos esperando ese
+    if (pending && pending.message.id !== payload.messageId) return;
+    pendingRef.current = null;
+    setTurnProgress(null);
+    setQuoteSession((prev) =>
+      prev && prev.id === payload.sessionId
+        ? { ...prev, thinking: false }
+        : prev,
+    );
+  }, []);
+
   useEffect(() => {
     socket.on("QUOTE_UPDATED", onSocketMessage);
+    socket.on("QUOTE_PATCH", onQuotePatch);
+    socket.on("QUOTE_SNAPSHOT", onQuoteSnapshot);
+    socket.on("RESYNC_REQUIRED", onResyncRequired);
+    socket.on("TURN_PROGRESS", onTurnProgress);
+    socket.on("TURN_CANCELLED", onTurnCancelled);
     return () => {
       socket.off("QUOTE_UPDATED", onSocketMessage);
+      socket.off("QUOTE_PATCH", onQuotePatch);
+      socket.off("QUOTE_SNAPSHOT", onQuoteSnapshot);
+      socket.off("RESYNC_REQUIRED", onResyncRequired);
+      socket.off("TURN_PROGRESS", onTurnProgress);
+      socket.off("TURN_CANCELLED", onTurnCancelled);
     };
-  }, [onSocketMessage]);
+  }, [
+    onSocketMessage,
+    onQuotePatch,
+    onQuoteSnapshot,
+    onResyncRequired,
+    onTurnProgress,
+    onTurnCancelled,
+  ]);
 
   useEffect(() => {
     if (isAuthenticated && authState.token) {
@@ -130,6 +262,7 @@ export function QuoteProvider({ children }: { children: ReactNode }) {
   const value = useMemo<QuoteContextValue>(
     () => ({
       quoteSession,
+      turnProgress,
       loading,
       error,
       loadExistingQuoteSession,
@@ -141,6 +274,7 @@ export function QuoteProvider({ children }: { children: ReactNode }) {
     }),
     [
       quoteSession,
+      turnProgress,
       loading,
       error,
       loadExistingQuoteSession,